@@ -1,26 +1,51 @@
 from __future__ import annotations
 
+import asyncio
+import json
+import threading
 import time
 import logging
+from dataclasses import asdict
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, AsyncIterator, Dict
 
-from fastapi import FastAPI, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Path as PathParam, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
 from app.core.config import settings
 from app.models.schemas import (
+    IngestionJobStatus,
     IngestionStatus,
+    ReindexRequest,
+    ReindexStatus,
+    SeleniumBatchRequest,
     SeleniumScriptRequest,
     SeleniumScriptResponse,
     TestCaseRequest,
     TestCaseResponse,
 )
 from app.services.agents import AgentOrchestrator
-from app.services.ingestion import KnowledgeBaseBuilder
+from app.services.embeddings import embedding_service_loaded
+from app.services.ingestion import (
+    BuildSummary,
+    InvalidUploadError,
+    KnowledgeBaseBuilder,
+    StoredUpload,
+    UploadTooLargeError,
+)
+from app.services.jobs import IngestionJob, IngestionJobManager
+from app.services.projects import InvalidProjectError, list_projects, project_exists, resolve_project
 from app.services.retriever import KnowledgeRetriever
-from app.services.state import app_state
+from app.services.state import project_states
+from app.services.vector_store import vector_store_manager
+from app.utils.metrics import (
+    CONTENT_TYPE_LATEST,
+    HTTP_REQUEST_SECONDS,
+    render_latest,
+    request_timings,
+    server_timing_header,
+)
 
 
 logger = logging.getLogger(__name__)
@@ -38,66 +63,358 @@ app.add_middleware(
 )
 
 
+# Allowance for multipart boundaries and part headers on top of the file bytes themselves.
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next: Any) -> Response:
+    # Starlette receives and spools the whole multipart body before the endpoint runs,
+    # so a declared size over the request cap is refused before any of it is read.
+    if request.method == "POST" and request.url.path.rstrip("/").endswith("/ingest"):
+        try:
+            declared = int(request.headers.get("content-length", "0"))
+        except ValueError:
+            declared = 0
+        if declared > settings.max_upload_request_bytes + MULTIPART_OVERHEAD_BYTES:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"Upload exceeds the request limit of {settings.max_upload_request_bytes} bytes."},
+            )
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next: Any) -> Response:
+    started = time.perf_counter()
+    with request_timings() as timings:
+        response = await call_next(request)
+    # Streaming responses are measured up to their first byte; their body is still being produced.
+    elapsed = time.perf_counter() - started
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    HTTP_REQUEST_SECONDS.labels(request.method, route, str(response.status_code)).observe(elapsed)
+    if settings.server_timing_header:
+        response.headers["Server-Timing"] = server_timing_header(timings, elapsed)
+    return response
+
+
 kb_builder = KnowledgeBaseBuilder()
 retriever = KnowledgeRetriever()
 agent_orchestrator = AgentOrchestrator(retriever=retriever)
 
 
+def run_ingestion_job(job: IngestionJob) -> BuildSummary:
+    summary = kb_builder.build_knowledge_base(
+        job.files, incremental=job.incremental, progress=job.update, project_id=job.project_id
+    )
+    retriever.refresh(job.project_id)
+    return summary
+
+
+ingestion_jobs = IngestionJobManager(run_ingestion_job)
+
+
+def job_status(job: IngestionJob) -> IngestionJobStatus:
+    result = None
+    if job.summary is not None:
+        summary = job.summary
+        message = "Knowledge base built successfully"
+        if summary.failed_documents:
+            message = f"Knowledge base built; {len(summary.failed_documents)} document(s) could not be parsed"
+        result = IngestionStatus(
+            success=True,
+            message=message,
+            documents_processed=len(job.files),
+            duration_seconds=(job.finished_at or time.time()) - job.created_at,
+            chunks_total=summary.chunks_total,
+            chunks_added=summary.chunks_added,
+            chunks_deleted=summary.chunks_deleted,
+            failed_documents=summary.failed_documents,
+            index_version=summary.index_version,
+        )
+    elif job.error is not None:
+        result = IngestionStatus(success=False, message=job.error, documents_processed=0)
+    return IngestionJobStatus(
+        job_id=job.id,
+        status=job.status,
+        stage=job.stage,
+        project_id=job.project_id,
+        collection=job.collection,
+        documents_total=job.documents_total,
+        documents_parsed=job.documents_parsed,
+        chunks_total=job.chunks_total,
+        chunks_to_embed=job.chunks_to_embed,
+        chunks_embedded=job.chunks_embedded,
+        timings=dict(job.timings),
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        error=job.error,
+        result=result,
+    )
+
+
+warmup_state: Dict[str, Any] = {"status": "disabled" if not settings.warmup_on_startup else "pending"}
+
+
+def warm_up() -> None:
+    warmup_state["status"] = "running"
+    started = time.perf_counter()
+    try:
+        kb_builder.embedding_service
+        retriever.refresh()
+        vector_store_manager.open(lexical=True)
+        agent_orchestrator.llm_service
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("Warm-up failed")
+        warmup_state.update(status="failed", error=str(exc))
+        return
+    warmup_state.update(status="done", duration_seconds=round(time.perf_counter() - started, 3))
+    logger.info("Warm-up finished in %.2fs", warmup_state["duration_seconds"])
+
+
+def loaded_components() -> Dict[str, bool]:
+    return {
+        "embedding_model": embedding_service_loaded() or vector_store_manager.embedding_loaded,
+        "vector_store": vector_store_manager.is_loaded(),
+        "llm_client": agent_orchestrator.llm_loaded,
+        "parser_pool": kb_builder.loader._pool is not None,
+    }
+
+
+@app.on_event("startup")
+async def start_warm_up() -> None:
+    if settings.warmup_on_startup:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
+@app.on_event("shutdown")
+async def close_llm_client() -> None:
+    if agent_orchestrator.llm_loaded:
+        await agent_orchestrator.llm_service.aclose()
+
+
 @app.get("/health", tags=["system"])
 def health_check() -> Dict[str, str]:
     return {"status": "ok"}
 
 
-@app.post("/ingest", response_model=IngestionStatus, tags=["knowledge-base"])
-async def ingest_documents(files: list[UploadFile]) -> IngestionStatus:
-    if not files:
-        raise HTTPException(status_code=400, detail="No files provided for ingestion")
+@app.get("/ready", tags=["system"])
+def readiness() -> JSONResponse:
+    components = loaded_components()
+    ready = components["embedding_model"] and components["llm_client"]
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "components": components,
+            "loaded_projects": vector_store_manager.loaded_projects(),
+            "index_leases": vector_store_manager.active_leases(),
+            "warmup": warmup_state,
+        },
+    )
 
-    start = time.perf_counter()
-    documents_processed = 0
-    stored_files: Dict[str, Path] = {}
 
+@app.get("/metrics", tags=["system"])
+def metrics() -> Response:
+    return Response(content=render_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/cache/stats", tags=["system"])
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    stats = retriever.cache_stats()
+    if agent_orchestrator.llm_loaded and agent_orchestrator.llm_service.response_cache is not None:
+        stats["llm_responses"] = agent_orchestrator.llm_service.response_cache.stats()
+    return stats
+
+
+@app.get("/projects", tags=["knowledge-base"])
+def get_projects() -> Dict[str, Any]:
+    return {"projects": list_projects(), "loaded": vector_store_manager.loaded_projects()}
+
+
+def current_project(request: Request) -> str:
+    """Project from the ``/projects/{project_id}`` prefix; unprefixed routes serve the default project."""
+    try:
+        return resolve_project(request.path_params.get("project_id"))
+    except InvalidProjectError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+def project_path_param(project_id: str = PathParam(description="Project (tenant) ID")) -> None:
+    # Only declares the prefix parameter for the OpenAPI schema; current_project does the work.
+    return None
+
+
+def require_knowledge_base(project_id: str) -> None:
+    if not project_exists(project_id):
+        raise HTTPException(status_code=404, detail=f"Unknown project {project_id}; ingest documents into it first.")
+    if not retriever.is_ready_for(project_id):
+        raise HTTPException(status_code=400, detail="Knowledge base is not ready. Please ingest documents first.")
+
+
+# Knowledge-base and agent routes, mounted both at the root (default project) and under /projects/{project_id}.
+project_router = APIRouter()
+
+
+async def save_uploads(files: list[UploadFile], project_id: str) -> list[StoredUpload]:
+    """Save every file under the size caps; if any is rejected, none of them is kept or replaced."""
+    staged: list[StoredUpload] = []
+    bytes_received = 0
     try:
         for upload in files:
-            contents = await upload.read()
-            saved_path = kb_builder.save_upload(upload.filename, contents)
-            stored_files[upload.filename] = saved_path
-            documents_processed += 1
-            app_state.update_file(upload.filename, saved_path)
+            remaining = settings.max_upload_request_bytes - bytes_received
+            stored = await kb_builder.save_upload_stream(
+                upload.filename,
+                upload.read,
+                max_bytes=min(settings.max_upload_file_bytes, remaining),
+                project_id=project_id,
+                publish=False,
+            )
+            staged.append(stored)
+            await upload.close()
+            bytes_received += stored.size_bytes
+        for stored in staged:
+            await kb_builder.publish_upload(stored)
+    except BaseException:
+        for stored in staged:
+            await kb_builder.discard_upload(stored)
+        raise
+    return staged
 
-        kb_builder.build_knowledge_base(stored_files)
-        retriever.refresh()
 
-        duration = time.perf_counter() - start
-        return IngestionStatus(
-            success=True,
-            message="Knowledge base built successfully",
-            documents_processed=documents_processed,
-            duration_seconds=duration,
-        )
+@project_router.post("/ingest", response_model=IngestionJobStatus, status_code=202, tags=["knowledge-base"])
+async def ingest_documents(
+    files: list[UploadFile],
+    full_rebuild: bool = False,
+    wait: bool = False,
+    project_id: str = Depends(current_project),
+) -> IngestionJobStatus:
+    if not files:
+        raise HTTPException(status_code=400, detail="No files provided for ingestion")
+
+    try:
+        saved = await save_uploads(files, project_id)
+    except UploadTooLargeError as exc:
+        raise HTTPException(status_code=413, detail=str(exc)) from exc
+    except InvalidUploadError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
     except Exception as exc:  # noqa: BLE001
-        logger.exception("Ingestion failed")
+        logger.exception("Saving uploads failed")
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
+    stored_files: Dict[str, Path] = {}
+    for stored in saved:
+        stored_files[stored.filename] = stored.path
+        project_states.get(project_id).update_file(stored.filename, stored.path, stored.content_hash)
+
+    job = ingestion_jobs.submit(stored_files, incremental=False if full_rebuild else None, project_id=project_id)
+    if wait and job.future is not None:
+        await asyncio.wrap_future(job.future)
+    return job_status(job)
 
-@app.post("/generate-test-cases", response_model=TestCaseResponse, tags=["agents"])
-async def generate_test_cases(request: TestCaseRequest) -> TestCaseResponse:
-    if not retriever.is_ready:
-        raise HTTPException(status_code=400, detail="Knowledge base is not ready. Please ingest documents first.")
 
-    result = await agent_orchestrator.generate_test_cases(request)
+@project_router.post("/kb/reindex", response_model=ReindexStatus, tags=["knowledge-base"])
+async def reindex_knowledge_base(
+    request: ReindexRequest, project_id: str = Depends(current_project)
+) -> ReindexStatus:
+    """Rebuild the Chroma index with new HNSW parameters from stored embeddings (no re-embedding)."""
+    require_knowledge_base(project_id)
+    params = request.model_dump(exclude_none=True)
+    try:
+        summary = await asyncio.wrap_future(
+            ingestion_jobs.submit_exclusive(project_id, lambda: kb_builder.reindex(params, project_id))
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return ReindexStatus(**asdict(summary))
+
+
+@app.get("/jobs/{job_id}", response_model=IngestionJobStatus, tags=["knowledge-base"])
+def get_job(job_id: str) -> IngestionJobStatus:
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job_status(job)
+
+
+@project_router.post("/generate-test-cases", response_model=TestCaseResponse, tags=["agents"])
+async def generate_test_cases(request: TestCaseRequest, project_id: str = Depends(current_project)) -> TestCaseResponse:
+    require_knowledge_base(project_id)
+
+    result = await agent_orchestrator.generate_test_cases(request, project_id)
     return result
 
 
-@app.post("/generate-selenium-script", response_model=SeleniumScriptResponse, tags=["agents"])
-async def generate_selenium_script(request: SeleniumScriptRequest) -> SeleniumScriptResponse:
-    if not retriever.is_ready:
-        raise HTTPException(status_code=400, detail="Knowledge base is not ready. Please ingest documents first.")
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@project_router.post("/generate-test-cases/stream", tags=["agents"])
+async def stream_test_cases(request: TestCaseRequest, project_id: str = Depends(current_project)) -> StreamingResponse:
+    require_knowledge_base(project_id)
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event, data in agent_orchestrator.stream_test_cases(request, project_id):
+                yield format_sse(event, data)
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("Streaming test case generation failed")
+            yield format_sse("error", {"detail": str(exc)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    result = await agent_orchestrator.generate_selenium_script(request)
+
+@project_router.post("/generate-selenium-script", response_model=SeleniumScriptResponse, tags=["agents"])
+async def generate_selenium_script(
+    request: SeleniumScriptRequest, project_id: str = Depends(current_project)
+) -> SeleniumScriptResponse:
+    require_knowledge_base(project_id)
+
+    result = await agent_orchestrator.generate_selenium_script(request, project_id)
     return result
 
 
+@project_router.post("/generate-selenium-scripts", tags=["agents"])
+async def generate_selenium_scripts(
+    request: SeleniumBatchRequest, project_id: str = Depends(current_project)
+) -> StreamingResponse:
+    require_knowledge_base(project_id)
+    if len(request.test_cases) > settings.selenium_batch_max_cases:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.selenium_batch_max_cases} test cases can be scripted per request",
+        )
+
+    async def events() -> AsyncIterator[str]:
+        succeeded = failed = 0
+        try:
+            async for result in agent_orchestrator.generate_selenium_scripts(request, project_id):
+                if result.error is None:
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield format_sse("script", result.model_dump())
+            yield format_sse("done", {"succeeded": succeeded, "failed": failed})
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("Bulk Selenium script generation failed")
+            yield format_sse("error", {"detail": str(exc)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+app.include_router(project_router)
+app.include_router(project_router, prefix="/projects/{project_id}", dependencies=[Depends(project_path_param)])
+
+
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Any, exc: Exception) -> JSONResponse:  # noqa: ANN401
     return JSONResponse(status_code=500, content={"detail": str(exc)})
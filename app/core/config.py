@@ -3,7 +3,7 @@ from __future__ import annotations
 import os
 from functools import lru_cache
 from pathlib import Path
-from typing import Literal, Optional
+from typing import Dict, List, Literal, Optional, Union
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -20,22 +20,108 @@ class Settings(BaseSettings):
     chroma_dir: Path = data_dir / "chroma"
     upload_dir: Path = data_dir / "uploads"
     chroma_collection: str = "qa_testing_brain"
+    numpy_index_dir: Path = data_dir / "numpy_index"
+    lexical_index_dir: Path = data_dir / "lexical_index"
+    html_index_dir: Path = data_dir / "html_index"
+    projects_dir: Path = data_dir / "projects"
+
+    # Projects (tenants). Each has its own collection, indexes, uploads and HTML pages;
+    # the unprefixed API routes serve the default project from the paths above.
+    default_project: str = "default"
+    max_loaded_projects: int = 32
+    project_idle_seconds: float = 15 * 60
+
+    # Vector store
+    vector_backend: Literal["chroma", "numpy"] = "chroma"
+    numpy_index_dtype: Literal["float32", "float16"] = "float32"
+    # Bounds the HNSW segments Chroma keeps in memory across all projects (LRU); 0 means unbounded.
+    chroma_memory_limit_bytes: int = 0
+    # HNSW parameters for new Chroma index versions (existing versions keep theirs until
+    # /kb/reindex). Embeddings are normalized, so cosine ranks like inner product.
+    chroma_hnsw_space: Literal["cosine", "l2", "ip"] = "cosine"
+    chroma_hnsw_m: int = 16
+    chroma_hnsw_construction_ef: int = 100
+    chroma_hnsw_search_ef: int = 10
+    # Per-project overrides, e.g. CHROMA_HNSW_OVERRIDES='{"team-b": {"search_ef": 128}}'.
+    chroma_hnsw_overrides: Dict[str, Dict[str, Union[int, str]]] = {}
 
     # Embedding configuration
     embedding_model_name: str = "sentence-transformers/all-MiniLM-L6-v2"
     embedding_device: Literal["cuda", "cpu"] = "cuda" if os.getenv("USE_CUDA", "true").lower() not in {"0", "false"} else "cpu"
+    embedding_backend: Literal["torch", "onnx"] = "torch"
+    # ONNX models are exported on first use; int8 weights trade ~1% cosine fidelity for speed.
+    onnx_model_dir: Path = data_dir / "onnx"
+    onnx_quantize: bool = True
+    embedding_threads: Optional[int] = None
     embedding_batch_size: int = 32
+    embedding_cache_enabled: bool = True
+    embedding_cache_path: Path = data_dir / "embedding_cache.sqlite3"
+    embedding_cache_max_entries: int = 500_000
+    embedding_cache_dtype: Literal["float32", "float16"] = "float32"
+    query_embedding_cache_size: int = 2048
+    # Concurrent query embeddings arriving within this window are encoded as one batch of at
+    # most embedding_batch_size; 0 encodes each query on its own caller's thread.
+    embedding_batch_window_ms: float = 2.0
     chunk_size: int = 800
     chunk_overlap: int = 120
 
+    # Ingestion
+    incremental_ingestion: bool = True
+    parser_workers: Optional[int] = None
+    ingestion_batch_size: int = 256
+    ingestion_workers: int = 2
+    ingestion_job_history: int = 200
+    upload_chunk_size: int = 1024 * 1024
+    max_upload_file_bytes: int = 256 * 1024 * 1024
+    max_upload_request_bytes: int = 1024 * 1024 * 1024
+
     # Retrieval
     retriever_top_k: int = 6
+    retrieval_cache_size: int = 1024
+    retrieval_mode: Literal["dense", "hybrid"] = "hybrid"
+    hybrid_candidate_multiplier: int = 4
+    rrf_k: int = 60
 
     # LLM providers
     groq_api_key: Optional[str] = os.getenv("GROQ_API_KEY")
     groq_model: str = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+    llm_cache_enabled: bool = True
+    llm_cache_path: Path = data_dir / "llm_cache.sqlite3"
+    llm_cache_ttl_seconds: float = 24 * 60 * 60
+    llm_cache_max_entries: int = 5000
+    # Provider quota; 0 disables a limit. Token budgets count prompt plus expected completion.
+    llm_requests_per_minute: int = 30
+    llm_tokens_per_minute: int = 20_000
+    llm_expected_completion_tokens: int = 1024
+    llm_max_concurrency: int = 8
+    llm_max_retries: int = 4
+    llm_backoff_base_seconds: float = 1.0
+    llm_backoff_max_seconds: float = 30.0
+    llm_request_timeout: float = 60.0
+    # Size routing, fastest model first: a prompt goes to the first route whose
+    # max_prompt_tokens fits it (else the last one). Empty sends everything to groq_model.
+    # e.g. LLM_ROUTES='[{"model": "llama-3.1-8b-instant", "max_prompt_tokens": 3000},
+    #                   {"model": "llama-3.3-70b-versatile", "max_prompt_tokens": 100000}]'
+    llm_routes: List[Dict[str, Union[int, str]]] = []
+    # Hedging: if a non-streamed call has not answered after its route's recent p95 latency,
+    # send a duplicate and keep whichever valid answer arrives first.
+    llm_hedge_enabled: bool = False
+    llm_hedge_percentile: float = 95.0
+    llm_hedge_min_samples: int = 20
+    llm_hedge_initial_delay_seconds: float = 5.0
+    llm_hedge_min_delay_seconds: float = 0.25
+
+    # Agents
+    selenium_batch_concurrency: int = 4
+    selenium_batch_max_cases: int = 200
+    html_index_max_elements: int = 25
+    context_token_budget: int = 3000
 
     # Runtime
+    # Heavy components load on first use; set to load them in the background at startup instead.
+    warmup_on_startup: bool = False
+    # Adds a Server-Timing header with per-stage durations to every response.
+    server_timing_header: bool = False
     uvicorn_host: str = "0.0.0.0"
     uvicorn_port: int = 8000
 
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, List, Literal, Optional
 
 from pydantic import BaseModel, Field
 
@@ -16,11 +16,55 @@ class IngestionStatus(BaseModel):
     message: str
     documents_processed: int = 0
     duration_seconds: float = 0.0
+    chunks_total: int = 0
+    chunks_added: int = 0
+    chunks_deleted: int = 0
+    failed_documents: Dict[str, str] = Field(default_factory=dict)
+    index_version: Optional[str] = Field(None, description="Index version the project serves after this build")
+
+
+class IngestionJobStatus(BaseModel):
+    job_id: str
+    status: str = Field(..., description="queued, running, succeeded or failed")
+    stage: str
+    project_id: str
+    collection: str
+    documents_total: int = 0
+    documents_parsed: int = 0
+    chunks_total: int = 0
+    chunks_to_embed: int = 0
+    chunks_embedded: int = 0
+    timings: Dict[str, float] = Field(default_factory=dict, description="Seconds spent per stage")
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    result: Optional[IngestionStatus] = None
+
+
+class ReindexRequest(BaseModel):
+    """HNSW parameters for the rebuilt index; omitted ones come from settings."""
+
+    space: Optional[Literal["cosine", "l2", "ip"]] = None
+    m: Optional[int] = Field(None, ge=2, le=128, description="HNSW graph degree (M)")
+    construction_ef: Optional[int] = Field(None, ge=1)
+    search_ef: Optional[int] = Field(None, ge=1)
+
+
+class ReindexStatus(BaseModel):
+    project_id: str
+    index_version: str
+    previous_version: str
+    chunks: int
+    index_params: Dict[str, Any]
+    index_size_bytes: int
+    build_seconds: float
 
 
 class TestCaseRequest(BaseModel):
     query: str = Field(..., description="Instruction for generating test cases")
     top_k: int = Field(6, description="Number of context chunks to retrieve")
+    bypass_cache: bool = Field(False, description="Always call the LLM instead of replaying a cached response")
 
 
 class TestCase(BaseModel):
@@ -30,18 +74,48 @@ class TestCase(BaseModel):
     steps: List[str]
     expected_result: str
     grounded_in: List[str]
+    context_ids: List[str] = Field(
+        default_factory=list,
+        description="Chunks the test case was generated from; script generation reuses them instead of searching again",
+    )
+
+
+class ContextPackingReport(BaseModel):
+    chunks_retrieved: int
+    blocks_packed: int
+    chunks_dropped: int = Field(..., description="Chunks left out to stay within the token budget")
+    tokens_before: int
+    tokens_after: int
+    tokens_saved: int
 
 
 class TestCaseResponse(BaseModel):
     test_cases: List[TestCase]
     raw_output: str
+    context: Optional[ContextPackingReport] = None
 
 
 class SeleniumScriptRequest(BaseModel):
     test_case: TestCase
+    bypass_cache: bool = Field(False, description="Always call the LLM instead of replaying a cached response")
 
 
 class SeleniumScriptResponse(BaseModel):
     script: str
     grounded_in: List[str]
     raw_output: str
+    context: Optional[ContextPackingReport] = None
+
+
+class SeleniumBatchRequest(BaseModel):
+    test_cases: List[TestCase] = Field(..., min_length=1)
+    bypass_cache: bool = Field(False, description="Always call the LLM instead of replaying a cached response")
+    concurrency: Optional[int] = Field(None, ge=1, description="Maximum concurrent LLM calls for this batch")
+
+
+class SeleniumScriptResult(BaseModel):
+    index: int = Field(..., description="Position of the test case in the request")
+    test_id: str
+    script: Optional[str] = None
+    grounded_in: List[str] = Field(default_factory=list)
+    error: Optional[str] = None
@@ -3,53 +3,71 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
-from typing import List
-
-from langchain.schema import HumanMessage, SystemMessage
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
+from app.core.config import settings
 from app.models.schemas import (
+    ContextPackingReport,
+    SeleniumBatchRequest,
     SeleniumScriptRequest,
     SeleniumScriptResponse,
+    SeleniumScriptResult,
     TestCase,
     TestCaseRequest,
     TestCaseResponse,
 )
-from app.services.llm import get_llm_service
+from app.services.context_packer import pack_contexts
+from app.services.html_index import SelectorIndex, selector_index_store
+from app.services.llm import LLMService, get_llm_service
 from app.services.prompts import (
     build_selenium_prompt,
     build_system_prompt,
     build_test_case_prompt,
 )
 from app.services.retriever import KnowledgeRetriever
-from app.services.state import app_state
+from app.services.state import project_states
 from app.services.document_loader import DocumentLoader
-from app.utils.parsers import JSONParsingError, ensure_string_list, extract_json_array
+from app.utils.metrics import timed
+from app.utils.parsers import (
+    IncrementalJSONArrayParser,
+    JSONParsingError,
+    ensure_string_list,
+    extract_json_array,
+)
 
 logger = logging.getLogger(__name__)
 
-
-def _ensure_event_loop() -> asyncio.AbstractEventLoop:
-    try:
-        return asyncio.get_running_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        return loop
+# Chunks searched for a script when the test case carries no reusable context_ids.
+SCRIPT_CONTEXT_TOP_K = 6
 
 
 class AgentOrchestrator:
-    def __init__(self, retriever: KnowledgeRetriever) -> None:
+    def __init__(self, retriever: KnowledgeRetriever, llm_service: Optional[LLMService] = None) -> None:
         self.retriever = retriever
-        self.llm_service = get_llm_service()
+        self._llm_service = llm_service
         self.document_loader = DocumentLoader()
 
-    async def generate_test_cases(self, request: TestCaseRequest) -> TestCaseResponse:
-        contexts = self.retriever.raw_search(request.query, top_k=request.top_k)
+    @property
+    def llm_service(self) -> LLMService:
+        if self._llm_service is None:
+            self._llm_service = get_llm_service()
+        return self._llm_service
+
+    @property
+    def llm_loaded(self) -> bool:
+        return self._llm_service is not None
+
+    async def generate_test_cases(self, request: TestCaseRequest, project_id: Optional[str] = None) -> TestCaseResponse:
+        with timed("retrieval"):
+            contexts = await asyncio.to_thread(self.retriever.raw_search, request.query, request.top_k, project_id)
         if not contexts:
             raise ValueError("Knowledge base returned no context for the query.")
 
-        prompt = build_test_case_prompt(request.query, contexts)
-        raw_output = await self._invoke_llm(prompt)
+        with timed("context_packing"):
+            packed = pack_contexts(contexts)
+        with timed("prompt_build"):
+            prompt = build_test_case_prompt(request.query, packed.contexts)
+        raw_output = await self._invoke_llm(prompt, bypass_cache=request.bypass_cache)
 
         try:
             parsed = extract_json_array(raw_output)
@@ -57,50 +75,234 @@ class AgentOrchestrator:
             logger.error("Failed to parse test cases JSON: %s", exc)
             raise
 
-        test_cases: List[TestCase] = []
-        for idx, item in enumerate(parsed, start=1):
-            test_cases.append(
-                TestCase(
-                    test_id=str(item.get("test_id", f"TC-{idx:03d}")),
-                    feature=str(item.get("feature", "")),
-                    scenario=str(item.get("scenario", "")),
-                    steps=ensure_string_list(item.get("steps", [])),
-                    expected_result=str(item.get("expected_result", "")),
-                    grounded_in=ensure_string_list(item.get("grounded_in", [])),
-                )
-            )
+        test_cases = [self._to_test_case(item, idx, packed.contexts) for idx, item in enumerate(parsed, start=1)]
+        return TestCaseResponse(
+            test_cases=test_cases,
+            raw_output=raw_output,
+            context=ContextPackingReport(**packed.report()),
+        )
+
+    async def stream_test_cases(
+        self, request: TestCaseRequest, project_id: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Yield ``("test_case", case)`` events as each JSON object closes, then ``("done", ...)``."""
+        with timed("retrieval"):
+            contexts = await asyncio.to_thread(self.retriever.raw_search, request.query, request.top_k, project_id)
+        if not contexts:
+            raise ValueError("Knowledge base returned no context for the query.")
+
+        with timed("context_packing"):
+            packed = pack_contexts(contexts)
+        with timed("prompt_build"):
+            prompt = build_test_case_prompt(request.query, packed.contexts)
+        messages = self._build_messages(prompt)
+        parser = IncrementalJSONArrayParser()
+        emitted = 0
+
+        cache_key, cached = await self._cache_lookup(messages, request.bypass_cache)
+        if cached is not None:
+            raw_output = cached
+            for item in extract_json_array(raw_output):
+                emitted += 1
+                yield "test_case", self._to_test_case(item, emitted, packed.contexts).model_dump()
+            yield "done", {"count": emitted, "raw_output": raw_output, "cached": True, "context": packed.report()}
+            return
+
+        pieces: List[str] = []
+        async for text in self.llm_service.astream(messages):
+            pieces.append(text)
+            for item in parser.feed(text):
+                emitted += 1
+                yield "test_case", self._to_test_case(item, emitted, packed.contexts).model_dump()
 
-        return TestCaseResponse(test_cases=test_cases, raw_output=raw_output)
+        raw_output = "".join(pieces).strip()
+        if emitted == 0:
+            # The model did not stream a well-formed array; fall back to the tolerant parser.
+            for item in extract_json_array(raw_output):
+                emitted += 1
+                yield "test_case", self._to_test_case(item, emitted, packed.contexts).model_dump()
+        await self._cache_store(cache_key, raw_output)
+        yield "done", {"count": emitted, "raw_output": raw_output, "cached": False, "context": packed.report()}
 
-    async def generate_selenium_script(self, request: SeleniumScriptRequest) -> SeleniumScriptResponse:
+    async def generate_selenium_script(
+        self, request: SeleniumScriptRequest, project_id: Optional[str] = None
+    ) -> SeleniumScriptResponse:
         test_case = request.test_case
-        query = f"{test_case.feature}: {test_case.scenario}. Steps: {'; '.join(test_case.steps)}"
-        contexts = self.retriever.raw_search(query, top_k=6)
+        contexts = (await asyncio.to_thread(self._script_contexts, [test_case], project_id))[0]
         if not contexts:
             raise ValueError("Unable to retrieve context for the provided test case.")
 
-        if not app_state.latest_html_path:
-            raise ValueError("checkout.html has not been ingested yet; upload it before generating scripts.")
+        page_index = await asyncio.to_thread(self._load_page_index, project_id)
+        return await self._generate_script(test_case, contexts, page_index, request.bypass_cache, project_id)
+
+    async def generate_selenium_scripts(
+        self, request: SeleniumBatchRequest, project_id: Optional[str] = None
+    ) -> AsyncIterator[SeleniumScriptResult]:
+        """Generate scripts for many test cases, yielding each result as soon as it is ready.
+
+        The page's selector index is loaded once and all retrieval queries are embedded and searched
+        as one batch (test cases carrying ``context_ids`` skip the search); only the LLM calls fan out, bounded by the concurrency limit.
+        """
+        page_index = await asyncio.to_thread(self._load_page_index, project_id)
+        test_cases = request.test_cases
+        contexts_batch = await asyncio.to_thread(self._script_contexts, test_cases, project_id)
+        limit = min(request.concurrency or settings.selenium_batch_concurrency, settings.selenium_batch_concurrency)
+        semaphore = asyncio.Semaphore(limit)
+
+        async def run(index: int, test_case: TestCase, contexts: List[dict]) -> SeleniumScriptResult:
+            async with semaphore:
+                try:
+                    if not contexts:
+                        raise ValueError("Unable to retrieve context for the provided test case.")
+                    response = await self._generate_script(
+                        test_case, contexts, page_index, request.bypass_cache, project_id
+                    )
+                except Exception as exc:  # noqa: BLE001
+                    logger.warning("Script generation failed for %s: %s", test_case.test_id, exc)
+                    return SeleniumScriptResult(index=index, test_id=test_case.test_id, error=str(exc))
+                return SeleniumScriptResult(
+                    index=index,
+                    test_id=test_case.test_id,
+                    script=response.script,
+                    grounded_in=response.grounded_in,
+                )
+
+        tasks = [
+            asyncio.create_task(run(index, test_case, contexts))
+            for index, (test_case, contexts) in enumerate(zip(test_cases, contexts_batch))
+        ]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            # The client may disconnect mid-stream; do not leave LLM calls running.
+            for task in tasks:
+                task.cancel()
 
-        html_raw = self.document_loader.load_html_raw(app_state.latest_html_path)
-        test_case_json = json.dumps(test_case.model_dump(), indent=2)
-        prompt = build_selenium_prompt(test_case_json, contexts, html_raw)
-        raw_output = await self._invoke_llm(prompt)
+    async def _generate_script(
+        self,
+        test_case: TestCase,
+        contexts: List[dict],
+        page_index: SelectorIndex,
+        bypass_cache: bool,
+        project_id: Optional[str] = None,
+    ) -> SeleniumScriptResponse:
+        # Chunk IDs mean nothing to the model and would only cost prompt tokens.
+        test_case_json = json.dumps(test_case.model_dump(exclude={"context_ids"}), indent=2)
+        with timed("context_packing"):
+            packed = pack_contexts(contexts)
+        # The raw-HTML fallback reads and parses the page; keep that off the event loop.
+        page_elements, raw_html = await asyncio.to_thread(self._page_elements, page_index, test_case, project_id)
+        with timed("prompt_build"):
+            prompt = build_selenium_prompt(test_case_json, packed.contexts, page_elements, raw_html=raw_html)
+        raw_output = await self._invoke_llm(prompt, bypass_cache=bypass_cache)
 
         grounded_sources = set(test_case.grounded_in)
-        for ctx in contexts:
+        for ctx in packed.contexts:
             source = ctx.get("metadata", {}).get("source")
             if source:
                 grounded_sources.add(source)
 
-        return SeleniumScriptResponse(script=raw_output, grounded_in=sorted(grounded_sources), raw_output=raw_output)
+        return SeleniumScriptResponse(
+            script=raw_output,
+            grounded_in=sorted(grounded_sources),
+            raw_output=raw_output,
+            context=ContextPackingReport(**packed.report()),
+        )
+
+    def _script_contexts(self, test_cases: List[TestCase], project_id: Optional[str] = None) -> List[List[dict]]:
+        # Reuse the chunks each test case was generated from, so both phases share the same
+        # grounding; search only for cases without them or whose chunks were re-ingested away.
+        with timed("context_fetch"):
+            contexts_batch = self.retriever.fetch_many([test_case.context_ids for test_case in test_cases], project_id)
+        missing = [position for position, contexts in enumerate(contexts_batch) if contexts is None]
+        if missing:
+            queries = [self._script_query(test_cases[position]) for position in missing]
+            with timed("retrieval"):
+                searched = self.retriever.raw_search_many(queries, SCRIPT_CONTEXT_TOP_K, project_id)
+            for position, contexts in zip(missing, searched):
+                contexts_batch[position] = contexts
+        logger.debug("Script contexts: %s reused, %s searched", len(test_cases) - len(missing), len(missing))
+        return contexts_batch
+
+    def _load_page_index(self, project_id: Optional[str] = None) -> SelectorIndex:
+        state = project_states.get(project_id)
+        path = state.latest_html_path
+        if not path:
+            raise ValueError("checkout.html has not been ingested yet; upload it before generating scripts.")
+        return selector_index_store.load(path, state.file_hashes.get(path.name))
+
+    def _page_elements(
+        self, page_index: SelectorIndex, test_case: TestCase, project_id: Optional[str] = None
+    ) -> Tuple[str, bool]:
+        """The page section of the script prompt, and whether it is raw HTML."""
+        if not page_index.entries:
+            # Nothing interactive was found; let the model work from the markup itself.
+            return self.document_loader.load_html_raw(project_states.get(project_id).latest_html_path), True
+        query = f"{self._script_query(test_case)} {test_case.expected_result}"
+        return page_index.render(page_index.select(query)), False
+
+    @staticmethod
+    def _script_query(test_case: TestCase) -> str:
+        return f"{test_case.feature}: {test_case.scenario}. Steps: {'; '.join(test_case.steps)}"
 
-    async def _invoke_llm(self, user_prompt: str) -> str:
-        model = self.llm_service.get_model()
-        messages = [SystemMessage(content=build_system_prompt()), HumanMessage(content=user_prompt)]
+    async def _invoke_llm(self, user_prompt: str, bypass_cache: bool = False) -> str:
+        messages = self._build_messages(user_prompt)
 
-        loop = _ensure_event_loop()
-        response = await asyncio.to_thread(model.invoke, messages)
-        output = response.content if hasattr(response, "content") else str(response)
+        cache_key, cached = await self._cache_lookup(messages, bypass_cache)
+        if cached is not None:
+            return cached
+
+        output = await self.llm_service.ainvoke(messages)
         logger.debug("LLM response length: %s", len(output))
-        return output.strip()
+        output = output.strip()
+        await self._cache_store(cache_key, output)
+        return output
+
+    def _build_messages(self, user_prompt: str) -> List[Any]:
+        from langchain.schema import HumanMessage, SystemMessage
+
+        return [SystemMessage(content=build_system_prompt()), HumanMessage(content=user_prompt)]
+
+    async def _cache_lookup(self, messages: List[Any], bypass_cache: bool) -> Tuple[Optional[str], Optional[str]]:
+        cache = self.llm_service.response_cache
+        if cache is None:
+            return None, None
+        cache_key = cache.key_for(self.llm_service.model_for(messages), self.llm_service.temperature, messages)
+        if bypass_cache:
+            return cache_key, None
+        cached = await asyncio.to_thread(cache.get, cache_key)
+        if cached is not None:
+            logger.debug("LLM cache hit (%s chars)", len(cached))
+        return cache_key, cached
+
+    async def _cache_store(self, cache_key: Optional[str], output: str) -> None:
+        # A bypassed request still refreshes the cached answer for later replays.
+        cache = self.llm_service.response_cache
+        if cache is not None and cache_key is not None and output:
+            await asyncio.to_thread(cache.set, cache_key, output)
+
+    @staticmethod
+    def _to_test_case(item: Dict[str, Any], idx: int, contexts: List[dict]) -> TestCase:
+        grounded_in = ensure_string_list(item.get("grounded_in", []))
+        return TestCase(
+            test_id=str(item.get("test_id", f"TC-{idx:03d}")),
+            feature=str(item.get("feature", "")),
+            scenario=str(item.get("scenario", "")),
+            steps=ensure_string_list(item.get("steps", [])),
+            expected_result=str(item.get("expected_result", "")),
+            grounded_in=grounded_in,
+            context_ids=_supporting_chunk_ids(contexts, grounded_in),
+        )
+
+
+def _supporting_chunk_ids(contexts: List[dict], grounded_in: List[str]) -> List[str]:
+    """Chunk IDs of the packed contexts from the documents a test case cites (all of them if it cites none)."""
+    cited = set(grounded_in)
+    chunk_ids = [
+        chunk_id
+        for ctx in contexts
+        if ctx["metadata"].get("source") in cited
+        for chunk_id in ctx["metadata"].get("chunk_ids", [])
+    ]
+    return chunk_ids or [chunk_id for ctx in contexts for chunk_id in ctx["metadata"].get("chunk_ids", [])]
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.services.embeddings import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Shortest suffix/prefix match accepted as genuine chunk overlap rather than coincidence.
+MIN_OVERLAP_CHARS = 8
+
+
+def estimate_tokens(text: str) -> int:
+    # Llama-family tokenizers average roughly four characters per token on English prose.
+    return (len(text) + 3) // 4
+
+
+@dataclass
+class _Block:
+    source: str
+    doc_hash: Optional[str]
+    text: str
+    rank: int
+    score: Optional[float]
+    first_order: int
+    last_order: int
+    start_index: int
+    chunk_ids: List[str] = field(default_factory=list)
+
+    @property
+    def end_index(self) -> int:
+        return self.start_index + len(self.text)
+
+    def to_payload(self) -> dict:
+        return {
+            "page_content": self.text,
+            "metadata": {
+                "source": self.source,
+                "score": self.score,
+                "chunk_id": self.chunk_ids[0] if self.chunk_ids else None,
+                "chunk_ids": self.chunk_ids,
+                "order": self.first_order,
+                "start_index": self.start_index,
+            },
+        }
+
+
+@dataclass
+class PackedContext:
+    contexts: List[dict]
+    chunks_retrieved: int
+    chunks_dropped: int
+    tokens_before: int
+    tokens_after: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    def report(self) -> Dict[str, int]:
+        return {
+            "chunks_retrieved": self.chunks_retrieved,
+            "blocks_packed": len(self.contexts),
+            "chunks_dropped": self.chunks_dropped,
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved": self.tokens_saved,
+        }
+
+
+def pack_contexts(contexts: List[dict], token_budget: Optional[int] = None) -> PackedContext:
+    """Merge overlapping/adjacent chunks of the same document and fill ``token_budget`` by rank.
+
+    ``contexts`` are retrieval payloads in relevance order; the packed blocks keep that
+    order (a block ranks as its best chunk) so prompt numbering still reflects relevance.
+    """
+    budget = token_budget or settings.context_token_budget
+    tokens_before = sum(estimate_tokens(ctx.get("page_content", "")) for ctx in contexts)
+
+    seen_texts = set()
+    by_document: Dict[tuple, List[_Block]] = {}
+    for rank, ctx in enumerate(contexts):
+        text = ctx.get("page_content", "").strip()
+        digest = hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+        if not text or digest in seen_texts:
+            continue
+        seen_texts.add(digest)
+        metadata = ctx.get("metadata", {})
+        order = int(metadata.get("order", rank))
+        block = _Block(
+            source=metadata.get("source", "unknown_source"),
+            doc_hash=metadata.get("doc_hash"),
+            text=text,
+            rank=rank,
+            score=metadata.get("score"),
+            first_order=order,
+            last_order=order,
+            start_index=int(metadata.get("start_index", 0)),
+            chunk_ids=[metadata["chunk_id"]] if metadata.get("chunk_id") else [],
+        )
+        by_document.setdefault((block.source, block.doc_hash), []).append(block)
+
+    blocks: List[_Block] = []
+    for document_blocks in by_document.values():
+        document_blocks.sort(key=lambda block: (block.start_index, block.first_order))
+        current = document_blocks[0]
+        for block in document_blocks[1:]:
+            merged = _merge(current, block)
+            if merged is None:
+                blocks.append(current)
+                current = block
+            else:
+                current = merged
+        blocks.append(current)
+    blocks.sort(key=lambda block: block.rank)
+
+    packed: List[_Block] = []
+    used = 0
+    dropped = 0
+    for block in blocks:
+        cost = estimate_tokens(block.text)
+        if used + cost <= budget:
+            packed.append(block)
+            used += cost
+        elif not packed:
+            # Never return an empty context: keep the head of the best block.
+            block.text = block.text[: budget * 4]
+            packed.append(block)
+            used += estimate_tokens(block.text)
+        else:
+            dropped += len(block.chunk_ids) or 1
+
+    result = PackedContext(
+        contexts=[block.to_payload() for block in packed],
+        chunks_retrieved=len(contexts),
+        chunks_dropped=dropped,
+        tokens_before=tokens_before,
+        tokens_after=used,
+    )
+    logger.debug("Packed context: %s", result.report())
+    return result
+
+
+def _merge(left: _Block, right: _Block) -> Optional[_Block]:
+    if right.text in left.text:
+        text = left.text
+    else:
+        overlap = _overlap(left.text, right.text)
+        if overlap:
+            text = left.text + right.text[overlap:]
+        elif right.first_order == left.last_order + 1 or right.start_index <= left.end_index:
+            text = f"{left.text}\n{right.text}"
+        else:
+            return None
+    return _Block(
+        source=left.source,
+        doc_hash=left.doc_hash,
+        text=text,
+        rank=min(left.rank, right.rank),
+        score=left.score if left.rank <= right.rank else right.score,
+        first_order=left.first_order,
+        last_order=max(left.last_order, right.last_order),
+        start_index=left.start_index,
+        chunk_ids=left.chunk_ids + right.chunk_ids,
+    )
+
+
+def _overlap(left: str, right: str) -> int:
+    # Chunks are stripped after splitting, so start_index can be off by a few characters;
+    # match the text itself, bounded by the configured splitter overlap.
+    limit = min(len(left), len(right), settings.chunk_overlap * 2)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
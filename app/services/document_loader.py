@@ -2,13 +2,20 @@ from __future__ import annotations
 
 import io
 import json
+import logging
 import mimetypes
+import multiprocessing
+import os
+import threading
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Iterable, List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
-import fitz  # type: ignore
-from bs4 import BeautifulSoup
-from unstructured.partition.auto import partition
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
 
 TEXT_EXTENSIONS = {".txt", ".md", ".markdown"}
 JSON_EXTENSIONS = {".json"}
@@ -31,6 +38,8 @@ def read_json_document(path: Path) -> str:
 
 
 def read_pdf_document(path: Path) -> str:
+    import fitz  # type: ignore
+
     with fitz.open(path) as doc:
         text = []
         for page in doc:
@@ -39,11 +48,16 @@ def read_pdf_document(path: Path) -> str:
 
 
 def read_html_document(path: Path) -> str:
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(path.read_text(encoding="utf-8"), "lxml")
     return soup.get_text(separator="\n")
 
 
 def read_with_unstructured(path: Path) -> str:
+    # unstructured takes seconds to import; only pay for it when a format needs it.
+    from unstructured.partition.auto import partition
+
     elements = partition(filename=str(path))
     return "\n".join(element.text for element in elements if element.text)
 
@@ -56,28 +70,129 @@ READERS = {
 }
 
 
+@dataclass
+class LoadedDocument:
+    filename: str
+    text: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def load_document(filename: str, path: Path) -> str:
+    suffix = path.suffix.lower()
+    if suffix in TEXT_EXTENSIONS:
+        return read_text_document(path)
+    if suffix in JSON_EXTENSIONS:
+        return read_json_document(path)
+    if suffix in HTML_EXTENSIONS:
+        return read_html_document(path)
+    if suffix in PDF_EXTENSIONS:
+        return read_pdf_document(path)
+    try:
+        return read_with_unstructured(path)
+    except Exception as exc:  # noqa: BLE001
+        raise ValueError(f"Unsupported document type for {filename}: {suffix}") from exc
+
+
+def _load_document_safely(filename: str, path: Path) -> LoadedDocument:
+    # Runs inside pool workers: failures come back as data so one bad file
+    # cannot abort the rest of the batch.
+    try:
+        return LoadedDocument(filename=filename, text=load_document(filename, path))
+    except Exception as exc:  # noqa: BLE001
+        return LoadedDocument(filename=filename, error=f"{type(exc).__name__}: {exc}")
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
 class DocumentLoader:
     """Loads heterogeneous document types into raw text."""
 
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        self.max_workers = max_workers or settings.parser_workers or available_cpus()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
     def load_documents(self, files: Dict[str, Path]) -> List[Tuple[str, str]]:
-        documents: List[Tuple[str, str]] = []
-        for filename, path in files.items():
-            suffix = path.suffix.lower()
-            if suffix in TEXT_EXTENSIONS:
-                text = read_text_document(path)
-            elif suffix in JSON_EXTENSIONS:
-                text = read_json_document(path)
-            elif suffix in HTML_EXTENSIONS:
-                text = read_html_document(path)
-            elif suffix in PDF_EXTENSIONS:
-                text = read_pdf_document(path)
-            else:
-                try:
-                    text = read_with_unstructured(path)
-                except Exception as exc:  # noqa: BLE001
-                    raise ValueError(f"Unsupported document type for {filename}: {suffix}") from exc
-            documents.append((filename, text))
-        return documents
+        return [(filename, load_document(filename, path)) for filename, path in files.items()]
+
+    def load_documents_parallel(self, files: Dict[str, Path]) -> List[LoadedDocument]:
+        """Parse files on a process pool, returning one result per file in input order.
+
+        A dying worker breaks the whole pool and fails every file still in it. Those files
+        are retried on a fresh pool; whatever a second crash leaves unfinished is parsed one
+        file per process, so only a file that really kills its parser is reported as crashed.
+        """
+        items = list(files.items())
+        if self.max_workers <= 1 or len(items) <= 1:
+            return [_load_document_safely(filename, path) for filename, path in items]
+
+        results: Dict[str, LoadedDocument] = {}
+        unfinished = self._load_on_pool(items, results)
+        if unfinished:
+            unfinished = self._load_on_pool(unfinished, results)
+        for filename, path in unfinished:
+            results[filename] = self._load_isolated(filename, path)
+        return [results[filename] for filename, _ in items]
+
+    def _load_on_pool(
+        self, items: List[Tuple[str, Path]], results: Dict[str, LoadedDocument]
+    ) -> List[Tuple[str, Path]]:
+        """Parse ``items`` on the shared pool into ``results``; returns those a broken pool left unparsed."""
+        pool = self._get_pool()
+        futures = {}
+        broken = False
+        try:
+            for filename, path in items:
+                futures[filename] = pool.submit(_load_document_safely, filename, path)
+        except (BrokenProcessPool, RuntimeError):
+            # A worker died while the pool was idle, or another batch shut the broken pool down.
+            broken = True
+        for filename, future in futures.items():
+            try:
+                results[filename] = future.result()
+            except (BrokenProcessPool, CancelledError):
+                broken = True
+        unfinished = [(filename, path) for filename, path in items if filename not in results]
+        if broken:
+            logger.warning("Document parser pool broke with %s file(s) unparsed; retrying them", len(unfinished))
+            self._discard_pool(pool)
+        return unfinished
+
+    def _load_isolated(self, filename: str, path: Path) -> LoadedDocument:
+        with self._new_pool(1) as pool:
+            try:
+                return pool.submit(_load_document_safely, filename, path).result()
+            except BrokenProcessPool as exc:
+                # A worker died (e.g. a parser segfault) with only this file in it.
+                return LoadedDocument(filename=filename, error=f"Parser process crashed: {exc}")
+
+    @staticmethod
+    def _new_pool(max_workers: int) -> ProcessPoolExecutor:
+        # Spawned workers import only the parsing stack, not torch or the
+        # embedding model that may already be loaded in this process.
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = self._new_pool(self.max_workers)
+                logger.info("Started document parser pool with %s workers", self.max_workers)
+            return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor) -> None:
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
 
     def load_html_raw(self, path: Path) -> str:
         return path.read_text(encoding="utf-8")
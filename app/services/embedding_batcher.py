@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple
+
+from app.utils.metrics import EMBEDDING_BATCH_SIZE, EMBEDDING_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent single-text embedding calls into batched encodes.
+
+    Callers block in :meth:`embed` while one worker thread collects texts that arrive
+    within ``window_seconds`` of the first (or until ``max_batch`` are waiting), encodes
+    them with a single ``encode_batch`` call and hands each caller its own vector. Texts
+    that arrive while a batch is encoding form the next one. A lone caller with no recent
+    concurrency is encoded right away, so idle-time latency does not pay for the window.
+    """
+
+    def __init__(
+        self, encode_batch: Callable[[List[str]], List[List[float]]], window_seconds: float, max_batch: int
+    ) -> None:
+        self.encode_batch = encode_batch
+        self.window_seconds = window_seconds
+        self.max_batch = max(max_batch, 1)
+        self._pending: List[Tuple[str, Future]] = []
+        self._condition = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+        self._last_batch_size = 0
+
+    def embed(self, text: str) -> List[float]:
+        future: Future = Future()
+        with self._condition:
+            EMBEDDING_QUEUE_DEPTH.observe(len(self._pending))
+            self._pending.append((text, future))
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+            self._condition.notify()
+        return future.result()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                concurrent = len(self._pending) > 1 or self._last_batch_size > 1
+                deadline = time.monotonic() + (self.window_seconds if concurrent else 0.0)
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = self._pending[: self.max_batch]
+                del self._pending[: self.max_batch]
+                self._last_batch_size = len(batch)
+
+            EMBEDDING_BATCH_SIZE.observe(len(batch))
+            try:
+                vectors = self.encode_batch([text for text, _ in batch])
+            except BaseException as exc:  # noqa: BLE001
+                # The worker must survive; every caller in the batch sees the error instead.
+                logger.warning("Batched query embedding failed for %s texts: %s", len(batch), exc)
+                for _, future in batch:
+                    future.set_exception(exc)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
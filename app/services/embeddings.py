@@ -1,47 +1,168 @@
 from __future__ import annotations
 
+import hashlib
 import logging
+import re
+import unicodedata
 from functools import lru_cache
-from typing import Iterable, List
-
-import torch
-from sentence_transformers import SentenceTransformer
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
 
 from app.core.config import settings
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.utils.cache import LRUCache
+from app.utils.disk_cache import DiskLRUCache
+from app.utils.metrics import register_cache, timed
+
+if TYPE_CHECKING:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+
+    from app.services.onnx_embeddings import OnnxEncoder
 
 logger = logging.getLogger(__name__)
 
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    # The MiniLM tokenizer splits on whitespace, so collapsing runs of it does not
+    # change the token sequence and lets near-identical strings share a cache entry.
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+class EmbeddingCache:
+    def __init__(self, model_name: str) -> None:
+        import numpy as np
+
+        self.model_name = model_name
+        self.dtype = np.dtype(settings.embedding_cache_dtype)
+        self.store = DiskLRUCache(settings.embedding_cache_path, max_entries=settings.embedding_cache_max_entries)
+
+    def key_for(self, text: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{self.model_name}:{digest}"
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        import numpy as np
+
+        return {
+            key: np.frombuffer(value, dtype=self.dtype).astype(np.float32)
+            for key, value in self.store.get_many(keys).items()
+        }
+
+    def set_many(self, vectors: Dict[str, np.ndarray]) -> None:
+        self.store.set_many((key, vector.astype(self.dtype).tobytes()) for key, vector in vectors.items())
+
 
 class EmbeddingService:
     def __init__(self) -> None:
-        device = settings.embedding_device
-        if device == "cuda" and not torch.cuda.is_available():
-            logger.warning("CUDA requested but not available. Falling back to CPU embeddings.")
-            device = "cpu"
-
-        logger.info("Loading embedding model %s on device %s", settings.embedding_model_name, device)
-        self.model = SentenceTransformer(settings.embedding_model_name, device=device)
+        self.backend = settings.embedding_backend
         self.batch_size = settings.embedding_batch_size
+        self.model: Optional[SentenceTransformer] = None
+        self.onnx_encoder: Optional[OnnxEncoder] = None
+        cache_namespace = settings.embedding_model_name
+        if self.backend == "onnx":
+            from app.services.onnx_embeddings import OnnxEncoder
 
-    def embed_texts(self, texts: Iterable[str]) -> List[List[float]]:
-        encoded = self.model.encode(
-            list(texts),
-            batch_size=self.batch_size,
-            show_progress_bar=False,
-            convert_to_numpy=True,
-            normalize_embeddings=True,
+            self.onnx_encoder = OnnxEncoder(
+                settings.embedding_model_name,
+                settings.onnx_model_dir / settings.embedding_model_name.replace("/", "__"),
+                quantize=settings.onnx_quantize,
+                threads=settings.embedding_threads,
+            )
+            # Quantized vectors differ slightly from PyTorch ones; never mix them in one cache entry.
+            cache_namespace = f"{settings.embedding_model_name}:{self.onnx_encoder.variant}"
+        else:
+            import torch
+            from sentence_transformers import SentenceTransformer
+
+            device = settings.embedding_device
+            if device == "cuda" and not torch.cuda.is_available():
+                logger.warning("CUDA requested but not available. Falling back to CPU embeddings.")
+                device = "cpu"
+            if settings.embedding_threads:
+                torch.set_num_threads(settings.embedding_threads)
+
+            logger.info("Loading embedding model %s on device %s", settings.embedding_model_name, device)
+            self.model = SentenceTransformer(settings.embedding_model_name, device=device)
+        self.cache: Optional[EmbeddingCache] = (
+            EmbeddingCache(cache_namespace) if settings.embedding_cache_enabled else None
         )
-        if hasattr(encoded, "tolist"):
-            return encoded.tolist()
-        return [list(vector) for vector in encoded]
+        self.query_cache = LRUCache(settings.query_embedding_cache_size)
+        self.query_batcher: Optional[EmbeddingBatcher] = None
+        if settings.embedding_batch_window_ms > 0:
+            self.query_batcher = EmbeddingBatcher(
+                self.embed_texts, settings.embedding_batch_window_ms / 1000.0, self.batch_size
+            )
+        register_cache("query_embeddings", self.query_cache.stats)
+        if self.cache is not None:
+            register_cache("embedding_store", self.cache.store.stats)
+
+    def embed_texts(self, texts: Iterable[str]) -> List[List[float]]:
+        texts = list(texts)
+        if not texts:
+            return []
+        if self.cache is None:
+            return self._encode(texts).tolist()
+
+        keys = [self.cache.key_for(text) for text in texts]
+        vectors = self.cache.get_many(keys)
+
+        # Only cache misses reach the model, deduplicated so shared boilerplate is encoded once.
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+        if missing:
+            encoded = self._encode(list(missing.values()))
+            computed = dict(zip(missing.keys(), encoded))
+            self.cache.set_many(computed)
+            vectors.update(computed)
+            logger.debug("Embedding cache: %s hits, %s misses", len(texts) - len(missing), len(missing))
+
+        return [vectors[key].tolist() for key in keys]
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         return self.embed_texts(texts)
 
     def embed_query(self, text: str) -> List[float]:
-        return self.embed_texts([text])[0]
+        key = normalize_text(text)
+        cached = self.query_cache.get(key)
+        if cached is not None:
+            return list(cached)
+        if self.query_batcher is not None:
+            embedding = self.query_batcher.embed(text)
+        else:
+            embedding = self.embed_texts([text])[0]
+        self.query_cache.set(key, tuple(embedding))
+        return embedding
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        stats = {"query_embeddings": self.query_cache.stats()}
+        if self.cache is not None:
+            stats["embedding_store"] = self.cache.store.stats()
+        return stats
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        with timed("embedding_model"):
+            if self.onnx_encoder is not None:
+                return self.onnx_encoder.encode(texts, self.batch_size)
+            encoded = self.model.encode(
+                texts,
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+            )
+            import numpy as np
+
+            return np.asarray(encoded, dtype=np.float32)
 
 
 @lru_cache()
 def get_embedding_service() -> EmbeddingService:
     return EmbeddingService()
+
+
+def embedding_service_loaded() -> bool:
+    return get_embedding_service.cache_info().currsize > 0
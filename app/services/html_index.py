@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import math
+import os
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from app.core.config import settings
+from app.utils.cache import LRUCache
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup, Tag
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE_TAGS = {"input", "button", "select", "textarea", "a", "form"}
+SKIPPED_TAGS = {"script", "style", "head", "meta", "link", "title"}
+# Attributes worth showing the model besides id/name/type; data-* attributes are always kept.
+EXTRA_ATTRIBUTES = ("value", "placeholder", "role", "href", "aria-label", "for")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "click", "enter", "for", "from", "in", "is", "it",
+    "of", "on", "or", "page", "should", "that", "the", "then", "to", "user", "verify", "with",
+}
+
+
+@dataclass
+class SelectorEntry:
+    tag: str
+    css: str
+    id: Optional[str] = None
+    name: Optional[str] = None
+    type: Optional[str] = None
+    label: Optional[str] = None
+    text: Optional[str] = None
+    form: Optional[str] = None
+    attributes: Dict[str, str] = field(default_factory=dict)
+
+    def search_text(self) -> str:
+        parts = [self.id, self.name, self.type, self.label, self.text, *self.attributes.values()]
+        return " ".join(part for part in parts if part)
+
+    def describe(self) -> str:
+        fields = [f"{self.tag} css={self.css}"]
+        for key in ("id", "name", "type", "form"):
+            value = getattr(self, key)
+            if value:
+                fields.append(f"{key}={value}")
+        if self.label:
+            fields.append(f"label={json.dumps(self.label)}")
+        if self.text and self.text != self.label:
+            fields.append(f"text={json.dumps(self.text)}")
+        fields.extend(f"{key}={json.dumps(value)}" for key, value in self.attributes.items())
+        return " ".join(fields)
+
+
+class SelectorIndex:
+    """Interactive and addressable elements of one HTML page, matched against test steps by token overlap."""
+
+    def __init__(self, content_hash: str, entries: List[SelectorEntry]) -> None:
+        self.content_hash = content_hash
+        from app.services.lexical_index import tokenize
+
+        self.entries = entries
+        self._tokens = [set(tokenize(entry.search_text())) - STOPWORDS for entry in entries]
+        doc_freqs = Counter(token for tokens in self._tokens for token in tokens)
+        self._idf = {token: math.log1p(len(entries) / freq) for token, freq in doc_freqs.items()}
+
+    def select(self, text: str, limit: Optional[int] = None) -> List[SelectorEntry]:
+        from app.services.lexical_index import tokenize
+
+        limit = limit or settings.html_index_max_elements
+        query = set(tokenize(text)) - STOPWORDS
+        scored = []
+        for position, tokens in enumerate(self._tokens):
+            score = sum(self._idf[token] for token in tokens & query)
+            if score > 0:
+                scored.append((score, position))
+        if not scored:
+            return self.entries[:limit]
+
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        chosen = {position for _, position in scored[:limit]}
+        # Submitting a form is part of nearly every scenario that fills one in.
+        forms = {self.entries[position].form for position in chosen} - {None}
+        for position, entry in enumerate(self.entries):
+            if len(chosen) >= limit:
+                break
+            if entry.form in forms and entry.type == "submit":
+                chosen.add(position)
+        return [self.entries[position] for position in sorted(chosen)]
+
+    def render(self, entries: List[SelectorEntry]) -> str:
+        return "\n".join(entry.describe() for entry in entries)
+
+    def to_json(self) -> str:
+        return json.dumps({"content_hash": self.content_hash, "entries": [asdict(entry) for entry in self.entries]})
+
+    @classmethod
+    def from_json(cls, payload: str) -> "SelectorIndex":
+        data = json.loads(payload)
+        return cls(data["content_hash"], [SelectorEntry(**entry) for entry in data["entries"]])
+
+
+def build_selector_index(html: str, content_hash: str) -> SelectorIndex:
+    # bs4 and soupsieve add ~60ms to importing the API; only page indexing needs them.
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "lxml")
+    labels: Dict[str, str] = {}
+    for label in soup.find_all("label"):
+        target = label.get("for")
+        if target:
+            labels[target] = _clean_text(label)
+
+    entries: List[SelectorEntry] = []
+    for element in soup.find_all(True):
+        if element.name in SKIPPED_TAGS or any(parent.name in SKIPPED_TAGS for parent in element.parents):
+            continue
+        if element.name not in INTERACTIVE_TAGS and not element.get("id"):
+            continue
+        if element.name == "a" and not element.get("href"):
+            continue
+
+        element_id = element.get("id")
+        text = _clean_text(element) if element.name not in {"form", "select"} else None
+        entries.append(
+            SelectorEntry(
+                tag=element.name,
+                css=_css_path(soup, element),
+                id=element_id,
+                name=element.get("name"),
+                type=element.get("type") or ("submit" if element.name == "button" else None),
+                label=_label_for(element, labels),
+                text=text or None,
+                form=_form_of(element),
+                attributes={
+                    key: " ".join(value) if isinstance(value, list) else value
+                    for key, value in element.attrs.items()
+                    if key.startswith("data-") or key in EXTRA_ATTRIBUTES
+                },
+            )
+        )
+    return SelectorIndex(content_hash, entries)
+
+
+def _clean_text(element: Tag, limit: int = 80) -> str:
+    text = " ".join(element.get_text(" ", strip=True).split())
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+def _label_for(element: Tag, labels: Dict[str, str]) -> Optional[str]:
+    element_id = element.get("id")
+    if element_id and element_id in labels:
+        return labels[element_id]
+    wrapper = element.find_parent("label")
+    if wrapper is not None:
+        return _clean_text(wrapper)
+    return element.get("aria-label") or element.get("placeholder")
+
+
+def _form_of(element: Tag) -> Optional[str]:
+    if element.get("form"):
+        return element["form"]
+    form = element if element.name == "form" else element.find_parent("form")
+    if form is None:
+        return None
+    return form.get("id") or form.get("name") or "form"
+
+
+def _css_string(value: str) -> str:
+    """Quote an attribute value for a CSS selector."""
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\a ")
+    return f'"{escaped}"'
+
+
+def _css_path(soup: BeautifulSoup, element: Tag) -> str:
+    import soupsieve
+
+    # Ids and values come straight from the page: ":", ".", leading digits or quotes
+    # would otherwise make the selector invalid.
+    if element.get("id"):
+        return f"#{soupsieve.escape(element['id'])}"
+    candidates = []
+    name = element.get("name")
+    if name:
+        candidate = f"{element.name}[name={_css_string(name)}]"
+        if element.get("value") and element.get("type") in {"radio", "checkbox"}:
+            candidate += f"[value={_css_string(element['value'])}]"
+        candidates.append(candidate)
+    data_attributes = [
+        (key, value) for key, value in element.attrs.items() if key.startswith("data-") and isinstance(value, str)
+    ]
+    # Identifying attributes (data-name, data-product-id) survive layout changes better than prices.
+    data_attributes.sort(key=lambda item: not ("name" in item[0] or "id" in item[0]))
+    candidates.extend(f"{element.name}[{key}={_css_string(value)}]" for key, value in data_attributes)
+    for candidate in candidates:
+        if len(soup.select(candidate)) == 1:
+            return candidate
+
+    # Fall back to a structural path anchored at the nearest ancestor with an id.
+    segments = []
+    node: Optional[Tag] = element
+    while node is not None and node.name not in {"body", "html", "[document]"}:
+        if node is not element and node.get("id"):
+            segments.append(f"#{soupsieve.escape(node['id'])}")
+            break
+        siblings = node.parent.find_all(node.name, recursive=False) if node.parent else [node]
+        segment = node.name
+        if len(siblings) > 1:
+            # Tags compare equal by content, so locate this node by identity.
+            position = next(i for i, sibling in enumerate(siblings) if sibling is node)
+            segment += f":nth-of-type({position + 1})"
+        segments.append(segment)
+        node = node.parent
+    return " > ".join(reversed(segments))
+
+
+class SelectorIndexStore:
+    """Selector indexes keyed by the page's content hash, cached in memory and on disk."""
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.cache = LRUCache(32)
+
+    def load(self, path: Path, content_hash: Optional[str] = None) -> SelectorIndex:
+        if content_hash is not None:
+            cached = self._lookup(content_hash)
+            if cached is not None:
+                return cached
+
+        contents = path.read_bytes()
+        content_hash = hashlib.sha256(contents).hexdigest()
+        cached = self._lookup(content_hash)
+        if cached is not None:
+            return cached
+
+        index = build_selector_index(contents.decode("utf-8"), content_hash)
+        logger.info("Indexed %s interactive elements in %s", len(index.entries), path.name)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        target = self.directory / f"{content_hash}.json"
+        tmp_path = target.with_suffix(".json.tmp")
+        tmp_path.write_text(index.to_json(), encoding="utf-8")
+        os.replace(tmp_path, target)
+        self.cache.set(content_hash, index)
+        return index
+
+    def _lookup(self, content_hash: str) -> Optional[SelectorIndex]:
+        index = self.cache.get(content_hash)
+        if index is not None:
+            return index
+        stored = self.directory / f"{content_hash}.json"
+        if not stored.exists():
+            return None
+        index = SelectorIndex.from_json(stored.read_text(encoding="utf-8"))
+        self.cache.set(content_hash, index)
+        return index
+
+
+selector_index_store = SelectorIndexStore(settings.html_index_dir)
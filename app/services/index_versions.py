@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from dataclasses import replace
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+from app.core.config import settings
+from app.services.projects import ProjectStorage
+
+logger = logging.getLogger(__name__)
+
+# Indexes written before versioning existed live at the project's unversioned paths.
+LEGACY_VERSION = "legacy"
+_VERSION_RE = re.compile(r"^v(\d+)$")
+
+
+class IndexVersions:
+    """Blue/green index versions for one project.
+
+    Every build writes a complete index into a fresh ``index_versions/v<N>`` directory
+    (and, for Chroma, a collection suffixed ``_v<N>``). Once it is complete, the
+    ``ACTIVE`` pointer file is atomically replaced to name it. Readers resolve ``ACTIVE``
+    when they open a project, so they see either the old or the new index, never a mix.
+    """
+
+    def __init__(self, storage: ProjectStorage) -> None:
+        self.storage = storage
+        self.directory = storage.root / "index_versions"
+        self.pointer = self.directory / "ACTIVE"
+
+    def active(self) -> str:
+        try:
+            version = self.pointer.read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            return LEGACY_VERSION
+        return version if _VERSION_RE.match(version) else LEGACY_VERSION
+
+    def versions(self) -> List[str]:
+        if not self.directory.is_dir():
+            return []
+        found = [path.name for path in self.directory.iterdir() if path.is_dir() and _VERSION_RE.match(path.name)]
+        return sorted(found, key=_version_number)
+
+    def storage_for(self, version: str) -> ProjectStorage:
+        if version == LEGACY_VERSION:
+            return self.storage
+        directory = self.directory / version
+        return replace(
+            self.storage,
+            numpy_index_dir=directory / "numpy_index",
+            lexical_index_dir=directory / "lexical_index",
+            chroma_collection=f"{self.storage.chroma_collection}_{version}",
+        )
+
+    def manifest(self, version: str) -> Dict[str, Any]:
+        if version != LEGACY_VERSION:
+            try:
+                return json.loads((self.directory / version / "manifest.json").read_text(encoding="utf-8"))
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+        return {"version": version, "backend": settings.vector_backend}
+
+    def backend(self, version: str) -> str:
+        return self.manifest(version).get("backend", settings.vector_backend)
+
+    def create(self) -> str:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        numbers = [_version_number(version) for version in self.versions()]
+        number = max([_version_number(self.active()), *numbers]) + 1
+        while True:
+            version = f"v{number}"
+            try:
+                (self.directory / version).mkdir()
+            except FileExistsError:
+                number += 1
+                continue
+            return version
+
+    def activate(self, version: str, manifest: Dict[str, Any]) -> None:
+        manifest = {"version": version, "backend": settings.vector_backend, "created_at": time.time(), **manifest}
+        _write_atomic(self.directory / version / "manifest.json", json.dumps(manifest, indent=2))
+        _write_atomic(self.pointer, version)
+        logger.info("Project %s now serves index %s", self.storage.project_id, version)
+
+    def collect(self, in_use: Iterable[str]) -> List[str]:
+        """Remove versions older than the active one that no reader holds; returns what was removed."""
+        active = self.active()
+        if active == LEGACY_VERSION:
+            return []
+        in_use = set(in_use)
+        # Newer directories than ACTIVE belong to a build in progress.
+        candidates = [LEGACY_VERSION, *self.versions()]
+        removed = []
+        for version in candidates:
+            if version in in_use or _version_number(version) >= _version_number(active):
+                continue
+            if self.remove(version):
+                removed.append(version)
+        return removed
+
+    def remove(self, version: str) -> bool:
+        from app.services.vector_backends import drop_vector_index
+
+        storage = self.storage_for(version)
+        if version == LEGACY_VERSION and not self._legacy_exists():
+            return False
+        try:
+            drop_vector_index(storage, self.backend(version))
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Unable to drop index %s of project %s: %s", version, self.storage.project_id, exc)
+            return False
+        if version == LEGACY_VERSION:
+            shutil.rmtree(storage.lexical_index_dir, ignore_errors=True)
+            (self.directory / ".legacy-removed").touch()
+        else:
+            shutil.rmtree(self.directory / version, ignore_errors=True)
+        logger.info("Removed index %s of project %s", version, self.storage.project_id)
+        return True
+
+    def _legacy_exists(self) -> bool:
+        # Chroma has no cheap existence check for a collection, so legacy removal is recorded once done.
+        return not (self.directory / ".legacy-removed").exists()
+
+
+def _version_number(version: str) -> int:
+    match = _VERSION_RE.match(version)
+    return int(match.group(1)) if match else 0
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with tmp.open("w", encoding="utf-8") as handle:
+        handle.write(text)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp, path)
@@ -1,25 +1,56 @@
 from __future__ import annotations
 
+import asyncio
 import hashlib
 import logging
+import os
+import shutil
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, Iterable, List
-
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-import shutil
-
-from langchain_community.vectorstores import Chroma
-from langchain.schema import Document
+from typing import TYPE_CHECKING, Any, Awaitable, BinaryIO, Callable, Dict, Iterable, List, Optional
 
 from app.core.config import settings
-from app.services.document_loader import DocumentLoader
-from app.services.embeddings import get_embedding_service
+from app.services.document_loader import HTML_EXTENSIONS, DocumentLoader
+from app.services.embeddings import EmbeddingService, get_embedding_service
+from app.services.html_index import selector_index_store
+from app.services.index_versions import IndexVersions
+from app.services.projects import ProjectStorage, project_storage
 from app.services.vector_store import vector_store_manager
+from app.utils.metrics import timed
+
+if TYPE_CHECKING:
+    from langchain.schema import Document
+
+    from app.services.lexical_index import LexicalIndex
+    from app.services.vector_backends import VectorIndex
 
 logger = logging.getLogger(__name__)
 
+ProgressCallback = Callable[..., None]
+
+
+def _no_progress(**_: Any) -> None:
+    return None
+
+
+class UploadTooLargeError(ValueError):
+    pass
+
+
+class InvalidUploadError(ValueError):
+    pass
+
+
+@dataclass
+class StoredUpload:
+    filename: str
+    path: Path
+    size_bytes: int
+    content_hash: str
+    # Set while the upload is staged: the data sits here until ``publish_upload`` moves it to ``path``.
+    staged_path: Optional[Path] = None
+
 
 @dataclass
 class Chunk:
@@ -30,80 +61,362 @@ class Chunk:
     start_index: int
     doc_hash: str
 
+    def to_metadata(self) -> Dict[str, object]:
+        return {
+            "source": self.source,
+            "chunk_id": self.id,
+            "order": self.order,
+            "start_index": self.start_index,
+            "doc_hash": self.doc_hash,
+        }
+
+
+@dataclass
+class BuildSummary:
+    chunks_total: int
+    chunks_added: int
+    chunks_deleted: int
+    chunks_unchanged: int
+    incremental: bool
+    duration_seconds: float
+    failed_documents: Dict[str, str] = field(default_factory=dict)
+    index_version: Optional[str] = None
+
+
+@dataclass
+class ReindexSummary:
+    project_id: str
+    index_version: str
+    previous_version: str
+    chunks: int
+    index_params: Dict[str, Any]
+    index_size_bytes: int
+    build_seconds: float
+
 
 class KnowledgeBaseBuilder:
-    def __init__(self) -> None:
+    def __init__(self, embedding_service: Optional[EmbeddingService] = None) -> None:
         self.loader = DocumentLoader()
-        self.embedding_service = get_embedding_service()
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=settings.chunk_size,
-            chunk_overlap=settings.chunk_overlap,
-            add_start_index=True,
-        )
-        self.persist_directory = settings.chroma_dir
-        self.persist_directory.mkdir(parents=True, exist_ok=True)
+        # Both are resolved on first build so constructing a builder stays cheap.
+        self._embedding_service = embedding_service
+        self._text_splitter: Any = None
 
-    def save_upload(self, filename: str, contents: bytes) -> Path:
-        target = settings.upload_dir / filename
+    @property
+    def embedding_service(self) -> EmbeddingService:
+        if self._embedding_service is None:
+            self._embedding_service = get_embedding_service()
+        return self._embedding_service
+
+    @property
+    def text_splitter(self) -> Any:
+        if self._text_splitter is None:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+            self._text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=settings.chunk_size,
+                chunk_overlap=settings.chunk_overlap,
+                add_start_index=True,
+            )
+        return self._text_splitter
+
+    @text_splitter.setter
+    def text_splitter(self, splitter: Any) -> None:
+        self._text_splitter = splitter
+
+    def save_upload(self, filename: str, contents: bytes, project_id: Optional[str] = None) -> Path:
+        upload_dir = project_storage(project_id).upload_dir
+        upload_dir.mkdir(parents=True, exist_ok=True)
+        target = upload_dir / filename
         target.write_bytes(contents)
         return target
 
-    def build_knowledge_base(self, files: Dict[str, Path]) -> None:
-        documents = self.loader.load_documents(files)
+    async def save_upload_stream(
+        self,
+        filename: str,
+        read: Callable[[int], Awaitable[bytes]],
+        max_bytes: Optional[int] = None,
+        project_id: Optional[str] = None,
+        publish: bool = True,
+    ) -> StoredUpload:
+        """Stream an upload to disk in fixed-size chunks, hashing it on the fly.
+
+        Blocking file I/O runs in worker threads so the event loop keeps serving
+        other requests, and only one chunk is held in memory at a time. With
+        ``publish=False`` the file stays staged until ``publish_upload`` or
+        ``discard_upload``, so a multi-file request can be applied all or nothing.
+        """
+        safe_name = Path(filename or "").name
+        if safe_name in {"", ".", ".."}:
+            raise InvalidUploadError("Uploaded file is missing a filename.")
+
+        upload_dir = project_storage(project_id).upload_dir
+        await asyncio.to_thread(upload_dir.mkdir, parents=True, exist_ok=True)
+        target = upload_dir / safe_name
+        partial = target.with_name(f".{safe_name}.{os.getpid()}.{id(read)}.part")
+        hasher = hashlib.sha256()
+        size = 0
+
+        handle = await asyncio.to_thread(partial.open, "wb")
+        try:
+            while True:
+                chunk = await read(settings.upload_chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadTooLargeError(f"{safe_name} exceeds the upload limit of {max_bytes} bytes.")
+                await asyncio.to_thread(_write_chunk, handle, hasher, chunk)
+            await asyncio.to_thread(handle.close)
+        except BaseException:
+            handle.close()
+            partial.unlink(missing_ok=True)
+            raise
+
+        stored = StoredUpload(
+            filename=safe_name, path=target, size_bytes=size, content_hash=hasher.hexdigest(), staged_path=partial
+        )
+        if publish:
+            await self.publish_upload(stored)
+        return stored
+
+    async def publish_upload(self, stored: StoredUpload) -> None:
+        if stored.staged_path is not None:
+            await asyncio.to_thread(os.replace, stored.staged_path, stored.path)
+            stored.staged_path = None
+
+    async def discard_upload(self, stored: StoredUpload) -> None:
+        if stored.staged_path is not None:
+            await asyncio.to_thread(stored.staged_path.unlink, missing_ok=True)
+            stored.staged_path = None
+
+    def build_knowledge_base(
+        self,
+        files: Dict[str, Path],
+        incremental: Optional[bool] = None,
+        progress: Optional[ProgressCallback] = None,
+        project_id: Optional[str] = None,
+    ) -> BuildSummary:
+        if incremental is None:
+            incremental = settings.incremental_ingestion
+        progress = progress or _no_progress
+        storage = project_storage(project_id)
+
+        progress(stage="parsing", documents_total=len(files))
+        with timed("ingest_parse"):
+            loaded = self.loader.load_documents_parallel(files)
+        failed_documents = {result.filename: result.error for result in loaded if not result.ok}
+        for filename, error in failed_documents.items():
+            logger.warning("Skipping %s: %s", filename, error)
+        documents = [(result.filename, result.text) for result in loaded if result.ok]
+        with timed("ingest_html_index"):
+            self._index_html_pages(files, failed_documents)
+        progress(stage="chunking", documents_parsed=len(documents))
         chunks: List[Chunk] = []
         start = time.perf_counter()
 
-        for source_name, text in documents:
-            doc_hash = hashlib.md5(text.encode("utf-8")).hexdigest()
-            document_chunks = self.split_into_chunks(text, source_name, doc_hash)
-            for i, doc_chunk in enumerate(document_chunks):
-                chunk_text = doc_chunk.page_content.strip()
-                if not chunk_text:
-                    continue
-                start_index = int(doc_chunk.metadata.get("start_index", 0))
-                chunk_id = self._make_chunk_id(source_name, doc_hash, i, chunk_text)
-                chunks.append(
-                    Chunk(
-                        id=chunk_id,
-                        source=source_name,
-                        content=chunk_text,
-                        order=i,
-                        start_index=start_index,
-                        doc_hash=doc_hash,
+        with timed("ingest_split"):
+            for source_name, text in documents:
+                doc_hash = hashlib.md5(text.encode("utf-8")).hexdigest()
+                document_chunks = self.split_into_chunks(text, source_name, doc_hash)
+                for i, doc_chunk in enumerate(document_chunks):
+                    chunk_text = doc_chunk.page_content.strip()
+                    if not chunk_text:
+                        continue
+                    start_index = int(doc_chunk.metadata.get("start_index", 0))
+                    chunk_id = self._make_chunk_id(source_name, doc_hash, i, chunk_text)
+                    chunks.append(
+                        Chunk(
+                            id=chunk_id,
+                            source=source_name,
+                            content=chunk_text,
+                            order=i,
+                            start_index=start_index,
+                            doc_hash=doc_hash,
+                        )
                     )
-                )
 
         if not chunks:
+            if failed_documents:
+                details = "; ".join(f"{name}: {error}" for name, error in failed_documents.items())
+                raise ValueError(f"No textual content extracted from uploaded files. Failures: {details}")
             raise ValueError("No textual content extracted from uploaded files.")
 
-        if self.persist_directory.exists():
-            shutil.rmtree(self.persist_directory)
-        self.persist_directory.mkdir(parents=True, exist_ok=True)
+        from app.services.vector_backends import create_vector_index, hnsw_params
 
-        chroma = Chroma(
-            collection_name=settings.chroma_collection,
-            embedding_function=self.embedding_service,
-            persist_directory=str(self.persist_directory),
-        )
+        versions = IndexVersions(storage)
+        # Chunk IDs embed the document hash, so an unchanged document maps onto
+        # exactly the IDs already stored and only the delta needs embedding.
+        incoming_ids = {chunk.id for chunk in chunks}
+        with vector_store_manager.lease(storage.project_id) as active:
+            # The lease keeps the serving version from being collected while it is copied.
+            if incremental and versions.backend(active.version) != settings.vector_backend:
+                logger.info("Vector backend changed to %s; rebuilding from scratch", settings.vector_backend)
+                incremental = False
+            stored_sources = self._stored_chunk_sources(active.vector_index) if incremental else {}
+            if stored_sources is None:
+                # Copying records we cannot see would keep chunks of changed or removed documents forever.
+                incremental = False
+                stored_sources = {}
+            new_chunks = [chunk for chunk in chunks if chunk.id not in stored_sources]
+            # A document that failed to parse this time keeps its previously stored chunks.
+            stale_ids = sorted(
+                chunk_id
+                for chunk_id, source in stored_sources.items()
+                if chunk_id not in incoming_ids and source not in failed_documents
+            )
+            if incremental and not new_chunks and not stale_ids:
+                return self._summarize(storage, active.version, chunks, new_chunks, stale_ids, True, start, failed_documents)
+
+            # Blue/green: the new index is built beside the serving one and only becomes
+            # visible when ACTIVE is switched, so queries never see a half-built index.
+            index_params = None
+            if settings.vector_backend == "chroma":
+                # Parameters tuned through /kb/reindex stick until the next full rebuild.
+                carried = versions.manifest(active.version).get("index_params") if incremental else None
+                index_params = carried or hnsw_params(storage.project_id)
+            version = versions.create()
+            try:
+                index = create_vector_index(
+                    self.embedding_service, storage=versions.storage_for(version), index_params=index_params
+                )
+                if incremental:
+                    with timed("ingest_copy"):
+                        index.copy_from(active.vector_index)
+            except BaseException:
+                versions.remove(version)
+                raise
+
+        try:
+            progress(stage="embedding", chunks_total=len(chunks), chunks_to_embed=len(new_chunks))
+            if stale_ids:
+                with timed("ingest_vector_delete"):
+                    for batch_start in range(0, len(stale_ids), settings.ingestion_batch_size):
+                        index.delete(stale_ids[batch_start : batch_start + settings.ingestion_batch_size])
+
+            for batch_start in range(0, len(new_chunks), settings.ingestion_batch_size):
+                batch = new_chunks[batch_start : batch_start + settings.ingestion_batch_size]
+                texts = [chunk.content for chunk in batch]
+                with timed("ingest_embed"):
+                    embeddings = self.embedding_service.embed_documents(texts)
+                with timed("ingest_vector_upsert"):
+                    index.upsert(
+                        ids=[chunk.id for chunk in batch],
+                        texts=texts,
+                        metadatas=[chunk.to_metadata() for chunk in batch],
+                        embeddings=embeddings,
+                    )
+                progress(chunks_embedded=batch_start + len(batch))
+            progress(stage="persisting")
+            with timed("ingest_persist"):
+                index.persist()
+            with timed("ingest_lexical_index"):
+                self._build_lexical_index(
+                    index, chunks, stored_sources, stale_ids, versions.storage_for(version)
+                )
+            versions.activate(
+                version, {"chunks": index.count(), "source_version": active.version, "index_params": index_params}
+            )
+        except BaseException:
+            versions.remove(version)
+            raise
+
+        vector_store_manager.reset(storage.project_id)
+        # Versions still leased by in-flight queries are collected when their last lease is released.
+        vector_store_manager.collect_garbage(storage.project_id)
+        return self._summarize(storage, version, chunks, new_chunks, stale_ids, incremental, start, failed_documents)
 
-        chroma.add_texts(
-            texts=[chunk.content for chunk in chunks],
-            metadatas=[
-                {
-                    "source": chunk.source,
-                    "chunk_id": chunk.id,
-                    "order": chunk.order,
-                    "start_index": chunk.start_index,
-                    "doc_hash": chunk.doc_hash,
-                }
-                for chunk in chunks
-            ],
-            ids=[chunk.id for chunk in chunks],
+    def reindex(
+        self, index_params: Optional[Dict[str, Any]] = None, project_id: Optional[str] = None
+    ) -> ReindexSummary:
+        """Rebuild the project's Chroma index with new HNSW parameters from its stored embeddings.
+
+        Nothing is re-embedded: vectors, documents and metadata are copied into a new index
+        version, which is swapped in like any other build.
+        """
+        from app.services.vector_backends import ChromaIndex, create_vector_index, hnsw_params
+
+        storage = project_storage(project_id)
+        versions = IndexVersions(storage)
+        params = hnsw_params(storage.project_id, index_params)
+        start = time.perf_counter()
+        with vector_store_manager.lease(storage.project_id) as active:
+            if not isinstance(active.vector_index, ChromaIndex):
+                raise ValueError("Reindexing with HNSW parameters needs VECTOR_BACKEND=chroma.")
+            if active.vector_index.count() == 0:
+                raise ValueError("Knowledge base is empty; ingest documents first.")
+            version = versions.create()
+            try:
+                target = versions.storage_for(version)
+                # Copying never embeds, so the index needs no embedding function to build.
+                index = create_vector_index(None, "chroma", target, index_params=params)
+                with timed("reindex_build"):
+                    index.copy_from(active.vector_index)
+                if active.storage.lexical_index_dir.is_dir():
+                    shutil.copytree(active.storage.lexical_index_dir, target.lexical_index_dir)
+                versions.activate(
+                    version, {"chunks": index.count(), "source_version": active.version, "index_params": params}
+                )
+            except BaseException:
+                versions.remove(version)
+                raise
+        build_seconds = time.perf_counter() - start
+
+        vector_store_manager.reset(storage.project_id)
+        vector_store_manager.collect_garbage(storage.project_id)
+        summary = ReindexSummary(
+            project_id=storage.project_id,
+            index_version=version,
+            previous_version=active.version,
+            chunks=index.count(),
+            index_params=params,
+            index_size_bytes=index.size_bytes(),
+            build_seconds=build_seconds,
+        )
+        logger.info(
+            "Reindexed project %s into %s (%s chunks, %s bytes) in %.2fs with %s",
+            summary.project_id,
+            version,
+            summary.chunks,
+            summary.index_size_bytes,
+            build_seconds,
+            params,
         )
-        chroma.persist()
+        return summary
+
+    def _summarize(
+        self,
+        storage: ProjectStorage,
+        version: str,
+        chunks: List[Chunk],
+        new_chunks: List[Chunk],
+        stale_ids: List[str],
+        incremental: bool,
+        start: float,
+        failed_documents: Dict[str, str],
+    ) -> BuildSummary:
         build_duration = time.perf_counter() - start
-        logger.info("Persisted %s chunks to Chroma in %.2fs", len(chunks), build_duration)
-        vector_store_manager.reset()
+        summary = BuildSummary(
+            chunks_total=len(chunks),
+            chunks_added=len(new_chunks),
+            chunks_deleted=len(stale_ids),
+            chunks_unchanged=len(chunks) - len(new_chunks),
+            incremental=incremental,
+            duration_seconds=build_duration,
+            failed_documents=failed_documents,
+            index_version=version,
+        )
+        logger.info(
+            "Project %s serves index %s: %s chunks in %.2fs (added=%s, deleted=%s, unchanged=%s, incremental=%s)",
+            storage.project_id,
+            version,
+            summary.chunks_total,
+            build_duration,
+            summary.chunks_added,
+            summary.chunks_deleted,
+            summary.chunks_unchanged,
+            incremental,
+        )
+        return summary
 
     def split_into_chunks(self, text: str, source_name: str, doc_hash: str) -> List[Document]:
         base_metadata = {"source": source_name, "doc_hash": doc_hash}
@@ -112,3 +425,46 @@ class KnowledgeBaseBuilder:
     def _make_chunk_id(self, source: str, doc_hash: str, index: int, content: str) -> str:
         digest = hashlib.md5(f"{doc_hash}:{index}:{content[:50]}".encode("utf-8")).hexdigest()
         return f"{source}-{index}-{digest}"
+
+    def _build_lexical_index(
+        self,
+        index: VectorIndex,
+        chunks: List[Chunk],
+        stored_sources: Dict[str, str],
+        stale_ids: List[str],
+        storage: ProjectStorage,
+    ) -> None:
+        # The lexical index always covers the whole collection: this build's chunks
+        # plus any stored chunks kept because their document failed to parse.
+        ids = [chunk.id for chunk in chunks]
+        texts = [chunk.content for chunk in chunks]
+        incoming = set(ids)
+        stale = set(stale_ids)
+        kept_ids = [chunk_id for chunk_id in stored_sources if chunk_id not in incoming and chunk_id not in stale]
+        for chunk_id, document in index.get_by_ids(kept_ids).items():
+            ids.append(chunk_id)
+            texts.append(document.page_content)
+        from app.services.lexical_index import LexicalIndex
+
+        LexicalIndex.build(ids, texts).save(storage.lexical_index_dir)
+
+    def _index_html_pages(self, files: Dict[str, Path], failed_documents: Dict[str, str]) -> None:
+        for filename, path in files.items():
+            if path.suffix.lower() not in HTML_EXTENSIONS or filename in failed_documents:
+                continue
+            try:
+                selector_index_store.load(path)
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Unable to build selector index for %s: %s", filename, exc)
+
+    def _stored_chunk_sources(self, index: VectorIndex) -> Optional[Dict[str, str]]:
+        try:
+            return index.stored_sources()
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Unable to read stored chunk IDs, rebuilding from scratch: %s", exc)
+            return None
+
+
+def _write_chunk(handle: BinaryIO, hasher: Any, chunk: bytes) -> None:
+    hasher.update(chunk)
+    handle.write(chunk)
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Deque, Dict, Optional, TypeVar
+
+from app.core.config import settings
+from app.services.ingestion import BuildSummary
+from app.services.projects import project_storage
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+TERMINAL_STATUSES = {"succeeded", "failed"}
+
+
+@dataclass
+class IngestionJob:
+    id: str
+    project_id: str
+    collection: str
+    files: Dict[str, Path]
+    incremental: Optional[bool] = None
+    status: str = "queued"
+    stage: str = "queued"
+    documents_total: int = 0
+    documents_parsed: int = 0
+    chunks_total: int = 0
+    chunks_to_embed: int = 0
+    chunks_embedded: int = 0
+    timings: Dict[str, float] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    summary: Optional[BuildSummary] = None
+    future: Optional[Future] = field(default=None, repr=False)
+    _stage_started: float = field(default_factory=time.perf_counter, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def update(self, stage: Optional[str] = None, **counters: int) -> None:
+        """Progress callback handed to ``KnowledgeBaseBuilder.build_knowledge_base``."""
+        with self._lock:
+            if stage is not None and stage != self.stage:
+                self._close_stage()
+                self.stage = stage
+            for name, value in counters.items():
+                setattr(self, name, value)
+
+    def mark_running(self) -> None:
+        with self._lock:
+            self.status = "running"
+            self.started_at = time.time()
+            self._close_stage()
+
+    def mark_finished(self, summary: Optional[BuildSummary] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._close_stage()
+            self.status = "failed" if error else "succeeded"
+            self.stage = self.status
+            self.summary = summary
+            self.error = error
+            self.finished_at = time.time()
+
+    def _close_stage(self) -> None:
+        now = time.perf_counter()
+        self.timings[self.stage] = self.timings.get(self.stage, 0.0) + (now - self._stage_started)
+        self._stage_started = now
+
+
+class IngestionJobManager:
+    """Runs knowledge-base builds on a worker pool, one build per collection at a time."""
+
+    def __init__(self, runner: Callable[[IngestionJob], BuildSummary], max_workers: Optional[int] = None) -> None:
+        self.runner = runner
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or settings.ingestion_workers,
+            thread_name_prefix="ingestion",
+        )
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        # Work waiting per collection; the head of each queue is the one running.
+        self._queues: Dict[str, Deque[Callable[[], None]]] = {}
+
+    def submit(
+        self,
+        files: Dict[str, Path],
+        incremental: Optional[bool] = None,
+        collection: Optional[str] = None,
+        project_id: Optional[str] = None,
+    ) -> IngestionJob:
+        storage = project_storage(project_id)
+        job = IngestionJob(
+            id=uuid.uuid4().hex,
+            project_id=storage.project_id,
+            collection=collection or storage.chroma_collection,
+            files=dict(files),
+            incremental=incremental,
+            documents_total=len(files),
+            future=Future(),
+        )
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._enqueue(job.collection, lambda: self._run(job))
+        return job
+
+    def submit_exclusive(self, project_id: Optional[str], action: Callable[[], T]) -> "Future[T]":
+        """Queue ``action`` behind the project's builds; it runs when no build of its collection does."""
+        future: "Future[T]" = Future()
+
+        def run() -> None:
+            try:
+                future.set_result(action())
+            except BaseException as exc:  # noqa: BLE001
+                future.set_exception(exc)
+
+        self._enqueue(project_storage(project_id).chroma_collection, run)
+        return future
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def _enqueue(self, collection: str, work: Callable[[], None]) -> None:
+        # Work for one collection is chained rather than locked, so builds never
+        # interleave and a queued build never holds a worker that other collections could use.
+        with self._jobs_lock:
+            queue = self._queues.setdefault(collection, deque())
+            queue.append(work)
+            if len(queue) > 1:
+                return
+        self._executor.submit(self._drain, collection)
+
+    def _drain(self, collection: str) -> None:
+        with self._jobs_lock:
+            work = self._queues[collection][0]
+        try:
+            work()
+        finally:
+            with self._jobs_lock:
+                queue = self._queues[collection]
+                queue.popleft()
+                if not queue:
+                    del self._queues[collection]
+            if queue:
+                self._executor.submit(self._drain, collection)
+
+    def _run(self, job: IngestionJob) -> None:
+        job.mark_running()
+        try:
+            summary = self.runner(job)
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("Ingestion job %s failed", job.id)
+            job.mark_finished(error=str(exc))
+            job.future.set_result(None)
+            return
+        job.mark_finished(summary=summary)
+        logger.info("Ingestion job %s finished in %.2fs", job.id, job.finished_at - job.started_at)
+        job.future.set_result(summary)
+
+    def _prune(self) -> None:
+        overflow = len(self._jobs) - settings.ingestion_job_history
+        if overflow <= 0:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done][:overflow]:
+            del self._jobs[job_id]
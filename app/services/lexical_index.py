@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Keeps identifiers such as SAVE15, apply_coupon, /submit_order or #d90429 intact
+# and additionally indexes their alphanumeric parts.
+_COMPOUND_RE = re.compile(r"[#/]?[A-Za-z0-9_]+(?:[-./:][A-Za-z0-9_]+)*")
+_PART_RE = re.compile(r"[A-Za-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = _COMPOUND_RE.findall(text.lower())
+    extra: List[str] = []
+    for compound in tokens:
+        if compound.isalnum():
+            continue
+        bare = compound.lstrip("#/")
+        if bare != compound:
+            extra.append(bare)
+        parts = _PART_RE.findall(bare)
+        if len(parts) > 1:
+            extra.extend(parts)
+    return tokens + extra
+
+
+class LexicalIndex:
+    """Compact BM25 inverted index stored as CSR-style NumPy arrays.
+
+    Postings for term ``t`` live in ``doc_ids[offsets[t]:offsets[t + 1]]`` with matching
+    term frequencies, so scoring a query is a handful of vectorized gathers and one
+    ``np.bincount`` regardless of corpus size.
+    """
+
+    def __init__(
+        self,
+        chunk_ids: List[str],
+        vocabulary: Dict[str, int],
+        offsets: np.ndarray,
+        doc_ids: np.ndarray,
+        term_freqs: np.ndarray,
+        doc_lengths: np.ndarray,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ) -> None:
+        self.chunk_ids = chunk_ids
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        num_docs = len(chunk_ids)
+        doc_freqs = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        average_length = float(doc_lengths.mean()) if num_docs else 0.0
+        self.length_norm = (k1 * (1.0 - b + b * doc_lengths / max(average_length, 1e-9))).astype(np.float32)
+
+    @classmethod
+    def build(cls, chunk_ids: Sequence[str], texts: Sequence[str]) -> "LexicalIndex":
+        vocabulary: Dict[str, int] = {}
+        term_column: List[int] = []
+        doc_column: List[int] = []
+        tf_column: List[int] = []
+        doc_lengths = np.zeros(len(texts), dtype=np.float32)
+        for doc_index, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths[doc_index] = sum(counts.values())
+            term_column.extend(vocabulary.setdefault(token, len(vocabulary)) for token in counts)
+            doc_column.extend([doc_index] * len(counts))
+            tf_column.extend(counts.values())
+
+        terms = np.asarray(term_column, dtype=np.int64)
+        order = np.argsort(terms, kind="stable")
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(terms, minlength=len(vocabulary)))
+        doc_ids = np.asarray(doc_column, dtype=np.int32)[order]
+        term_freqs = np.asarray(tf_column, dtype=np.float32)[order]
+        return cls(list(chunk_ids), vocabulary, offsets, doc_ids, term_freqs, doc_lengths)
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        term_ids = sorted({self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary})
+        if not term_ids or k <= 0:
+            return []
+
+        spans = [np.arange(self.offsets[term_id], self.offsets[term_id + 1]) for term_id in term_ids]
+        positions = np.concatenate(spans)
+        idf = np.repeat(self.idf[term_ids], [len(span) for span in spans])
+        docs = self.doc_ids[positions]
+        tf = self.term_freqs[positions]
+        contributions = idf * tf * (self.k1 + 1.0) / (tf + self.length_norm[docs])
+        scores = np.bincount(docs, weights=contributions, minlength=len(self.chunk_ids))
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        ordered = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.chunk_ids[doc], float(scores[doc])) for doc in ordered]
+
+    def save(self, directory: Path) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        arrays_tmp = directory / "postings.npz.tmp"
+        meta_tmp = directory / "lexicon.json.tmp"
+        with arrays_tmp.open("wb") as handle:
+            np.savez(
+                handle,
+                offsets=self.offsets,
+                doc_ids=self.doc_ids,
+                term_freqs=self.term_freqs,
+                doc_lengths=self.doc_lengths,
+            )
+        meta_tmp.write_text(
+            json.dumps({"chunk_ids": self.chunk_ids, "vocabulary": self.vocabulary, "k1": self.k1, "b": self.b}),
+            encoding="utf-8",
+        )
+        os.replace(arrays_tmp, directory / "postings.npz")
+        os.replace(meta_tmp, directory / "lexicon.json")
+
+    @classmethod
+    def load(cls, directory: Path) -> Optional["LexicalIndex"]:
+        arrays_path = directory / "postings.npz"
+        meta_path = directory / "lexicon.json"
+        if not arrays_path.exists() or not meta_path.exists():
+            return None
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        with np.load(arrays_path) as arrays:
+            return cls(
+                meta["chunk_ids"],
+                meta["vocabulary"],
+                arrays["offsets"],
+                arrays["doc_ids"],
+                arrays["term_freqs"],
+                arrays["doc_lengths"],
+                k1=meta.get("k1", 1.2),
+                b=meta.get("b", 0.75),
+            )
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -1,32 +1,236 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass, field
 from functools import lru_cache
-from typing import Optional
-
-from langchain_groq import ChatGroq
+from typing import TYPE_CHECKING, Any, AsyncIterator, Deque, Dict, List, Optional, Sequence, Tuple
 
 from app.core.config import settings
+from app.services.context_packer import estimate_tokens
+from app.services.llm_cache import LLMResponseCache
+from app.utils.metrics import (
+    LLM_HEDGES,
+    LLM_ROUTED,
+    observe_stage,
+    record_llm_tokens,
+    register_cache,
+    register_scheduler,
+    timed,
+)
+
+if TYPE_CHECKING:
+    from langchain.schema import BaseMessage
+    from langchain_groq import ChatGroq
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class ModelRoute:
+    """One model endpoint that routing can send prompts to."""
+
+    model: str
+    max_prompt_tokens: int
+    client: Any = None
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=200))
+
+    def hedge_delay(self) -> float:
+        # Until there is a latency history, hedge only calls that are clearly slow.
+        if len(self.latencies) < settings.llm_hedge_min_samples:
+            return settings.llm_hedge_initial_delay_seconds
+        import numpy as np
+
+        delay = float(np.percentile(self.latencies, settings.llm_hedge_percentile))
+        return max(delay, settings.llm_hedge_min_delay_seconds)
+
+
 class LLMService:
     def __init__(self) -> None:
         if not settings.groq_api_key:
             raise ValueError("GROQ_API_KEY is not set. Please configure it in the environment.")
+        import httpx
+        from langchain_groq import ChatGroq
+
+        from app.services.llm_scheduler import RateLimitScheduler
+
         self.model_name = settings.groq_model
-        self.client = ChatGroq(
-            groq_api_key=settings.groq_api_key,
-            model_name=self.model_name,
-            temperature=0.2,
-            max_tokens=None,
+        self.temperature = 0.2
+        # One pooled connection set shared by every request; keep-alive avoids a TLS
+        # handshake per generation. Retries are handled by the scheduler, not the SDK.
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.llm_max_concurrency,
+                max_keepalive_connections=settings.llm_max_concurrency,
+            ),
+            timeout=settings.llm_request_timeout,
         )
-        logger.info("Initialized Groq Chat model %s", self.model_name)
+        self.routes = _configured_routes()
+        for route in self.routes:
+            route.client = ChatGroq(
+                groq_api_key=settings.groq_api_key,
+                model_name=route.model,
+                temperature=self.temperature,
+                max_tokens=None,
+                max_retries=0,
+                http_async_client=self.http_client,
+            )
+        self.client = self.route_for(0).client
+        # Routes share one scheduler: they draw on the same account quota, and hedges count against it too.
+        self.scheduler = RateLimitScheduler(
+            requests_per_minute=settings.llm_requests_per_minute,
+            tokens_per_minute=settings.llm_tokens_per_minute,
+            max_concurrency=settings.llm_max_concurrency,
+            max_retries=settings.llm_max_retries,
+            backoff_base=settings.llm_backoff_base_seconds,
+            backoff_max=settings.llm_backoff_max_seconds,
+        )
+        self.response_cache: Optional[LLMResponseCache] = LLMResponseCache() if settings.llm_cache_enabled else None
+        register_scheduler("groq", self.scheduler.stats)
+        if self.response_cache is not None:
+            register_cache("llm_responses", self.response_cache.stats)
+        logger.info("Initialized Groq Chat models %s", ", ".join(route.model for route in self.routes))
 
     def get_model(self) -> ChatGroq:
         return self.client
 
+    def route_for(self, prompt_tokens: int) -> ModelRoute:
+        for route in self.routes:
+            if prompt_tokens <= route.max_prompt_tokens:
+                return route
+        return self.routes[-1]
+
+    def model_for(self, messages: Sequence[BaseMessage]) -> str:
+        """Model that will answer ``messages``; part of the response cache key."""
+        return self.route_for(self._prompt_tokens(messages)).model
+
+    async def ainvoke(self, messages: Sequence[BaseMessage]) -> str:
+        prompt_tokens = self._prompt_tokens(messages)
+        route = self.route_for(prompt_tokens)
+        LLM_ROUTED.labels(route.model).inc()
+        primary = asyncio.create_task(self._invoke(route, messages, prompt_tokens))
+        if not settings.llm_hedge_enabled:
+            return await primary
+
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=route.hedge_delay())
+        except asyncio.CancelledError:
+            # asyncio.wait leaves the awaited task running; it would keep its scheduler slot.
+            primary.cancel()
+            raise
+        # A queued scheduler means we are at the rate limit; a duplicate would only add to the queue.
+        if done or self.scheduler.queued > 0:
+            return await primary
+        LLM_HEDGES.labels("fired").inc()
+        hedge = asyncio.create_task(self._invoke(route, messages, prompt_tokens))
+        return await _first_valid({primary: "primary", hedge: "hedge"})
+
+    async def _invoke(self, route: ModelRoute, messages: Sequence[BaseMessage], prompt_tokens: int) -> str:
+        async def call() -> Any:
+            # Only the provider's own time feeds the hedge delay, not queueing or retry backoff.
+            started = time.perf_counter()
+            response = await route.client.ainvoke(messages)
+            route.latencies.append(time.perf_counter() - started)
+            return response
+
+        with timed("llm_request"):
+            response = await self.scheduler.run(
+                call, prompt_tokens + settings.llm_expected_completion_tokens, usage=_total_tokens
+            )
+        text = response.content if hasattr(response, "content") else str(response)
+        record_llm_tokens(*(_token_counts(response) or (prompt_tokens, estimate_tokens(text))))
+        return text
+
+    async def astream(self, messages: Sequence[BaseMessage]) -> AsyncIterator[str]:
+        # Streams are routed by size but never hedged: tokens already sent cannot be taken back.
+        prompt_tokens = self._prompt_tokens(messages)
+        route = self.route_for(prompt_tokens)
+        LLM_ROUTED.labels(route.model).inc()
+        started = time.perf_counter()
+        first_token = True
+        pieces: List[str] = []
+        reported: Optional[Tuple[int, int]] = None
+        try:
+            async for chunk in self.scheduler.stream(
+                lambda: route.client.astream(messages), prompt_tokens + settings.llm_expected_completion_tokens
+            ):
+                reported = _token_counts(chunk) or reported
+                text = chunk.content if hasattr(chunk, "content") else str(chunk)
+                if text:
+                    if first_token:
+                        observe_stage("llm_first_token", time.perf_counter() - started)
+                        first_token = False
+                    pieces.append(text)
+                    yield text
+        finally:
+            # Runs on normal completion and when the consumer stops early, so partial streams count too.
+            observe_stage("llm_stream", time.perf_counter() - started)
+            record_llm_tokens(*(reported or (prompt_tokens, estimate_tokens("".join(pieces)))))
+
+    async def aclose(self) -> None:
+        await self.http_client.aclose()
+
+    @staticmethod
+    def _prompt_tokens(messages: Sequence[BaseMessage]) -> int:
+        return sum(estimate_tokens(str(message.content)) for message in messages)
+
+
+def _configured_routes() -> List[ModelRoute]:
+    if not settings.llm_routes:
+        return [ModelRoute(settings.groq_model, max_prompt_tokens=sys.maxsize)]
+    routes = []
+    for entry in settings.llm_routes:
+        if "model" not in entry:
+            raise ValueError(f"LLM route {entry} has no model")
+        routes.append(ModelRoute(str(entry["model"]), int(entry.get("max_prompt_tokens", sys.maxsize))))
+    return routes
+
+
+async def _first_valid(tasks: Dict[asyncio.Task, str]) -> str:
+    """Answer of whichever task first returns non-empty text; the other one is cancelled."""
+    pending = set(tasks)
+    fallback: Optional[str] = None
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = error or task.exception()
+                elif task.result().strip():
+                    LLM_HEDGES.labels(tasks[task]).inc()
+                    return task.result()
+                else:
+                    fallback = task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+    if fallback is not None:
+        return fallback
+    raise error  # type: ignore[misc]
+
+
+def _total_tokens(response: Any) -> Optional[int]:
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return usage.get("total_tokens")
+    token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+    return token_usage.get("total_tokens")
+
+
+def _token_counts(response: Any) -> Optional[Tuple[int, int]]:
+    """(prompt, completion) tokens as reported by the provider, if the response carries them."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage and usage.get("input_tokens") is not None:
+        return int(usage["input_tokens"]), int(usage.get("output_tokens") or 0)
+    token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+    if token_usage.get("prompt_tokens") is not None:
+        return int(token_usage["prompt_tokens"]), int(token_usage.get("completion_tokens") or 0)
+    return None
+
 
 @lru_cache()
 def get_llm_service() -> LLMService:
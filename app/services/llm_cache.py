@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from typing import TYPE_CHECKING, Dict, Optional, Sequence
+
+from app.core.config import settings
+from app.utils.disk_cache import DiskLRUCache
+
+if TYPE_CHECKING:
+    from langchain.schema import BaseMessage
+
+logger = logging.getLogger(__name__)
+
+
+class LLMResponseCache:
+    """Disk-backed cache of completions keyed by model, temperature and the full message list."""
+
+    def __init__(self) -> None:
+        self.store = DiskLRUCache(
+            settings.llm_cache_path,
+            max_entries=settings.llm_cache_max_entries,
+            ttl_seconds=settings.llm_cache_ttl_seconds,
+        )
+
+    def key_for(self, model_name: str, temperature: float, messages: Sequence[BaseMessage]) -> str:
+        payload = json.dumps(
+            {
+                "model": model_name,
+                "temperature": temperature,
+                "messages": [[message.type, message.content] for message in messages],
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.store.get(key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, output: str) -> None:
+        self.store.set(key, output.encode("utf-8"))
+
+    def stats(self) -> Dict[str, int]:
+        return self.store.stats()
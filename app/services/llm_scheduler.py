@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+
+import groq
+
+from app.utils.metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_ERRORS = (
+    groq.RateLimitError,
+    groq.APIConnectionError,
+    groq.APITimeoutError,
+    groq.InternalServerError,
+)
+
+
+class TokenBucket:
+    """Continuously refilling budget of ``per_minute`` units; ``0`` means unlimited."""
+
+    def __init__(self, per_minute: int) -> None:
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        if self.unlimited:
+            return 0.0
+        self.refill()
+        # A single request larger than the whole budget still goes through once the bucket is full.
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def consume(self, amount: float) -> None:
+        if not self.unlimited:
+            self.level -= min(amount, self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        if not self.unlimited:
+            self.refill()
+            self.level = min(self.capacity, self.level - delta)
+
+
+class RateLimitScheduler:
+    """Admits LLM calls in FIFO order within requests-per-minute and tokens-per-minute budgets.
+
+    Waiters queue on a single lock (asyncio locks wake waiters in arrival order), so a large
+    request at the head is never starved by smaller ones behind it. A 429 pauses admission
+    for everyone until the provider's ``retry-after`` has elapsed instead of letting the
+    queued requests fail one after another.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        max_concurrency: int,
+        max_retries: int,
+        backoff_base: float,
+        backoff_max: float,
+    ) -> None:
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.paused_until = 0.0
+        self.queued = 0
+        self.in_flight = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self._admission: Optional[asyncio.Lock] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def run(self, call: Callable[[], Awaitable[T]], estimated_tokens: int, usage: Callable[[T], Optional[int]]) -> T:
+        """Run ``call`` under the budgets, retrying transient failures with jittered backoff.
+
+        ``usage`` extracts the real token count from the result so the token budget can be
+        corrected for the difference from ``estimated_tokens``.
+        """
+        attempt = 0
+        while True:
+            await self._admit(estimated_tokens)
+            try:
+                result = await call()
+            except RETRYABLE_ERRORS as exc:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(exc, attempt)
+            else:
+                actual = usage(result)
+                if actual is not None:
+                    self.tokens.adjust(actual - estimated_tokens)
+                return result
+            finally:
+                self._release()
+            attempt += 1
+            await self._backoff(delay, attempt)
+
+    async def stream(self, start: Callable[[], AsyncIterator[T]], estimated_tokens: int) -> AsyncIterator[T]:
+        """Like :meth:`run` for streamed responses; only failures before the first chunk are retried."""
+        attempt = 0
+        while True:
+            await self._admit(estimated_tokens)
+            started = False
+            try:
+                async for item in start():
+                    started = True
+                    yield item
+                return
+            except RETRYABLE_ERRORS as exc:
+                if started or attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(exc, attempt)
+            finally:
+                self._release()
+            attempt += 1
+            await self._backoff(delay, attempt)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self.queued,
+            "in_flight": self.in_flight,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+        }
+
+    async def _admit(self, estimated_tokens: int) -> None:
+        if self._admission is None:
+            self._admission = asyncio.Lock()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        self.queued += 1
+        enqueued = time.perf_counter()
+        try:
+            async with self._admission:
+                while True:
+                    delay = max(
+                        self.paused_until - time.monotonic(),
+                        self.requests.wait_time(1),
+                        self.tokens.wait_time(estimated_tokens),
+                    )
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
+                self.requests.consume(1)
+                self.tokens.consume(estimated_tokens)
+                # Taking the concurrency slot while still holding the lock keeps admission FIFO.
+                await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+        observe_stage("llm_queue_wait", time.perf_counter() - enqueued)
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._slots.release()
+
+    async def _backoff(self, delay: float, attempt: int) -> None:
+        self.retries += 1
+        logger.warning("LLM call failed; retry %s/%s in %.1fs", attempt, self.max_retries, delay)
+        await asyncio.sleep(delay)
+
+    def _retry_delay(self, exc: Exception, attempt: int) -> float:
+        retry_after = _retry_after_seconds(exc)
+        if isinstance(exc, groq.RateLimitError):
+            self.rate_limited += 1
+            # The provider's view of our quota is authoritative; drain the local request budget too.
+            self.requests.level = min(self.requests.level, 0.0)
+            if retry_after is not None:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.backoff_base)
+        # Full jitter: spread retries so a burst of failures does not come back in lockstep.
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+
+def _retry_after_seconds(exc: Exception) -> Optional[float]:
+    response: Any = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) * scale)
+        except ValueError:
+            continue
+    return None
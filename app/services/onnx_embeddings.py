@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import json
+import logging
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INPUT_NAMES = ("input_ids", "attention_mask", "token_type_ids")
+
+
+def export_onnx_model(model_name: str, directory: Path) -> None:
+    """Export a sentence-transformers model's transformer to ONNX.
+
+    Needs torch and sentence-transformers once, at export time; inference afterwards only
+    uses onnxruntime and the fast tokenizer saved next to the model.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    directory.mkdir(parents=True, exist_ok=True)
+    sentence_model = SentenceTransformer(model_name, device="cpu")
+    transformer = sentence_model[0].auto_model.eval()
+    tokenizer = sentence_model.tokenizer
+    pooling = sentence_model[1].get_pooling_mode_str() if len(sentence_model) > 1 else "mean"
+    if pooling not in {"mean", "cls"}:
+        raise ValueError(f"Unsupported pooling mode for ONNX export: {pooling}")
+
+    sample = tokenizer(["onnx export sample"], return_tensors="pt")
+    input_names = [name for name in INPUT_NAMES if name in sample]
+    fp32_path = directory / "model.onnx"
+    logger.info("Exporting %s to %s", model_name, fp32_path)
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            str(fp32_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in [*input_names, "last_hidden_state"]},
+            opset_version=14,
+        )
+    tokenizer.save_pretrained(str(directory))
+    (directory / "export.json").write_text(
+        json.dumps(
+            {
+                "model_name": model_name,
+                "max_seq_length": sentence_model.max_seq_length,
+                "pooling": pooling,
+                "pad_token_id": tokenizer.pad_token_id or 0,
+                "pad_token": tokenizer.pad_token or "[PAD]",
+            }
+        ),
+        encoding="utf-8",
+    )
+
+
+def quantize_onnx_model(directory: Path) -> None:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    # Dynamic quantization: int8 weights, activations quantized per batch at run time.
+    logger.info("Quantizing %s to int8", directory / "model.onnx")
+    quantize_dynamic(str(directory / "model.onnx"), str(directory / "model-int8.onnx"), weight_type=QuantType.QInt8)
+
+
+class OnnxEncoder:
+    """Mean/CLS-pooled, L2-normalized sentence embeddings from an exported ONNX transformer."""
+
+    def __init__(self, model_name: str, directory: Path, quantize: bool = True, threads: Optional[int] = None) -> None:
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        if not (directory / "export.json").exists():
+            export_onnx_model(model_name, directory)
+        model_file = "model-int8.onnx" if quantize else "model.onnx"
+        if quantize and not (directory / model_file).exists():
+            quantize_onnx_model(directory)
+
+        meta = json.loads((directory / "export.json").read_text(encoding="utf-8"))
+        self.variant = "onnx-int8" if quantize else "onnx"
+        self.pooling = meta["pooling"]
+        self.tokenizer = Tokenizer.from_file(str(directory / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=meta["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=meta["pad_token_id"], pad_token=meta["pad_token"])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(directory / model_file), options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        logger.info("Loaded ONNX embedding model %s (%s, threads=%s)", model_name, self.variant, threads or "auto")
+
+    def encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        # Batching texts of similar length keeps padding, and therefore wasted compute, small.
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        output = np.empty((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            batch = order[start : start + batch_size]
+            vectors = self._encode_batch([texts[position] for position in batch])
+            if output.shape[1] == 0:
+                output = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            output[batch] = vectors
+        return output
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        features = {
+            "input_ids": np.asarray([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": np.asarray([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+            "token_type_ids": np.asarray([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {name: features[name] for name in self.input_names})[0]
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = features["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
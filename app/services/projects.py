@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+from app.core.config import settings
+
+# Project IDs end up in directory and Chroma collection names (3-63 chars of [A-Za-z0-9._-],
+# alphanumeric at both ends, including the index version suffix), so they are restricted to
+# a safe subset of both.
+PROJECT_ID_PATTERN = re.compile(r"^[A-Za-z0-9](?:[A-Za-z0-9_-]{0,30}[A-Za-z0-9])?$")
+
+
+class InvalidProjectError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class ProjectStorage:
+    """Where one project's (tenant's) knowledge base lives on disk."""
+
+    project_id: str
+    root: Path
+    upload_dir: Path
+    numpy_index_dir: Path
+    lexical_index_dir: Path
+    chroma_collection: str
+
+    @property
+    def is_default(self) -> bool:
+        return self.project_id == settings.default_project
+
+
+def resolve_project(project_id: Optional[str] = None) -> str:
+    project_id = project_id or settings.default_project
+    if not PROJECT_ID_PATTERN.match(project_id):
+        raise InvalidProjectError(
+            f"Invalid project ID {project_id!r}: use 1-32 letters, digits, '-' or '_', "
+            "starting and ending with a letter or digit."
+        )
+    return project_id
+
+
+def project_storage(project_id: Optional[str] = None) -> ProjectStorage:
+    project_id = resolve_project(project_id)
+    if project_id == settings.default_project:
+        # The default project is the pre-multi-tenant layout, so existing data keeps working.
+        return ProjectStorage(
+            project_id=project_id,
+            root=settings.data_dir,
+            upload_dir=settings.upload_dir,
+            numpy_index_dir=settings.numpy_index_dir,
+            lexical_index_dir=settings.lexical_index_dir,
+            chroma_collection=settings.chroma_collection,
+        )
+    root = settings.projects_dir / project_id
+    return ProjectStorage(
+        project_id=project_id,
+        root=root,
+        upload_dir=root / "uploads",
+        numpy_index_dir=root / "numpy_index",
+        lexical_index_dir=root / "lexical_index",
+        # Chroma keeps every project in one persistent client, one collection each.
+        chroma_collection=f"{settings.chroma_collection}-{project_id}",
+    )
+
+
+def project_exists(project_id: Optional[str] = None) -> bool:
+    storage = project_storage(project_id)
+    return storage.is_default or storage.root.is_dir()
+
+
+def list_projects() -> List[str]:
+    projects = {settings.default_project}
+    if settings.projects_dir.is_dir():
+        projects.update(
+            path.name for path in settings.projects_dir.iterdir() if path.is_dir() and PROJECT_ID_PATTERN.match(path.name)
+        )
+    return sorted(projects)
@@ -41,7 +41,7 @@ def build_test_case_prompt(query: str, contexts: List[dict]) -> str:
     ).strip()
 
 
-def build_selenium_prompt(test_case_json: str, contexts: List[dict], html_snippet: str) -> str:
+def build_selenium_prompt(test_case_json: str, contexts: List[dict], html_snippet: str, raw_html: bool = False) -> str:
     context_blocks = []
     for idx, ctx in enumerate(contexts, start=1):
         source = ctx.get("metadata", {}).get("source", "unknown_source")
@@ -49,6 +49,12 @@ def build_selenium_prompt(test_case_json: str, contexts: List[dict], html_snippe
         context_blocks.append(f"Context {idx} (source: {source}):\n{snippet}")
 
     combined_context = "\n\n".join(context_blocks)
+    # Without indexable elements the snippet is the page markup itself.
+    if raw_html:
+        page_title, page_source = "HTML SOURCE (checkout.html extract)", "HTML"
+    else:
+        page_title = "PAGE ELEMENTS (checkout.html, one element per line with its CSS selector)"
+        page_source = "page elements"
 
     return dedent(
         f"""
@@ -56,8 +62,8 @@ def build_selenium_prompt(test_case_json: str, contexts: List[dict], html_snippe
         -----------------
         {combined_context}
 
-        HTML SOURCE (checkout.html extract)
-        -----------------------------------
+        {page_title}
+        {"-" * len(page_title)}
         {html_snippet}
 
         TASK
@@ -65,7 +71,7 @@ def build_selenium_prompt(test_case_json: str, contexts: List[dict], html_snippe
         Using the provided test case JSON, generate a complete Python Selenium 4 script that automates the scenario.
         Requirements:
         - Use Selenium's modern API with WebDriverWait and expected_conditions for synchronization.
-        - Use accurate selectors (prefer id, name; otherwise CSS selectors) that exist in the provided HTML.
+        - Use accurate selectors (prefer id, name; otherwise CSS selectors) that exist in the provided {page_source}.
         - Include comments describing each major step.
         - Include assertions to verify the expected outcomes from the documentation.
         - Wrap the script in a main guard so it can be run directly.
@@ -1,43 +1,137 @@
 from __future__ import annotations
 
 import logging
-from typing import List
+from typing import Dict, List, Optional
 
 from app.core.config import settings
-from app.services.vector_store import vector_store_manager
+from app.services.embeddings import normalize_text
+from app.services.projects import project_exists, resolve_project
+from app.services.vector_store import LoadedKnowledgeBase, vector_store_manager
+from app.utils.cache import LRUCache
+from app.utils.metrics import register_cache, timed
 
 logger = logging.getLogger(__name__)
 
 
 class KnowledgeRetriever:
     def __init__(self) -> None:
-        self._is_ready: bool = False
+        # One cache for every project; keys carry the project and its index version.
+        self.result_cache = LRUCache(settings.retrieval_cache_size)
+        register_cache("retrieval_results", self.result_cache.stats)
 
     @property
     def is_ready(self) -> bool:
-        if self._is_ready:
-            return True
+        return self.is_ready_for(None)
+
+    def is_ready_for(self, project_id: Optional[str]) -> bool:
+        # Unknown projects are not opened: Chroma would create an empty collection for them.
+        if not project_exists(project_id):
+            return False
         try:
-            vector_store_manager.load()
-            self._is_ready = True
+            vector_store_manager.open(project_id)
         except Exception:  # noqa: BLE001
-            self._is_ready = False
-        return self._is_ready
+            return False
+        return True
 
-    def refresh(self) -> None:
+    def refresh(self, project_id: Optional[str] = None) -> None:
         try:
-            vector_store_manager.load()
-            self._is_ready = True
+            vector_store_manager.open(project_id)
         except Exception as exc:  # noqa: BLE001
-            logger.error("Failed to refresh vector store: %s", exc)
-            self._is_ready = False
+            logger.error("Failed to refresh vector store for project %s: %s", resolve_project(project_id), exc)
+
+    def retrieve(self, query: str, top_k: int | None = None, mode: str | None = None, project_id: Optional[str] = None):
+        return self.retrieve_many([query], top_k, mode, project_id)[0]
+
+    def retrieve_many(
+        self,
+        queries: List[str],
+        top_k: int | None = None,
+        mode: str | None = None,
+        project_id: Optional[str] = None,
+    ):
+        k = top_k or settings.retriever_top_k
+        mode = mode or settings.retrieval_mode
+        project_id = resolve_project(project_id)
+        # Read the version before searching: if a rebuild lands mid-query the result
+        # is filed under the old version and simply never hit again.
+        version = vector_store_manager.version(project_id)
+        cache_keys = [(project_id, version, normalize_text(query), k, mode) for query in queries]
+        results = [self.result_cache.get(cache_key) for cache_key in cache_keys]
+        missing = [position for position, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+
+        embedding_service = vector_store_manager.embedding_service
+        with timed("query_embedding"):
+            if len(missing) == 1:
+                embeddings = [embedding_service.embed_query(queries[missing[0]])]
+            else:
+                embeddings = embedding_service.embed_documents([queries[position] for position in missing])
+        candidates = k * settings.hybrid_candidate_multiplier if mode == "hybrid" else k
+        # One lease for the whole query: dense, lexical and fetch-by-ID all read the same
+        # index version even if a rebuild swaps it in the meantime.
+        with vector_store_manager.lease(project_id) as knowledge_base:
+            with timed("vector_search"):
+                dense_batches = knowledge_base.search_by_vectors(embeddings, candidates)
+            for position, dense in zip(missing, dense_batches):
+                result = self._fuse(queries[position], dense, k, knowledge_base) if mode == "hybrid" else dense[:k]
+                self.result_cache.set(cache_keys[position], result)
+                results[position] = result
+        return results
+
+    def _fuse(self, query: str, dense, k: int, knowledge_base: LoadedKnowledgeBase):
+        with timed("lexical_search"):
+            lexical = knowledge_base.lexical_search(query, k * settings.hybrid_candidate_multiplier)
+        if not lexical:
+            return dense[:k]
 
-    def retrieve(self, query: str, top_k: int | None = None):
-        store = vector_store_manager.load()
-        return store.similarity_search_with_score(query, k=top_k or settings.retriever_top_k)
+        from app.services.lexical_index import reciprocal_rank_fusion
 
-    def raw_search(self, query: str, top_k: int | None = None) -> List[dict]:
-        docs_with_scores = self.retrieve(query, top_k)
+        documents = {doc.metadata.get("chunk_id"): doc for doc, _ in dense}
+        distances = {doc.metadata.get("chunk_id"): distance for doc, distance in dense}
+        fused = reciprocal_rank_fusion(
+            [[doc.metadata.get("chunk_id") for doc, _ in dense], [chunk_id for chunk_id, _ in lexical]],
+            k=settings.rrf_k,
+        )[:k]
+        missing = [chunk_id for chunk_id, _ in fused if chunk_id not in documents]
+        if missing:
+            documents.update(knowledge_base.get_by_ids(missing))
+        results = []
+        for chunk_id, fused_score in fused:
+            if chunk_id not in documents:
+                continue
+            # ``score`` stays the dense distance (lower is better) in every mode, None for
+            # lexical-only hits; the RRF value (higher is better) goes under its own key.
+            documents[chunk_id].metadata["fused_score"] = fused_score
+            results.append((documents[chunk_id], distances.get(chunk_id)))
+        return results
+
+    def raw_search(self, query: str, top_k: int | None = None, project_id: Optional[str] = None) -> List[dict]:
+        return self._to_payloads(self.retrieve(query, top_k, project_id=project_id))
+
+    def raw_search_many(
+        self, queries: List[str], top_k: int | None = None, project_id: Optional[str] = None
+    ) -> List[List[dict]]:
+        return [self._to_payloads(results) for results in self.retrieve_many(queries, top_k, project_id=project_id)]
+
+    def fetch_many(self, id_lists: List[List[str]], project_id: Optional[str] = None) -> List[Optional[List[dict]]]:
+        """Payloads for each list of chunk IDs, in the given order, without embedding or searching.
+
+        A list comes back as ``None`` when it is empty or any of its chunks is no longer in
+        the index. Chunk IDs hash the chunk content, so every chunk that is found is unchanged.
+        """
+        wanted = list(dict.fromkeys(chunk_id for ids in id_lists for chunk_id in ids))
+        documents = vector_store_manager.get_by_ids(wanted, project_id) if wanted else {}
+        results: List[Optional[List[dict]]] = []
+        for ids in id_lists:
+            if not ids or any(chunk_id not in documents for chunk_id in ids):
+                results.append(None)
+                continue
+            results.append(self._to_payloads((documents[chunk_id], None) for chunk_id in ids))
+        return results
+
+    @staticmethod
+    def _to_payloads(docs_with_scores) -> List[dict]:
         results = []
         for doc, score in docs_with_scores:
             metadata = doc.metadata.copy()
@@ -50,3 +144,10 @@ class KnowledgeRetriever:
                 "metadata": metadata,
             })
         return results
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        stats = {"retrieval_results": self.result_cache.stats()}
+        # Reporting stats must not be what loads the embedding model.
+        if vector_store_manager.embedding_loaded:
+            stats.update(vector_store_manager.embedding_service.cache_stats())
+        return stats
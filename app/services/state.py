@@ -1,19 +1,39 @@
 from __future__ import annotations
 
+import threading
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Dict, Optional
 
+from app.core.config import settings
+
 
 @dataclass
 class AppState:
     latest_html_path: Optional[Path] = None
     ingested_files: Dict[str, Path] = field(default_factory=dict)
+    file_hashes: Dict[str, str] = field(default_factory=dict)
 
-    def update_file(self, filename: str, path: Path) -> None:
+    def update_file(self, filename: str, path: Path, content_hash: Optional[str] = None) -> None:
         self.ingested_files[filename] = path
+        if content_hash:
+            self.file_hashes[filename] = content_hash
         if path.suffix.lower() in {".html", ".htm"}:
             self.latest_html_path = path
 
 
-app_state = AppState()
+class ProjectStates:
+    """One ``AppState`` (uploaded files and HTML pages) per project."""
+
+    def __init__(self) -> None:
+        self._states: Dict[str, AppState] = {}
+        self._lock = threading.Lock()
+
+    def get(self, project_id: Optional[str] = None) -> AppState:
+        with self._lock:
+            return self._states.setdefault(project_id or settings.default_project, AppState())
+
+
+project_states = ProjectStates()
+# State of the default project, which the unprefixed API routes serve.
+app_state = project_states.get()
@@ -0,0 +1,490 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+from app.core.config import settings
+from app.services.projects import ProjectStorage, project_storage
+
+logger = logging.getLogger(__name__)
+
+SearchResult = List[Tuple[Document, float]]
+
+
+class VectorIndex(Protocol):
+    """Storage backend behind ``VectorStoreManager``.
+
+    Scores are distances (lower is better). Embeddings are L2-normalized, so every
+    backend reports squared euclidean distance to keep scores comparable (for unit
+    vectors that is twice the cosine distance).
+    """
+
+    name: str
+
+    def count(self) -> int: ...
+
+    def stored_sources(self) -> Dict[str, str]: ...
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        texts: Sequence[str],
+        metadatas: Sequence[Dict[str, Any]],
+        embeddings: Sequence[Sequence[float]],
+    ) -> None: ...
+
+    def delete(self, ids: Sequence[str]) -> None: ...
+
+    def persist(self) -> None: ...
+
+    def search_by_vector(self, embedding: Sequence[float], k: int) -> SearchResult: ...
+
+    def search_by_vectors(self, embeddings: Sequence[Sequence[float]], k: int) -> List[SearchResult]: ...
+
+    def get_by_ids(self, ids: Sequence[str]) -> Dict[str, Document]: ...
+
+    def copy_from(self, source: "VectorIndex") -> None:
+        """Fill this (empty) index with every record of ``source``, without re-embedding."""
+        ...
+
+    def drop(self) -> None: ...
+
+    def close(self) -> None:
+        """Free the index's memory; the stored data stays and is read back by the next open."""
+        ...
+
+    def size_bytes(self) -> int:
+        """Bytes the vector index occupies on disk."""
+        ...
+
+
+class ChromaIndex:
+    name = "chroma"
+
+    def __init__(
+        self,
+        persist_directory: Path,
+        collection_name: str,
+        embedding_function: Any,
+        index_params: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.persist_directory = persist_directory
+        self.collection_name = collection_name
+        self.embedding_function = embedding_function
+        # Only passed when creating a collection: Chroma overwrites the metadata of an existing
+        # one with whatever is given, which must never disagree with how its HNSW was built.
+        self.collection_metadata = (
+            {f"hnsw:{name}": value for name, value in index_params.items()} if index_params else None
+        )
+        self.persist_directory.mkdir(parents=True, exist_ok=True)
+        self.store = self._open()
+
+    def _open(self) -> Any:
+        from langchain_community.vectorstores import Chroma
+
+        client_settings = None
+        if settings.chroma_memory_limit_bytes > 0:
+            import chromadb.config
+
+            # Every project shares one client per directory, so this caps loaded HNSW
+            # segments across all collections, evicting the least recently used.
+            client_settings = chromadb.config.Settings(
+                is_persistent=True,
+                persist_directory=str(self.persist_directory),
+                chroma_segment_cache_policy="LRU",
+                chroma_memory_limit_bytes=settings.chroma_memory_limit_bytes,
+            )
+        store = Chroma(
+            collection_name=self.collection_name,
+            embedding_function=self.embedding_function,
+            persist_directory=str(self.persist_directory),
+            client_settings=client_settings,
+            collection_metadata=self.collection_metadata,
+        )
+        space = (store._collection.metadata or {}).get("hnsw:space", "l2")
+        # Cosine and inner-product distances of unit vectors are half the squared L2 distance.
+        self._distance_scale = 1.0 if space == "l2" else 2.0
+        return store
+
+    def size_bytes(self) -> int:
+        # The HNSW segment lives in its own directory named after the segment ID.
+        return sum(
+            _directory_bytes(self.persist_directory / str(segment_id)) for segment_id in self._vector_segment_ids()
+        )
+
+    def count(self) -> int:
+        return len(self.store)
+
+    def stored_sources(self) -> Dict[str, str]:
+        stored = self.store.get(include=["metadatas"])
+        return {
+            chunk_id: (metadata or {}).get("source", "")
+            for chunk_id, metadata in zip(stored.get("ids", []), stored.get("metadatas") or [])
+        }
+
+    def upsert(self, ids, texts, metadatas, embeddings) -> None:
+        # The LangChain wrapper always re-embeds in add_texts; vectors computed by the
+        # builder (and its embedding cache) go straight to the underlying collection.
+        self.store._collection.upsert(
+            ids=list(ids),
+            documents=list(texts),
+            metadatas=list(metadatas),
+            embeddings=[list(vector) for vector in embeddings],
+        )
+
+    def delete(self, ids) -> None:
+        if ids:
+            self.store.delete(ids=list(ids))
+
+    def persist(self) -> None:
+        # Chroma >= 0.4 writes through on every call.
+        return None
+
+    def copy_from(self, source: VectorIndex) -> None:
+        if not isinstance(source, ChromaIndex):
+            raise ValueError(f"Cannot copy a {source.name} index into Chroma")
+        offset = 0
+        while True:
+            batch = source.store._collection.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=settings.ingestion_batch_size,
+                offset=offset,
+            )
+            if not batch["ids"]:
+                return
+            self.upsert(batch["ids"], batch["documents"], batch["metadatas"], batch["embeddings"])
+            offset += len(batch["ids"])
+
+    def drop(self) -> None:
+        # Chroma only removes the HNSW files of segments loaded in this process, so a
+        # collection that was closed (or never searched since start-up) would leave them behind.
+        segment_dirs = [self.persist_directory / str(segment_id) for segment_id in self._vector_segment_ids()]
+        self.store.delete_collection()
+        for directory in segment_dirs:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def close(self) -> None:
+        from chromadb.types import SegmentScope
+
+        # The shared client keeps every collection's HNSW segment in memory until it is
+        # stopped; do what Chroma's own LRU eviction does, for this collection only.
+        manager = self.store._client._server._manager
+        collection_id = self.store._collection.id
+        for segment_id in self._vector_segment_ids():
+            with manager._lock:
+                manager.segment_cache[SegmentScope.VECTOR].pop(collection_id)
+                if hasattr(manager, "_vector_instances_file_handle_cache"):
+                    manager._vector_instances_file_handle_cache.cache.pop(collection_id, None)
+                instance = manager._instances.pop(segment_id, None)
+            if instance is not None:
+                instance.stop()
+
+    def _vector_segment_ids(self) -> List[Any]:
+        segments = self.store._client._server._sysdb.get_segments(collection=self.store._collection.id)
+        return [segment["id"] for segment in segments if segment["scope"].value == "VECTOR"]
+
+    def search_by_vector(self, embedding, k: int) -> SearchResult:
+        results = self.store.similarity_search_by_vector_with_relevance_scores(list(embedding), k=k)
+        return [(document, distance * self._distance_scale) for document, distance in results]
+
+    def search_by_vectors(self, embeddings, k: int) -> List[SearchResult]:
+        if not embeddings:
+            return []
+        response = self.store._collection.query(
+            query_embeddings=[list(vector) for vector in embeddings],
+            n_results=k,
+            include=["documents", "metadatas", "distances"],
+        )
+        batches: List[SearchResult] = []
+        for documents, metadatas, distances in zip(
+            response["documents"], response["metadatas"], response["distances"]
+        ):
+            batches.append(
+                [
+                    (Document(page_content=document, metadata=metadata or {}), float(distance) * self._distance_scale)
+                    for document, metadata, distance in zip(documents, metadatas, distances)
+                ]
+            )
+        return batches
+
+    def get_by_ids(self, ids) -> Dict[str, Document]:
+        if not ids:
+            return {}
+        stored = self.store.get(ids=list(ids), include=["documents", "metadatas"])
+        return {
+            chunk_id: Document(page_content=document, metadata=metadata or {})
+            for chunk_id, document, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])
+        }
+
+
+class NumpyIndex:
+    """Exact top-k search over a memory-mapped ``.npy`` matrix with a SQLite side table.
+
+    Row ``i`` of ``vectors.npy`` corresponds to ``row = i`` in ``chunks.sqlite3``. Writes
+    are staged in memory and only become visible to readers on ``persist()``, which
+    rewrites both files and swaps them in with ``os.replace``.
+    """
+
+    name = "numpy"
+    _SCORE_BLOCK_ROWS = 65536
+
+    def __init__(self, directory: Path, dtype: str = "float32") -> None:
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = directory / "vectors.npy"
+        self.table_path = directory / "chunks.sqlite3"
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pending: Dict[str, Tuple[str, Dict[str, Any], np.ndarray]] = {}
+        self._deleted: set[str] = set()
+        self._load()
+
+    def _load(self) -> None:
+        matrix: Optional[np.ndarray] = None
+        conn: Optional[sqlite3.Connection] = None
+        if self.vectors_path.exists() and self.table_path.exists():
+            matrix = np.load(self.vectors_path, mmap_mode="r")
+            conn = sqlite3.connect(f"file:{self.table_path}?mode=ro", uri=True, check_same_thread=False)
+            rows = int(conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0])
+            if rows != matrix.shape[0]:
+                logger.error(
+                    "NumPy index at %s is inconsistent (%s vectors, %s rows); ignoring it",
+                    self.directory,
+                    matrix.shape[0],
+                    rows,
+                )
+                conn.close()
+                matrix, conn = None, None
+        with self._lock:
+            self._matrix, self._conn = matrix, conn
+
+    def count(self) -> int:
+        return 0 if self._matrix is None else int(self._matrix.shape[0])
+
+    def copy_from(self, source: VectorIndex) -> None:
+        if not isinstance(source, NumpyIndex):
+            raise ValueError(f"Cannot copy a {source.name} index into a NumPy index")
+        if not (source.vectors_path.exists() and source.table_path.exists()):
+            return
+        # persist() only ever replaces these files, never writes into them, so hard links are safe.
+        for source_path, target_path in ((source.vectors_path, self.vectors_path), (source.table_path, self.table_path)):
+            target_path.unlink(missing_ok=True)
+            try:
+                os.link(source_path, target_path)
+            except OSError:
+                shutil.copy2(source_path, target_path)
+        self._load()
+
+    def drop(self) -> None:
+        self.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._matrix, self._conn = None, None
+
+    def size_bytes(self) -> int:
+        return sum(path.stat().st_size for path in (self.vectors_path, self.table_path) if path.exists())
+
+    def stored_sources(self) -> Dict[str, str]:
+        stored = {chunk_id: source for _, chunk_id, source in self._rows("SELECT row, id, source FROM chunks")}
+        for chunk_id in self._deleted:
+            stored.pop(chunk_id, None)
+        for chunk_id, (_, metadata, _) in self._pending.items():
+            stored[chunk_id] = metadata.get("source", "")
+        return stored
+
+    def upsert(self, ids, texts, metadatas, embeddings) -> None:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        for chunk_id, text, metadata, vector in zip(ids, texts, metadatas, vectors):
+            self._pending[chunk_id] = (text, dict(metadata), vector)
+            self._deleted.discard(chunk_id)
+
+    def delete(self, ids) -> None:
+        for chunk_id in ids:
+            self._pending.pop(chunk_id, None)
+            self._deleted.add(chunk_id)
+
+    def persist(self) -> None:
+        if not (self._pending or self._deleted):
+            return
+
+        kept_vectors: List[np.ndarray] = []
+        kept_rows: List[Tuple[str, str, str, str]] = []
+        matrix = self._matrix
+        if matrix is not None:
+            positions = []
+            for row, chunk_id, source, document, metadata in self._rows(
+                "SELECT row, id, source, document, metadata FROM chunks ORDER BY row"
+            ):
+                if chunk_id in self._deleted or chunk_id in self._pending:
+                    continue
+                positions.append(row)
+                kept_rows.append((chunk_id, source, document, metadata))
+            if positions:
+                kept_vectors.append(np.asarray(matrix[positions], dtype=self.dtype))
+
+        for chunk_id, (text, metadata, vector) in self._pending.items():
+            kept_rows.append((chunk_id, metadata.get("source", ""), text, json.dumps(metadata)))
+        if self._pending:
+            kept_vectors.append(np.stack([vector for _, _, vector in self._pending.values()]).astype(self.dtype))
+
+        dimension = kept_vectors[0].shape[1] if kept_vectors else 0
+        new_matrix = np.concatenate(kept_vectors) if kept_vectors else np.zeros((0, dimension), dtype=self.dtype)
+
+        vectors_tmp = self.vectors_path.with_suffix(".npy.tmp")
+        table_tmp = self.table_path.with_suffix(".sqlite3.tmp")
+        with vectors_tmp.open("wb") as handle:
+            np.save(handle, new_matrix)
+        table_tmp.unlink(missing_ok=True)
+        conn = sqlite3.connect(str(table_tmp))
+        try:
+            conn.execute(
+                "CREATE TABLE chunks (row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, "
+                "source TEXT NOT NULL, document TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            conn.executemany(
+                "INSERT INTO chunks (row, id, source, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                [(row, *values) for row, values in enumerate(kept_rows)],
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        os.replace(vectors_tmp, self.vectors_path)
+        os.replace(table_tmp, self.table_path)
+        self._pending.clear()
+        self._deleted.clear()
+        self._load()
+        logger.info("Persisted NumPy index with %s vectors to %s", new_matrix.shape[0], self.directory)
+
+    def search_by_vector(self, embedding, k: int) -> SearchResult:
+        return self.search_by_vectors([embedding], k)[0]
+
+    def search_by_vectors(self, embeddings, k: int) -> List[SearchResult]:
+        with self._lock:
+            matrix, conn = self._matrix, self._conn
+        if not embeddings:
+            return []
+        if matrix is None or conn is None or matrix.shape[0] == 0 or k <= 0:
+            return [[] for _ in embeddings]
+
+        queries = np.asarray(embeddings, dtype=np.float32)
+        similarities = self._similarities(matrix, queries)
+        k = min(k, matrix.shape[0])
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        rows = {int(row): (document, metadata) for row, document, metadata in self._fetch_rows(conn, np.unique(top))}
+        distances = np.maximum(2.0 - 2.0 * top_scores, 0.0)
+        batches: List[SearchResult] = []
+        for row_ids, row_distances in zip(top, distances):
+            batch: SearchResult = []
+            for row, distance in zip(row_ids, row_distances):
+                document, metadata = rows[int(row)]
+                batch.append((Document(page_content=document, metadata=json.loads(metadata)), float(distance)))
+            batches.append(batch)
+        return batches
+
+    def get_by_ids(self, ids) -> Dict[str, Document]:
+        unique_ids = list(dict.fromkeys(ids))
+        found: Dict[str, Document] = {}
+        for start in range(0, len(unique_ids), 500):
+            batch = unique_ids[start : start + 500]
+            placeholders = ",".join("?" * len(batch))
+            with self._lock:
+                if self._conn is None:
+                    return found
+                rows = self._conn.execute(
+                    f"SELECT id, document, metadata FROM chunks WHERE id IN ({placeholders})", batch
+                ).fetchall()
+            for chunk_id, document, metadata in rows:
+                found[chunk_id] = Document(page_content=document, metadata=json.loads(metadata))
+        return found
+
+    def _similarities(self, matrix: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        if matrix.dtype == np.float32:
+            return queries @ np.asarray(matrix).T
+        # float16 has no BLAS path; upcast one block at a time to bound memory.
+        similarities = np.empty((queries.shape[0], matrix.shape[0]), dtype=np.float32)
+        for start in range(0, matrix.shape[0], self._SCORE_BLOCK_ROWS):
+            block = np.asarray(matrix[start : start + self._SCORE_BLOCK_ROWS], dtype=np.float32)
+            similarities[:, start : start + block.shape[0]] = queries @ block.T
+        return similarities
+
+    def _rows(self, sql: str) -> List[Tuple[Any, ...]]:
+        with self._lock:
+            conn = self._conn
+            if conn is None:
+                return []
+            return conn.execute(sql).fetchall()
+
+    def _fetch_rows(self, conn: sqlite3.Connection, rows: np.ndarray) -> List[Tuple[int, str, str]]:
+        placeholders = ",".join("?" * len(rows))
+        with self._lock:
+            return conn.execute(
+                f"SELECT row, document, metadata FROM chunks WHERE row IN ({placeholders})",
+                [int(row) for row in rows],
+            ).fetchall()
+
+
+def hnsw_params(project_id: Optional[str] = None, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """HNSW parameters for a new Chroma collection: settings, then per-project overrides, then ``overrides``."""
+    params: Dict[str, Any] = {
+        "space": settings.chroma_hnsw_space,
+        "M": settings.chroma_hnsw_m,
+        "construction_ef": settings.chroma_hnsw_construction_ef,
+        "search_ef": settings.chroma_hnsw_search_ef,
+    }
+    for source in (settings.chroma_hnsw_overrides.get(project_storage(project_id).project_id, {}), overrides or {}):
+        for name, value in source.items():
+            name = "M" if name.lower() == "m" else name
+            if name not in params:
+                raise ValueError(f"Unknown HNSW parameter {name!r}; expected one of {', '.join(params)}")
+            if value is not None:
+                params[name] = value
+    if params["space"] not in {"cosine", "l2", "ip"}:
+        raise ValueError(f"Unknown HNSW space {params['space']!r}")
+    return params
+
+
+def create_vector_index(
+    embedding_function: Any,
+    backend: Optional[str] = None,
+    storage: Optional[ProjectStorage] = None,
+    index_params: Optional[Dict[str, Any]] = None,
+) -> VectorIndex:
+    """Open (or create) an index; ``index_params`` only apply to a Chroma collection being created."""
+    backend = backend or settings.vector_backend
+    storage = storage or project_storage()
+    if backend == "numpy":
+        return NumpyIndex(storage.numpy_index_dir, dtype=settings.numpy_index_dtype)
+    if backend == "chroma":
+        return ChromaIndex(settings.chroma_dir, storage.chroma_collection, embedding_function, index_params)
+    raise ValueError(f"Unknown vector backend: {backend}")
+
+
+def drop_vector_index(storage: ProjectStorage, backend: Optional[str] = None) -> None:
+    create_vector_index(None, backend, storage).drop()
+
+
+def _directory_bytes(directory: Path) -> int:
+    if not directory.is_dir():
+        return 0
+    return sum(path.stat().st_size for path in directory.rglob("*") if path.is_file())
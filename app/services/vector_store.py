@@ -1,49 +1,260 @@
 from __future__ import annotations
 
 import logging
-from typing import List, Optional, Tuple
-
-from langchain_community.vectorstores import Chroma
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Sequence, Tuple
 
 from app.core.config import settings
-from app.services.embeddings import get_embedding_service
+from app.services.embeddings import EmbeddingService, get_embedding_service
+from app.services.index_versions import IndexVersions
+from app.services.projects import ProjectStorage, project_storage, resolve_project
+
+if TYPE_CHECKING:
+    from langchain.schema import Document
+
+    from app.services.lexical_index import LexicalIndex
+    from app.services.vector_backends import SearchResult, VectorIndex
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class LoadedKnowledgeBase:
+    """One opened index version of a project; readers use it only while holding a lease."""
+
+    project_id: str
+    version: str
+    storage: ProjectStorage
+    vector_index: VectorIndex
+    lexical_index: Optional[LexicalIndex] = None
+    lexical_loaded: bool = False
+    last_used: float = field(default_factory=time.monotonic)
+
+    def load_lexical(self) -> Optional[LexicalIndex]:
+        if not self.lexical_loaded:
+            from app.services.lexical_index import LexicalIndex
+
+            self.lexical_index = LexicalIndex.load(self.storage.lexical_index_dir)
+            self.lexical_loaded = True
+        return self.lexical_index
+
+    def search_by_vectors(self, embeddings: Sequence[Sequence[float]], k: int) -> List[SearchResult]:
+        return self.vector_index.search_by_vectors(embeddings, k)
+
+    def lexical_search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        index = self.load_lexical()
+        return index.search(query, k) if index is not None else []
+
+    def get_by_ids(self, ids: Sequence[str]) -> Dict[str, Document]:
+        return self.vector_index.get_by_ids(ids)
+
+
 class VectorStoreManager:
-    def __init__(self) -> None:
-        self.embedding_service = get_embedding_service()
-        self.vector_store: Optional[Chroma] = None
-
-    def load(self) -> Chroma:
-        if self.vector_store is None:
-            logger.info("Loading Chroma vector store from %s", settings.chroma_dir)
-            self.vector_store = Chroma(
-                collection_name=settings.chroma_collection,
-                embedding_function=self.embedding_service,
-                persist_directory=str(settings.chroma_dir),
+    """Loads each project's active index version on demand and hands out reader leases.
+
+    At most ``settings.max_loaded_projects`` stay loaded; the least recently used one is
+    evicted beyond that, and any left idle for ``settings.project_idle_seconds``. An evicted
+    index is closed, freeing its memory, once no reader holds it any more. A rebuild
+    switches the project's ``ACTIVE`` version and calls :meth:`reset`; searches already
+    holding a lease on the old version finish against it, and the old version is deleted
+    once its last lease is released.
+    """
+
+    def __init__(self, embedding_service: Optional[EmbeddingService] = None) -> None:
+        self._embedding_service = embedding_service
+        self._loaded: "OrderedDict[str, LoadedKnowledgeBase]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Open leases per (project, index version); versions with leases are never deleted.
+        self._leases: Counter = Counter()
+        # Per project, bumped whenever its stored index changes; caches derived from
+        # search results key on (project, version) so a rebuild invalidates them.
+        self._versions: Dict[str, int] = {}
+
+    @property
+    def embedding_service(self) -> EmbeddingService:
+        if self._embedding_service is None:
+            self._embedding_service = get_embedding_service()
+        return self._embedding_service
+
+    @property
+    def embedding_loaded(self) -> bool:
+        return self._embedding_service is not None
+
+    @embedding_service.setter
+    def embedding_service(self, service: EmbeddingService) -> None:
+        # Open indexes hold a reference to the old embedding function.
+        self._embedding_service = service
+        self.reset_all()
+
+    @contextmanager
+    def lease(self, project_id: Optional[str] = None) -> Iterator[LoadedKnowledgeBase]:
+        """Pin the project's current index version for a consistent multi-step read."""
+        knowledge_base = self._acquire(resolve_project(project_id))
+        try:
+            yield knowledge_base
+        finally:
+            self._release(knowledge_base)
+
+    def open(self, project_id: Optional[str] = None, lexical: bool = False) -> None:
+        """Load the project's current index version, and its lexical index if asked, ahead of use."""
+        with self.lease(project_id) as knowledge_base:
+            if lexical:
+                knowledge_base.load_lexical()
+
+    def is_loaded(self, project_id: Optional[str] = None) -> bool:
+        return resolve_project(project_id) in self._loaded
+
+    def loaded_projects(self) -> List[str]:
+        with self._lock:
+            return list(self._loaded)
+
+    def active_leases(self) -> Dict[str, int]:
+        with self._lock:
+            return {f"{project_id}:{version}": count for (project_id, version), count in self._leases.items()}
+
+    def version(self, project_id: Optional[str] = None) -> int:
+        return self._versions.get(resolve_project(project_id), 0)
+
+    def reset(self, project_id: Optional[str] = None) -> None:
+        project_id = resolve_project(project_id)
+        with self._lock:
+            replaced = self._loaded.pop(project_id, None)
+            self._versions[project_id] = self._versions.get(project_id, 0) + 1
+            if replaced is not None:
+                self._close_if_unused(replaced)
+
+    def reset_all(self) -> None:
+        with self._lock:
+            for project_id in set(self._loaded) | set(self._versions):
+                self._versions[project_id] = self._versions.get(project_id, 0) + 1
+            replaced = list(self._loaded.values())
+            self._loaded.clear()
+            for knowledge_base in replaced:
+                self._close_if_unused(knowledge_base)
+
+    def collect_garbage(self, project_id: Optional[str] = None) -> List[str]:
+        """Delete the project's superseded index versions that no reader holds any more."""
+        project_id = resolve_project(project_id)
+        with self._lock:
+            # Computed after ACTIVE moved on: later readers can only lease the new version.
+            in_use = {version for (leased_project, version) in self._leases if leased_project == project_id}
+        return IndexVersions(project_storage(project_id)).collect(in_use)
+
+    def search_by_vectors(
+        self, embeddings: Sequence[Sequence[float]], k: int, project_id: Optional[str] = None
+    ) -> List[SearchResult]:
+        with self.lease(project_id) as knowledge_base:
+            return knowledge_base.search_by_vectors(embeddings, k)
+
+    def lexical_search(self, query: str, k: int, project_id: Optional[str] = None) -> List[Tuple[str, float]]:
+        with self.lease(project_id) as knowledge_base:
+            return knowledge_base.lexical_search(query, k)
+
+    def get_by_ids(self, ids: Sequence[str], project_id: Optional[str] = None) -> Dict[str, Document]:
+        with self.lease(project_id) as knowledge_base:
+            return knowledge_base.get_by_ids(ids)
+
+    def _acquire(self, project_id: str) -> LoadedKnowledgeBase:
+        with self._lock:
+            knowledge_base = self._touch(project_id)
+            self._evict()
+            if knowledge_base is not None:
+                self._leases[(project_id, knowledge_base.version)] += 1
+                return knowledge_base
+            versions = IndexVersions(project_storage(project_id))
+            # Resolving ACTIVE and leasing it happen under one lock, so garbage collection
+            # (which reads leases under the same lock) can never delete it underneath us.
+            version = versions.active()
+            self._leases[(project_id, version)] += 1
+            generation = self._versions.get(project_id, 0)
+
+        # Opening an index can take a while; do it outside the lock so other projects keep serving.
+        from app.services.vector_backends import create_vector_index
+
+        try:
+            storage = versions.storage_for(version)
+            backend = versions.backend(version)
+            logger.info("Loading %s index %s for project %s", backend, version, project_id)
+            opened = LoadedKnowledgeBase(
+                project_id, version, storage, create_vector_index(self.embedding_service, backend, storage)
             )
-        return self.vector_store
+        except BaseException:
+            self._release_lease(project_id, version)
+            raise
+        with self._lock:
+            knowledge_base = self._touch(project_id)
+            if knowledge_base is not None and knowledge_base.version == version:
+                return knowledge_base
+            # A rebuild that finished while this index was opening must not be masked by it.
+            if knowledge_base is None and self._versions.get(project_id, 0) == generation:
+                self._loaded[project_id] = opened
+                self._evict()
+        return opened
 
-    def reset(self) -> None:
-        self.vector_store = None
+    def _release(self, knowledge_base: LoadedKnowledgeBase) -> None:
+        drained = self._release_lease(knowledge_base.project_id, knowledge_base.version)
+        if drained and self._loaded.get(knowledge_base.project_id) is not knowledge_base:
+            with self._lock:
+                self._close_if_unused(knowledge_base)
+            # The last reader of a superseded version is gone; it can be deleted now.
+            self.collect_garbage(knowledge_base.project_id)
 
-    def similarity_search(self, query: str, k: int) -> List[dict]:
-        store = self.load()
-        docs = store.similarity_search(query, k=k)
-        return [
-            {
-                "page_content": doc.page_content,
-                "metadata": doc.metadata,
-                "id": doc.metadata.get("chunk_id"),
-            }
-            for doc in docs
-        ]
+    def _release_lease(self, project_id: str, version: str) -> bool:
+        with self._lock:
+            key = (project_id, version)
+            self._leases[key] -= 1
+            if self._leases[key] > 0:
+                return False
+            del self._leases[key]
+            return True
+
+    def _touch(self, project_id: str) -> Optional[LoadedKnowledgeBase]:
+        knowledge_base = self._loaded.get(project_id)
+        if knowledge_base is not None:
+            knowledge_base.last_used = time.monotonic()
+            self._loaded.move_to_end(project_id)
+        return knowledge_base
 
-    def similarity_search_with_score(self, query: str, k: int) -> List[Tuple[dict, float]]:
-        store = self.load()
-        docs_with_scores = store.similarity_search_with_score(query, k=k)
+    def _evict(self) -> None:
+        # _loaded is in least-recently-used order, so idle entries are all at the front.
+        cutoff = time.monotonic() - settings.project_idle_seconds
+        while self._loaded:
+            project_id, knowledge_base = next(iter(self._loaded.items()))
+            if len(self._loaded) <= settings.max_loaded_projects and knowledge_base.last_used >= cutoff:
+                break
+            del self._loaded[project_id]
+            self._close_if_unused(knowledge_base)
+            logger.info("Evicted knowledge base for project %s", project_id)
+
+    def _close_if_unused(self, knowledge_base: LoadedKnowledgeBase) -> None:
+        # Called with the lock held, so no reader can lease this version while it closes.
+        # Chroma segments are shared by every handle on a collection: leave them alone while
+        # the same version is loaded again.
+        current = self._loaded.get(knowledge_base.project_id)
+        if self._leases[(knowledge_base.project_id, knowledge_base.version)] > 0:
+            return
+        if current is not None and current.version == knowledge_base.version:
+            return
+        try:
+            knowledge_base.vector_index.close()
+        except Exception as exc:  # noqa: BLE001
+            logger.warning(
+                "Closing index %s of project %s failed: %s", knowledge_base.version, knowledge_base.project_id, exc
+            )
+
+    def similarity_search(self, query: str, k: int, project_id: Optional[str] = None) -> List[dict]:
+        return [payload for payload, _ in self.similarity_search_with_score(query, k, project_id)]
+
+    def similarity_search_with_score(
+        self, query: str, k: int, project_id: Optional[str] = None
+    ) -> List[Tuple[dict, float]]:
+        embedding = self.embedding_service.embed_query(query)
+        with self.lease(project_id) as knowledge_base:
+            docs_with_scores = knowledge_base.search_by_vectors([embedding], k)[0]
         results: List[Tuple[dict, float]] = []
         for doc, score in docs_with_scores:
             payload = {
@@ -54,9 +265,5 @@ class VectorStoreManager:
             results.append((payload, score))
         return results
 
-    def as_retriever(self, search_kwargs: Optional[dict] = None):
-        store = self.load()
-        return store.as_retriever(search_kwargs=search_kwargs or {"k": settings.retriever_top_k})
-
 
 vector_store_manager = VectorStoreManager()
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Spans sub-millisecond cache hits through LLM calls that sit behind rate limits.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "qa_stage_duration_seconds",
+    "Wall time spent in one pipeline stage (parsing, embedding, retrieval, LLM, ...).",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "qa_http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "qa_embedding_batch_size",
+    "Query texts encoded together by the query embedding dispatcher.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+EMBEDDING_QUEUE_DEPTH = Histogram(
+    "qa_embedding_queue_depth",
+    "Query texts already waiting in the embedding dispatcher when another one arrives.",
+    buckets=(0, 1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+LLM_ROUTED = Counter(
+    "qa_llm_routed_requests",
+    "LLM calls by the model size routing picked.",
+    ["model"],
+)
+LLM_HEDGES = Counter(
+    "qa_llm_hedges",
+    "Hedged LLM calls by outcome: fired, or which request answered first (primary/hedge).",
+    ["outcome"],
+)
+LLM_TOKENS = Counter(
+    "qa_llm_tokens",
+    "LLM tokens by kind; provider-reported when available, otherwise estimated.",
+    ["kind"],
+)
+
+# Stages recorded while serving the current request, for the optional Server-Timing header.
+# Worker threads started with asyncio.to_thread share the list through the copied context.
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def record_llm_tokens(prompt: int, completion: int) -> None:
+    LLM_TOKENS.labels("prompt").inc(prompt)
+    LLM_TOKENS.labels("completion").inc(completion)
+
+
+@contextmanager
+def request_timings() -> Iterator[List[Tuple[str, float]]]:
+    timings: List[Tuple[str, float]] = []
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def server_timing_header(timings: List[Tuple[str, float]], total: float) -> str:
+    totals: Dict[str, float] = {}
+    for stage, seconds in list(timings):
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class _StatsCollector:
+    """Reads cache and scheduler counters at scrape time instead of mirroring every update."""
+
+    def __init__(self) -> None:
+        self.caches: Dict[str, Callable[[], Dict[str, int]]] = {}
+        self.schedulers: Dict[str, Callable[[], Dict[str, int]]] = {}
+
+    def collect(self):
+        hits = CounterMetricFamily("qa_cache_hits", "Cache lookups that found an entry.", labels=["cache"])
+        misses = CounterMetricFamily("qa_cache_misses", "Cache lookups that missed.", labels=["cache"])
+        entries = GaugeMetricFamily("qa_cache_entries", "Entries currently held.", labels=["cache"])
+        for name, stats in list(self.caches.items()):
+            values = stats()
+            hits.add_metric([name], values.get("hits", 0))
+            misses.add_metric([name], values.get("misses", 0))
+            entries.add_metric([name], values.get("entries", 0))
+        yield from (hits, misses, entries)
+
+        queued = GaugeMetricFamily("qa_llm_queue_depth", "LLM calls waiting for admission.", labels=["scheduler"])
+        in_flight = GaugeMetricFamily("qa_llm_in_flight", "LLM calls currently running.", labels=["scheduler"])
+        retries = CounterMetricFamily("qa_llm_retries", "LLM calls retried after a transient error.", labels=["scheduler"])
+        rate_limited = CounterMetricFamily("qa_llm_rate_limited", "LLM calls rejected with a 429.", labels=["scheduler"])
+        for name, stats in list(self.schedulers.items()):
+            values = stats()
+            queued.add_metric([name], values["queued"])
+            in_flight.add_metric([name], values["in_flight"])
+            retries.add_metric([name], values["retries"])
+            rate_limited.add_metric([name], values["rate_limited"])
+        yield from (queued, in_flight, retries, rate_limited)
+
+
+_collector = _StatsCollector()
+REGISTRY.register(_collector)
+
+
+def register_cache(name: str, stats: Callable[[], Dict[str, int]]) -> None:
+    """Expose a cache's ``stats()`` (hits/misses/entries); re-registering a name replaces it."""
+    _collector.caches[name] = stats
+
+
+def register_scheduler(name: str, stats: Callable[[], Dict[str, int]]) -> None:
+    _collector.schedulers[name] = stats
+
+
+def render_latest() -> bytes:
+    return generate_latest(REGISTRY)
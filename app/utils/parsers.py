@@ -4,12 +4,20 @@ import json
 import re
 from typing import Any, List
 
+from app.utils.metrics import timed
+
+
 class JSONParsingError(ValueError):
     pass
 
 
 def extract_json_array(text: str) -> Any:
     """Extract the first JSON array from the text and return the parsed object."""
+    with timed("json_parse"):
+        return _extract_json_array(text)
+
+
+def _extract_json_array(text: str) -> Any:
     text = text.strip()
     if not text:
         raise JSONParsingError("Empty response when JSON array expected.")
@@ -38,3 +46,68 @@ def ensure_string_list(value: Any) -> List[str]:
     if isinstance(value, str):
         return [value.strip()]
     raise JSONParsingError("Value cannot be coerced into list of strings.")
+
+
+class IncrementalJSONArrayParser:
+    """Parse a streamed JSON array, yielding each top-level object as soon as it closes.
+
+    Text before the opening bracket (e.g. a Markdown fence) is skipped, and only the
+    object currently being streamed is buffered. A ``[`` only opens the array when the
+    next non-whitespace character is ``{`` or ``]``, so brackets in preamble prose are
+    skipped as well.
+    """
+
+    def __init__(self) -> None:
+        self.in_array = False
+        self.finished = False
+        self._bracket_seen = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._current: List[str] = []
+
+    def feed(self, text: str) -> List[Any]:
+        completed: List[Any] = []
+        for char in text:
+            if self.finished:
+                break
+            if not self.in_array:
+                if char == "[":
+                    self._bracket_seen = True
+                    continue
+                if not self._bracket_seen or char.isspace():
+                    continue
+                self._bracket_seen = False
+                if char not in "{]":
+                    continue
+                self.in_array = True
+            if self._depth == 0:
+                if char == "{":
+                    self._depth = 1
+                    self._current = [char]
+                elif char == "]":
+                    self.finished = True
+                continue
+
+            self._current.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = "".join(self._current)
+                    self._current = []
+                    try:
+                        completed.append(json.loads(candidate))
+                    except json.JSONDecodeError as exc:
+                        raise JSONParsingError(f"Failed to parse streamed JSON object: {exc}") from exc
+        return completed
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import settings
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def isolate_storage(workdir: Path) -> None:
+    """Point every on-disk store at ``workdir`` so benchmarks never touch ``data/``."""
+    from app.services.html_index import selector_index_store
+
+    workdir.mkdir(parents=True, exist_ok=True)
+    settings.data_dir = workdir
+    settings.chroma_dir = workdir / "chroma"
+    settings.upload_dir = workdir / "uploads"
+    settings.numpy_index_dir = workdir / "numpy_index"
+    settings.lexical_index_dir = workdir / "lexical_index"
+    settings.html_index_dir = workdir / "html_index"
+    settings.projects_dir = workdir / "projects"
+    settings.embedding_cache_path = workdir / "embedding_cache.sqlite3"
+    settings.llm_cache_path = workdir / "llm_cache.sqlite3"
+    selector_index_store.directory = settings.html_index_dir
+    for directory in (settings.chroma_dir, settings.upload_dir):
+        directory.mkdir(parents=True, exist_ok=True)
+
+
+def latency_summary(seconds: Sequence[float]) -> Dict[str, float]:
+    if not seconds:
+        return {"count": 0}
+    values = np.asarray(seconds) * 1000.0
+    return {
+        "count": len(values),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "git_revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {
+            "vector_backend": settings.vector_backend,
+            "retrieval_mode": settings.retrieval_mode,
+            "chunk_size": settings.chunk_size,
+            "chunk_overlap": settings.chunk_overlap,
+            "ingestion_batch_size": settings.ingestion_batch_size,
+            "context_token_budget": settings.context_token_budget,
+        },
+    }
+
+
+def write_results(name: str, results: Any, output: Optional[Path]) -> None:
+    payload = json.dumps({"benchmark": name, "environment": environment(), "results": results}, indent=2)
+    if output is None:
+        print(payload)
+    else:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(payload + "\n", encoding="utf-8")
+        print(f"Wrote {output}", file=sys.stderr)
+
+
+class StageTimer:
+    """Progress callback for ``build_knowledge_base`` that records wall time per stage."""
+
+    def __init__(self) -> None:
+        self.timings: Dict[str, float] = {}
+        self._stage: Optional[str] = None
+        self._started = time.perf_counter()
+
+    def __call__(self, stage: Optional[str] = None, **_: Any) -> None:
+        if stage is None or stage == self._stage:
+            return
+        self._close()
+        self._stage = stage
+        self._started = time.perf_counter()
+
+    def finish(self) -> Dict[str, float]:
+        self._close()
+        self._stage = None
+        return {stage: round(seconds, 4) for stage, seconds in self.timings.items()}
+
+    def _close(self) -> None:
+        if self._stage is not None:
+            self.timings[self._stage] = self.timings.get(self._stage, 0.0) + time.perf_counter() - self._started
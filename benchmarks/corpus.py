@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import random
+import shutil
+from pathlib import Path
+from typing import Dict, List
+
+from app.core.config import settings
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SUPPORT_DOCS_DIR = REPO_ROOT / "support_docs"
+CHECKOUT_HTML = REPO_ROOT / "assets" / "checkout.html"
+
+# Synthetic documents are sized to roughly this many chunks so large corpora stay a few thousand files.
+CHUNKS_PER_DOCUMENT = 50
+
+_FILLER_WORDS = [
+    "cart", "checkout", "coupon", "shipping", "express", "standard", "payment", "paypal", "credit",
+    "email", "address", "validation", "banner", "subtotal", "total", "quantity", "product", "button",
+    "error", "message", "form", "field", "discount", "order", "refund", "inventory", "session", "token",
+]
+
+
+def base_paragraphs() -> List[str]:
+    paragraphs: List[str] = []
+    for path in sorted(SUPPORT_DOCS_DIR.glob("*")):
+        if path.suffix.lower() in {".md", ".txt"}:
+            paragraphs.extend(line.strip() for line in path.read_text(encoding="utf-8").splitlines() if line.strip())
+    return paragraphs
+
+
+def queries() -> List[str]:
+    """Retrieval queries taken from the real support docs, so relevant chunks exist at every scale."""
+    return [paragraph.lstrip("#- ").strip() for paragraph in base_paragraphs() if len(paragraph) > 20]
+
+
+def generate_corpus(directory: Path, target_chunks: int, seed: int = 13) -> Dict[str, Path]:
+    """Write the original support docs plus synthetic variants totalling about ``target_chunks`` chunks."""
+    if directory.exists():
+        shutil.rmtree(directory)
+    directory.mkdir(parents=True)
+
+    files: Dict[str, Path] = {}
+    for path in sorted(SUPPORT_DOCS_DIR.glob("*")):
+        target = directory / path.name
+        shutil.copyfile(path, target)
+        files[path.name] = target
+    html_target = directory / CHECKOUT_HTML.name
+    shutil.copyfile(CHECKOUT_HTML, html_target)
+    files[html_target.name] = html_target
+
+    rng = random.Random(seed)
+    paragraphs = base_paragraphs()
+    stride = max(settings.chunk_size - settings.chunk_overlap, 1)
+    remaining = target_chunks
+    document = 0
+    while remaining > 0:
+        chunks = min(CHUNKS_PER_DOCUMENT, remaining)
+        lines = [f"# Synthetic specification {document}"]
+        size = 0
+        while size < chunks * stride:
+            # Each line carries document-unique tokens so chunks are distinct for both indexes.
+            filler = " ".join(rng.choices(_FILLER_WORDS, k=8))
+            line = f"{rng.choice(paragraphs)} Applies to store {document}-{len(lines)}: {filler}."
+            lines.append(line)
+            size += len(line) + 1
+        name = f"synthetic_{document:05d}.md"
+        path = directory / name
+        path.write_text("\n".join(lines), encoding="utf-8")
+        files[name] = path
+        remaining -= chunks
+        document += 1
+    return files
@@ -0,0 +1,163 @@
+"""Offline end-to-end benchmark: ingestion, retrieval, prompt assembly and agent round trips.
+
+Runs without a GPU, model download or Groq key by swapping in ``HashEmbeddingService``
+and ``ScriptedLLMService``. Example::
+
+    python -m benchmarks.e2e --scales 1000,10000,100000 --output bench/e2e.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks.common import StageTimer, isolate_storage, latency_summary, peak_rss_mb, write_results
+from benchmarks.corpus import generate_corpus, queries
+from benchmarks.fakes import HashEmbeddingService, ScriptedLLMService
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="1000,10000", help="Comma-separated corpus sizes in chunks")
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default=None, help="Vector backend (default: settings)")
+    parser.add_argument("--queries", type=int, default=200, help="Retrieval queries per mode")
+    parser.add_argument("--agent-requests", type=int, default=30, help="Agent round trips per endpoint")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Simulated LLM latency per call")
+    parser.add_argument("--workdir", type=Path, default=None, help="Scratch directory (default: a temp dir)")
+    parser.add_argument("--output", type=Path, default=None, help="Write JSON here instead of stdout")
+    return parser.parse_args()
+
+
+def run_scale(target_chunks: int, args: argparse.Namespace, embedder: HashEmbeddingService, workdir: Path) -> Dict[str, Any]:
+    from app.models.schemas import SeleniumScriptRequest, TestCaseRequest
+    from app.services.agents import AgentOrchestrator
+    from app.services.context_packer import pack_contexts
+    from app.services.html_index import selector_index_store
+    from app.services.ingestion import KnowledgeBaseBuilder
+    from app.services.prompts import build_selenium_prompt, build_test_case_prompt
+    from app.services.retriever import KnowledgeRetriever
+    from app.services.state import app_state
+    from app.utils.parsers import extract_json_array
+
+    files = generate_corpus(workdir / f"corpus_{target_chunks}", target_chunks)
+    app_state.update_file("checkout.html", files["checkout.html"])
+    builder = KnowledgeBaseBuilder(embedding_service=embedder)
+
+    timer = StageTimer()
+    started = time.perf_counter()
+    summary = builder.build_knowledge_base(files, incremental=False, progress=timer)
+    full_seconds = time.perf_counter() - started
+    stages = timer.finish()
+
+    started = time.perf_counter()
+    builder.build_knowledge_base(files, incremental=True)
+    noop_seconds = time.perf_counter() - started
+
+    retriever = KnowledgeRetriever()
+    retriever.refresh()
+    query_set = (queries() * (args.queries // len(queries()) + 1))[: args.queries]
+    retrieval: Dict[str, Any] = {}
+    for mode in ("dense", "hybrid"):
+        cold: List[float] = []
+        for query in query_set:
+            retriever.result_cache.clear()
+            started = time.perf_counter()
+            retriever.retrieve(query, mode=mode)
+            cold.append(time.perf_counter() - started)
+        warm: List[float] = []
+        for query in query_set:
+            started = time.perf_counter()
+            retriever.retrieve(query, mode=mode)
+            warm.append(time.perf_counter() - started)
+        retrieval[mode] = {"uncached": latency_summary(cold), "cached": latency_summary(warm)}
+
+    page_index = selector_index_store.load(files["checkout.html"])
+    llm = ScriptedLLMService.from_fixture(latency_seconds=args.llm_latency_ms / 1000.0)
+    test_case_json = json.dumps(extract_json_array(llm.responses["test_cases"])[0], indent=2)
+    assembly: List[float] = []
+    selenium_assembly: List[float] = []
+    for query in query_set:
+        contexts = retriever.raw_search(query, 6)
+        started = time.perf_counter()
+        build_test_case_prompt(query, pack_contexts(contexts).contexts)
+        assembly.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        html_snippet = page_index.render(page_index.select(query))
+        build_selenium_prompt(test_case_json, pack_contexts(contexts).contexts, html_snippet)
+        selenium_assembly.append(time.perf_counter() - started)
+
+    orchestrator = AgentOrchestrator(retriever, llm_service=llm)
+
+    async def agent_round_trips() -> Dict[str, List[float]]:
+        timings: Dict[str, List[float]] = {"generate_test_cases": [], "generate_selenium_script": []}
+        for query in query_set[: args.agent_requests]:
+            started = time.perf_counter()
+            response = await orchestrator.generate_test_cases(TestCaseRequest(query=query, bypass_cache=True))
+            timings["generate_test_cases"].append(time.perf_counter() - started)
+            started = time.perf_counter()
+            await orchestrator.generate_selenium_script(
+                SeleniumScriptRequest(test_case=response.test_cases[0], bypass_cache=True)
+            )
+            timings["generate_selenium_script"].append(time.perf_counter() - started)
+        return timings
+
+    agents = {name: latency_summary(values) for name, values in asyncio.run(agent_round_trips()).items()}
+    prompt_tokens = sorted(llm.prompt_tokens)
+
+    return {
+        "target_chunks": target_chunks,
+        "documents": len(files),
+        "chunks": summary.chunks_total,
+        "ingestion": {
+            "full_build_seconds": round(full_seconds, 3),
+            "chunks_per_second": round(summary.chunks_total / full_seconds, 1) if full_seconds else None,
+            "stages_seconds": stages,
+            "noop_incremental_seconds": round(noop_seconds, 3),
+        },
+        "retrieval": retrieval,
+        "prompt_assembly": {
+            "test_cases": latency_summary(assembly),
+            "selenium": latency_summary(selenium_assembly),
+        },
+        "agents": agents,
+        "prompt_tokens": {
+            "p50": prompt_tokens[len(prompt_tokens) // 2] if prompt_tokens else None,
+            "max": prompt_tokens[-1] if prompt_tokens else None,
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory(prefix="qa-bench-") as scratch:
+        run(args, args.workdir or Path(scratch))
+
+
+def run(args: argparse.Namespace, workdir: Path) -> None:
+    isolate_storage(workdir)
+
+    from app.core.config import settings
+    from app.services.vector_store import vector_store_manager
+
+    if args.backend:
+        settings.vector_backend = args.backend
+    embedder = HashEmbeddingService()
+    vector_store_manager.embedding_service = embedder
+
+    results = []
+    for scale in (int(value) for value in args.scales.split(",") if value.strip()):
+        print(f"Running scale {scale} chunks in {workdir}", file=sys.stderr, flush=True)
+        results.append(run_scale(scale, args, embedder, workdir))
+    write_results("e2e", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Compare ONNX Runtime embedding backends against PyTorch for fidelity and throughput.
+
+Every ONNX variant must stay within ``--tolerance`` cosine similarity of the PyTorch
+vectors for every text; the script exits non-zero otherwise, so it can gate changes::
+
+    python -m benchmarks.embedding_backends --texts 2000 --threads 4 --output bench/embeddings.json
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from benchmarks.common import write_results
+from benchmarks.corpus import generate_corpus
+
+from app.core.config import settings
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--texts", type=int, default=2000, help="Number of chunk texts to embed")
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads for both runtimes")
+    parser.add_argument("--batch-size", type=int, default=settings.embedding_batch_size)
+    parser.add_argument("--tolerance", type=float, default=0.98, help="Minimum per-text cosine vs PyTorch")
+    parser.add_argument("--onnx-dir", type=Path, default=settings.onnx_model_dir, help="Where exported models live")
+    parser.add_argument("--output", type=Path, default=None)
+    return parser.parse_args()
+
+
+def sample_texts(count: int) -> List[str]:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    # Same splitter settings as ingestion, so texts have realistic chunk lengths.
+    splitter = RecursiveCharacterTextSplitter(chunk_size=settings.chunk_size, chunk_overlap=settings.chunk_overlap)
+    texts: List[str] = []
+    with tempfile.TemporaryDirectory(prefix="qa-bench-") as scratch:
+        for path in generate_corpus(Path(scratch), count).values():
+            if path.suffix == ".html":
+                continue
+            texts.extend(splitter.split_text(path.read_text(encoding="utf-8")))
+    return texts[:count]
+
+
+def timed(encode: Callable[[List[str]], np.ndarray], texts: List[str]) -> Dict[str, Any]:
+    encode(texts[: min(len(texts), 32)])  # warm-up: session/graph initialization is not throughput
+    started = time.perf_counter()
+    vectors = np.asarray(encode(texts), dtype=np.float32)
+    seconds = time.perf_counter() - started
+    return {"vectors": vectors, "seconds": round(seconds, 3), "chunks_per_second": round(len(texts) / seconds, 1)}
+
+
+def main() -> None:
+    args = parse_args()
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    from app.services.onnx_embeddings import OnnxEncoder
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    texts = sample_texts(args.texts)
+    model_dir = args.onnx_dir / settings.embedding_model_name.replace("/", "__")
+
+    reference_model = SentenceTransformer(settings.embedding_model_name, device="cpu")
+    reference = timed(
+        lambda batch: reference_model.encode(
+            batch, batch_size=args.batch_size, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False
+        ),
+        texts,
+    )
+    results: Dict[str, Any] = {
+        "texts": len(texts),
+        "threads": args.threads,
+        "tolerance": args.tolerance,
+        "backends": {"torch": {key: value for key, value in reference.items() if key != "vectors"}},
+    }
+
+    failed = False
+    for quantize in (False, True):
+        encoder = OnnxEncoder(settings.embedding_model_name, model_dir, quantize=quantize, threads=args.threads)
+        run = timed(lambda batch: encoder.encode(batch, args.batch_size), texts)
+        cosine = np.sum(run.pop("vectors") * reference["vectors"], axis=1)
+        run.update(
+            {
+                "speedup_vs_torch": round(reference["seconds"] / run["seconds"], 2),
+                "cosine_min": round(float(cosine.min()), 5),
+                "cosine_mean": round(float(cosine.mean()), 5),
+                "within_tolerance": bool(cosine.min() >= args.tolerance),
+            }
+        )
+        failed = failed or not run["within_tolerance"]
+        results["backends"][encoder.variant] = run
+
+    write_results("embedding_backends", results, args.output)
+    if failed:
+        print(f"ONNX embeddings diverge from PyTorch beyond cosine {args.tolerance}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+import zlib
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.context_packer import estimate_tokens
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class HashEmbeddingService:
+    """Deterministic stand-in for ``EmbeddingService``: signed feature hashing of word tokens.
+
+    Texts sharing words get similar vectors, which is enough to exercise retrieval paths
+    without downloading or running a model. Output is identical across runs and machines.
+    """
+
+    def __init__(self, dimension: int = 384) -> None:
+        self.dimension = dimension
+        self.calls = 0
+        self.texts_embedded = 0
+        self._buckets: Dict[str, Tuple[int, float]] = {}
+
+    def embed_texts(self, texts: Iterable[str]) -> List[List[float]]:
+        texts = list(texts)
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in _TOKEN_RE.findall(text.lower()):
+                column, sign = self._bucket(token)
+                matrix[row, column] += sign
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_texts(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_texts([text])[0]
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        return {}
+
+    def _bucket(self, token: str) -> Tuple[int, float]:
+        bucket = self._buckets.get(token)
+        if bucket is None:
+            digest = zlib.crc32(token.encode("utf-8"))
+            bucket = (digest % self.dimension, 1.0 if digest & 0x80000000 else -1.0)
+            self._buckets[token] = bucket
+        return bucket
+
+
+class ScriptedLLMService:
+    """Replays recorded completions in place of ``LLMService`` and records prompt sizes."""
+
+    model_name = "scripted"
+    temperature = 0.0
+    response_cache = None
+
+    def __init__(self, responses: Dict[str, str], latency_seconds: float = 0.0, stream_chunk_chars: int = 16) -> None:
+        self.responses = responses
+        self.latency_seconds = latency_seconds
+        self.stream_chunk_chars = stream_chunk_chars
+        self.prompt_tokens: List[int] = []
+
+    @classmethod
+    def from_fixture(cls, path: Optional[Path] = None, **kwargs: float) -> "ScriptedLLMService":
+        path = path or FIXTURES_DIR / "recorded_responses.json"
+        return cls(json.loads(path.read_text(encoding="utf-8")), **kwargs)
+
+    def model_for(self, messages: Sequence) -> str:
+        return self.model_name
+
+    async def ainvoke(self, messages: Sequence) -> str:
+        response = self._response_for(messages)
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return response
+
+    async def astream(self, messages: Sequence) -> AsyncIterator[str]:
+        response = self._response_for(messages)
+        pieces = range(0, len(response), self.stream_chunk_chars)
+        delay = self.latency_seconds / max(len(pieces), 1)
+        for start in pieces:
+            if delay:
+                await asyncio.sleep(delay)
+            yield response[start : start + self.stream_chunk_chars]
+
+    async def aclose(self) -> None:
+        return None
+
+    def _response_for(self, messages: Sequence) -> str:
+        prompt = str(messages[-1].content)
+        self.prompt_tokens.append(sum(estimate_tokens(str(message.content)) for message in messages))
+        kind = "selenium_script" if "TEST CASE JSON" in prompt else "test_cases"
+        return self.responses[kind]
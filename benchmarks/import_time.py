@@ -0,0 +1,147 @@
+"""Import-time and cold-start regression check for the API module.
+
+Imports ``app.api.main`` in a fresh interpreter and fails if that takes longer than
+``--max-import-seconds`` or pulls in any heavy ML/vector dependency, which should only
+load on first use (or during the optional startup warm-up)::
+
+    python -m benchmarks.import_time --max-import-seconds 1.0 --startup
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from benchmarks.common import REPO_ROOT, write_results
+
+HEAVY_MODULES = (
+    "torch",
+    "sentence_transformers",
+    "onnxruntime",
+    "chromadb",
+    "langchain",
+    "langchain_core",
+    "langchain_community",
+    "langchain_groq",
+    "langchain_text_splitters",
+    "groq",
+    "unstructured",
+    "fitz",
+    # Lighter, but together ~0.2s of the API import; only ingestion and search need them.
+    "numpy",
+    "bs4",
+    "soupsieve",
+)
+
+# Runs in the child interpreter. Modules already present before the import (site hooks,
+# interpreter start-up) are not attributed to the app.
+_PROBE = """
+import json, sys, time
+before = set(sys.modules)
+started = time.perf_counter()
+import app.api.main
+elapsed = time.perf_counter() - started
+print(json.dumps({"seconds": elapsed, "modules": sorted(set(sys.modules) - before)}))
+"""
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Fresh-interpreter imports to time")
+    parser.add_argument("--max-import-seconds", type=float, default=1.0, help="Fail above this median import time")
+    parser.add_argument("--startup", action="store_true", help="Also time process start to first /health under uvicorn")
+    parser.add_argument("--startup-timeout", type=float, default=30.0)
+    parser.add_argument("--output", type=Path, default=None)
+    return parser.parse_args()
+
+
+def child_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(REPO_ROOT), env.get("PYTHONPATH")]))
+    # Settings validation needs a key; nothing is sent anywhere at import time.
+    env.setdefault("GROQ_API_KEY", "import-time-check")
+    return env
+
+
+def measure_import() -> Dict[str, Any]:
+    completed = subprocess.run(
+        [sys.executable, "-c", _PROBE],
+        cwd=REPO_ROOT,
+        env=child_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_startup(timeout: float) -> Optional[float]:
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.api.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_ROOT,
+        env=child_env(),
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                return None
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1.0):
+                    return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.02)
+        return None
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main() -> None:
+    args = parse_args()
+    runs = [measure_import() for _ in range(max(args.runs, 1))]
+    seconds = sorted(run["seconds"] for run in runs)
+    median = seconds[len(seconds) // 2]
+    leaked = sorted(
+        {module for run in runs for module in run["modules"] if module.split(".")[0] in HEAVY_MODULES}
+    )
+
+    results: Dict[str, Any] = {
+        "import_seconds": {"median": round(median, 3), "min": round(seconds[0], 3), "max": round(seconds[-1], 3)},
+        "max_import_seconds": args.max_import_seconds,
+        "heavy_modules_imported": leaked,
+    }
+    if args.startup:
+        startup = measure_startup(args.startup_timeout)
+        results["startup_to_first_health_seconds"] = round(startup, 3) if startup is not None else None
+
+    write_results("import_time", results, args.output)
+    failures = []
+    if median > args.max_import_seconds:
+        failures.append(f"import took {median:.3f}s (limit {args.max_import_seconds:.3f}s)")
+    if leaked:
+        failures.append("heavy modules imported eagerly: " + ", ".join(leaked))
+    if args.startup and results["startup_to_first_health_seconds"] is None:
+        failures.append("server did not answer /health in time")
+    if failures:
+        print("Import-time regression: " + "; ".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Resident memory as the number of projects grows past ``MAX_LOADED_PROJECTS``.
+
+Builds ``--projects`` knowledge bases of about ``--chunks`` chunks each, querying every
+project right after its build (as ``/ingest`` does), then queries them round-robin for
+``--rounds`` passes. Resident memory and the number of HNSW segments Chroma holds in
+memory are sampled as projects are added. Exits non-zero if more indexes stay in memory
+than ``--max-loaded`` allows, or if resident memory grows by more than ``--max-growth-mb``
+once the LRU is full::
+
+    python -m benchmarks.project_memory --projects 40 --max-loaded 4 --chunks 2000
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import logging
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import isolate_storage, peak_rss_mb, write_results
+from benchmarks.corpus import generate_corpus, queries
+from benchmarks.fakes import HashEmbeddingService
+
+from app.core.config import settings
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--projects", type=int, default=24, help="Projects to build and query")
+    parser.add_argument("--max-loaded", type=int, default=4, help="MAX_LOADED_PROJECTS for the run")
+    parser.add_argument("--chunks", type=int, default=2000, help="Approximate chunks per project")
+    parser.add_argument("--rounds", type=int, default=2, help="Round-robin query passes after building")
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default="chroma")
+    parser.add_argument("--sample-every", type=int, default=4, help="Sample memory every N projects")
+    parser.add_argument("--max-growth-mb", type=float, default=64.0, help="Allowed RSS growth once the LRU is full")
+    parser.add_argument("--workdir", type=Path, default=None, help="Scratch directory (default: a temp dir)")
+    parser.add_argument("--output", type=Path, default=None, help="Write JSON here instead of stdout")
+    return parser.parse_args()
+
+
+def resident_mb() -> float:
+    gc.collect()
+    try:
+        with open("/proc/self/statm", encoding="ascii") as handle:
+            pages = int(handle.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except OSError:
+        # Not Linux: the peak is the best available approximation.
+        return peak_rss_mb()["self"]
+
+
+def loaded_segments() -> Optional[int]:
+    """HNSW segments the Chroma client currently holds in memory."""
+    if settings.vector_backend != "chroma":
+        return None
+    from chromadb.api.client import SharedSystemClient
+    from chromadb.segment import SegmentManager
+
+    system = SharedSystemClient._identifier_to_system.get(str(settings.chroma_dir))
+    if system is None:
+        return 0
+    manager = system.instance(SegmentManager)
+    return sum(1 for instance in list(manager._instances.values()) if hasattr(instance, "_index"))
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    settings.vector_backend = args.backend
+    settings.max_loaded_projects = args.max_loaded
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="qa-projects-"))
+    isolate_storage(workdir)
+
+    from app.services.ingestion import KnowledgeBaseBuilder
+    from app.services.retriever import KnowledgeRetriever
+    from app.services.vector_store import vector_store_manager
+    from app.utils.cache import LRUCache
+
+    embedder = HashEmbeddingService()
+    vector_store_manager.embedding_service = embedder
+    builder = KnowledgeBaseBuilder(embedding_service=embedder)
+    retriever = KnowledgeRetriever()
+    retriever.result_cache = LRUCache(0)
+    files = generate_corpus(workdir / "corpus", args.chunks)
+    query_set = queries()
+    project_ids = [f"tenant-{number:03d}" for number in range(args.projects)]
+
+    samples: List[Dict[str, Any]] = [{"projects": 0, "rss_mb": resident_mb(), "segments": loaded_segments()}]
+    for number, project_id in enumerate(project_ids, start=1):
+        builder.build_knowledge_base(files, incremental=False, project_id=project_id)
+        retriever.retrieve(query_set[number % len(query_set)], project_id=project_id)
+        if number % args.sample_every == 0 or number == len(project_ids):
+            sample = {
+                "projects": number,
+                "rss_mb": resident_mb(),
+                "segments": loaded_segments(),
+                "loaded": len(vector_store_manager.loaded_projects()),
+            }
+            samples.append(sample)
+            print(f"{number} projects: {sample['rss_mb']} MB resident, {sample['segments']} segments", file=sys.stderr)
+
+    for round_number in range(args.rounds):
+        for position, project_id in enumerate(project_ids):
+            retriever.retrieve(query_set[(round_number + position) % len(query_set)], project_id=project_id)
+    after_rounds = {"rss_mb": resident_mb(), "segments": loaded_segments()}
+
+    # Growth is measured from the first sample taken with the LRU already full.
+    full = next((sample for sample in samples if sample["projects"] >= args.max_loaded), samples[-1])
+    growth = round(max(sample["rss_mb"] for sample in samples[1:] + [after_rounds]) - full["rss_mb"], 1)
+    most_segments = max((sample["segments"] or 0) for sample in samples + [after_rounds])
+    results: Dict[str, Any] = {
+        "backend": args.backend,
+        "projects": args.projects,
+        "max_loaded_projects": args.max_loaded,
+        "chunks_per_project": args.chunks,
+        "samples": samples,
+        "after_round_robin": after_rounds,
+        "rss_growth_after_lru_full_mb": growth,
+        "max_segments_in_memory": most_segments if args.backend == "chroma" else None,
+    }
+    write_results("project_memory", results, args.output)
+
+    problems = []
+    if args.backend == "chroma" and most_segments > args.max_loaded:
+        problems.append(f"{most_segments} HNSW segments in memory (limit {args.max_loaded})")
+    if growth > args.max_growth_mb:
+        problems.append(f"resident memory grew {growth} MB after the LRU filled (limit {args.max_growth_mb} MB)")
+    if problems:
+        print("Project memory regression: " + "; ".join(problems), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
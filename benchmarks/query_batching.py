@@ -0,0 +1,102 @@
+"""Query embedding throughput under concurrency, with and without micro-batching.
+
+Runs ``--clients`` threads that each embed distinct query texts through
+``EmbeddingService.embed_query`` (query and disk caches disabled, so every call reaches
+the model) once per batching window in ``--windows-ms``; ``0`` is the unbatched baseline::
+
+    python -m benchmarks.query_batching --clients 1,8,32 --windows-ms 0,2,5 --queries 2000
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks.common import latency_summary, write_results
+from benchmarks.corpus import queries
+
+from app.core.config import settings
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", default="1,8,32", help="Comma-separated concurrent caller counts")
+    parser.add_argument("--windows-ms", default="0,2,5", help="Comma-separated batching windows; 0 disables batching")
+    parser.add_argument("--queries", type=int, default=1000, help="Queries per run, split across clients")
+    parser.add_argument("--output", type=Path, default=None, help="Write JSON here instead of stdout")
+    return parser.parse_args()
+
+
+def run(service, clients: int, texts: List[str]) -> Dict[str, Any]:
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def client(offset: int) -> None:
+        local: List[float] = []
+        for text in texts[offset::clients]:
+            started = time.perf_counter()
+            service.embed_query(text)
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(offset,)) for offset in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+    return {"queries_per_second": round(len(texts) / seconds, 1), "latency": latency_summary(latencies)}
+
+
+def batch_size_totals() -> Dict[str, float]:
+    from app.utils.metrics import EMBEDDING_BATCH_SIZE
+
+    samples = {sample.name: sample.value for sample in EMBEDDING_BATCH_SIZE.collect()[0].samples}
+    return {"count": samples.get("qa_embedding_batch_size_count", 0.0), "sum": samples.get("qa_embedding_batch_size_sum", 0.0)}
+
+
+def main() -> None:
+    args = parse_args()
+    from app.services.embeddings import EmbeddingService
+
+    settings.embedding_cache_enabled = False
+    settings.query_embedding_cache_size = 0
+    base = queries()
+    results: Dict[str, Any] = {"queries": args.queries, "runs": []}
+    for window_ms in [float(value) for value in args.windows_ms.split(",")]:
+        settings.embedding_batch_window_ms = window_ms
+        service = EmbeddingService()
+        service.embed_query("warm-up")
+        for clients in [int(value) for value in args.clients.split(",")]:
+            # Distinct texts per run, so nothing can be deduplicated across callers.
+            texts = [f"{base[position % len(base)]} #{window_ms}-{clients}-{position}" for position in range(args.queries)]
+            before = batch_size_totals()
+            result = run(service, clients, texts)
+            after = batch_size_totals()
+            batches = after["count"] - before["count"]
+            result.update(
+                {
+                    "window_ms": window_ms,
+                    "clients": clients,
+                    "mean_batch_size": round((after["sum"] - before["sum"]) / batches, 2) if batches else 1.0,
+                }
+            )
+            results["runs"].append(result)
+
+    write_results("query_batching", results, args.output)
+    print(f"{'window_ms':>9} {'clients':>7} {'qps':>9} {'p50_ms':>8} {'p99_ms':>8} {'batch':>6}", file=sys.stderr)
+    for result in results["runs"]:
+        print(
+            f"{result['window_ms']:>9} {result['clients']:>7} {result['queries_per_second']:>9} "
+            f"{result['latency']['p50_ms']:>8} {result['latency']['p99_ms']:>8} {result['mean_batch_size']:>6}",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Retrieval quality vs. latency across chunking, index and retrieval parameters.
+
+Labeled queries (``fixtures/retrieval_queries.json``) name the document and a passage
+that answers them; a result is relevant when it comes from that document and contains
+the passage. Synthetic documents at larger scales reuse the real paragraphs, so they act
+as near-duplicate distractors. Every grid point reports recall@k, MRR, p50/p99 latency
+and index size, and each scale gets a recommendation: the best MRR within the latency
+budget::
+
+    python -m benchmarks.retrieval_quality --scales 0,10000 --chunking 400:60,800:120 \\
+        --backends numpy,chroma --hnsw 16:10,16:64,32:128 --output bench/retrieval.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks.common import isolate_storage, latency_summary, write_results
+from benchmarks.corpus import CHECKOUT_HTML, SUPPORT_DOCS_DIR, generate_corpus
+from benchmarks.fakes import FIXTURES_DIR, HashEmbeddingService
+
+from app.core.config import settings
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="0,2000", help="Synthetic chunks added to the real docs, comma-separated")
+    parser.add_argument("--chunking", default="400:60,800:120,1200:180", help="chunk_size:chunk_overlap pairs")
+    parser.add_argument("--backends", default="numpy", help="Comma-separated vector backends")
+    parser.add_argument("--hnsw", default="16:10,16:64,32:128", help="M:search_ef pairs (Chroma only)")
+    parser.add_argument("--modes", default="dense,hybrid", help="Comma-separated retrieval modes")
+    parser.add_argument("--top-k", default="1,3,5,10", help="Comma-separated k values")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed passes over the query set")
+    parser.add_argument("--latency-budget-ms", type=float, default=50.0, help="p99 limit for the recommendation")
+    parser.add_argument("--embedding", choices=["hash", "model"], default="hash", help="hash: offline stand-in")
+    parser.add_argument("--queries", type=Path, default=FIXTURES_DIR / "retrieval_queries.json")
+    parser.add_argument("--workdir", type=Path, default=None, help="Scratch directory (default: a temp dir)")
+    parser.add_argument("--output", type=Path, default=None, help="Write JSON here instead of stdout")
+    return parser.parse_args()
+
+
+def pairs(value: str) -> List[Tuple[int, int]]:
+    return [tuple(int(part) for part in item.split(":")) for item in value.split(",")]  # type: ignore[misc]
+
+
+def normalize(text: str) -> str:
+    return _WHITESPACE_RE.sub(" ", text).strip().lower()
+
+
+def is_relevant(payload: dict, label: Dict[str, str]) -> bool:
+    return payload["metadata"].get("source") == label["source"] and normalize(label["answer"]) in normalize(
+        payload["page_content"]
+    )
+
+
+def first_relevant_rank(results: List[dict], label: Dict[str, str]) -> Optional[int]:
+    for rank, payload in enumerate(results, start=1):
+        if is_relevant(payload, label):
+            return rank
+    return None
+
+
+def check_labels(labels: List[Dict[str, str]]) -> None:
+    """Every labeled passage must exist in its document as ingested, or recall is meaningless."""
+    from app.services.document_loader import load_document
+
+    files = corpus_files(Path("."), 0)
+    texts = {name: normalize(load_document(name, path)) for name, path in files.items()}
+    broken = [label["query"] for label in labels if normalize(label["answer"]) not in texts.get(label["source"], "")]
+    if broken:
+        raise SystemExit("Labels whose answer is not in their source document: " + "; ".join(broken))
+
+
+def directory_bytes(directory: Path) -> int:
+    if not directory.is_dir():
+        return 0
+    return sum(path.stat().st_size for path in directory.rglob("*") if path.is_file())
+
+
+def corpus_files(workdir: Path, scale: int) -> Dict[str, Path]:
+    if scale > 0:
+        return generate_corpus(workdir / f"corpus_{scale}", scale)
+    files = {path.name: path for path in sorted(SUPPORT_DOCS_DIR.glob("*"))}
+    files[CHECKOUT_HTML.name] = CHECKOUT_HTML
+    return files
+
+
+def evaluate(labels: List[Dict[str, str]], mode: str, top_ks: List[int], repeats: int) -> Dict[str, Any]:
+    from app.services.retriever import KnowledgeRetriever
+    from app.utils.cache import LRUCache
+
+    settings.retrieval_mode = mode
+    retriever = KnowledgeRetriever()
+    # Measure the index, not the result cache.
+    retriever.result_cache = LRUCache(0)
+    depth = max(top_ks)
+    ranks = [first_relevant_rank(retriever.raw_search(label["query"], depth), label) for label in labels]
+    latencies: List[float] = []
+    for _ in range(repeats):
+        for label in labels:
+            started = time.perf_counter()
+            retriever.raw_search(label["query"], depth)
+            latencies.append(time.perf_counter() - started)
+    return {
+        "recall": {f"@{k}": round(sum(1 for rank in ranks if rank and rank <= k) / len(labels), 4) for k in top_ks},
+        "mrr": round(sum(1.0 / rank for rank in ranks if rank) / len(labels), 4),
+        "missed": [label["query"] for label, rank in zip(labels, ranks) if rank is None],
+        "latency": latency_summary(latencies),
+    }
+
+
+def index_footprint() -> Dict[str, int]:
+    from app.services.vector_store import vector_store_manager
+
+    with vector_store_manager.lease() as knowledge_base:
+        return {
+            "chunks": knowledge_base.vector_index.count(),
+            "vector_index_bytes": knowledge_base.vector_index.size_bytes(),
+            "lexical_index_bytes": directory_bytes(knowledge_base.storage.lexical_index_dir),
+        }
+
+
+def index_variants(backend: str, hnsw: List[Tuple[int, int]]) -> List[Optional[Dict[str, int]]]:
+    if backend != "chroma":
+        return [None]
+    return [{"M": m, "search_ef": search_ef} for m, search_ef in hnsw]
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    labels = json.loads(args.queries.read_text(encoding="utf-8"))
+    check_labels(labels)
+    top_ks = [int(value) for value in args.top_k.split(",")]
+    modes = args.modes.split(",")
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="qa-retrieval-"))
+
+    from app.services.ingestion import KnowledgeBaseBuilder
+    from app.services.vector_store import vector_store_manager
+
+    embedder = HashEmbeddingService() if args.embedding == "hash" else None
+    runs: List[Dict[str, Any]] = []
+    for scale in [int(value) for value in args.scales.split(",")]:
+        for chunk_size, chunk_overlap in pairs(args.chunking):
+            settings.chunk_size, settings.chunk_overlap = chunk_size, chunk_overlap
+            files = corpus_files(workdir, scale)
+            for backend in args.backends.split(","):
+                settings.vector_backend = backend
+                isolate_storage(workdir / f"store_{scale}_{chunk_size}_{chunk_overlap}_{backend}")
+                if embedder is not None:
+                    vector_store_manager.embedding_service = embedder
+                else:
+                    vector_store_manager.reset_all()
+                builder = KnowledgeBaseBuilder(embedding_service=embedder)
+                built = False
+                for variant in index_variants(backend, pairs(args.hnsw)):
+                    started = time.perf_counter()
+                    if not built:
+                        if variant:
+                            settings.chroma_hnsw_m, settings.chroma_hnsw_search_ef = variant["M"], variant["search_ef"]
+                        builder.build_knowledge_base(files, incremental=False)
+                        built = True
+                    else:
+                        # Same chunks and vectors, new graph: no re-embedding per index variant.
+                        builder.reindex(variant)
+                    build_seconds = time.perf_counter() - started
+                    footprint = index_footprint()
+                    for mode in modes:
+                        result = evaluate(labels, mode, top_ks, args.repeats)
+                        result.update(
+                            {
+                                "scale": scale,
+                                "chunk_size": chunk_size,
+                                "chunk_overlap": chunk_overlap,
+                                "backend": backend,
+                                "hnsw": variant,
+                                "mode": mode,
+                                "build_seconds": round(build_seconds, 3),
+                                **footprint,
+                            }
+                        )
+                        runs.append(result)
+                        print(describe(result), file=sys.stderr)
+
+    recommendations = {}
+    for scale in sorted({run["scale"] for run in runs}):
+        candidates = [run for run in runs if run["scale"] == scale]
+        within = [run for run in candidates if run["latency"]["p99_ms"] <= args.latency_budget_ms] or candidates
+        best = max(within, key=lambda run: (run["mrr"], -run["latency"]["p99_ms"]))
+        recommendations[str(scale)] = {key: best[key] for key in ("chunk_size", "chunk_overlap", "backend", "hnsw", "mode")}
+        recommendations[str(scale)].update({"mrr": best["mrr"], "p99_ms": best["latency"]["p99_ms"]})
+
+    results = {
+        "embedding": args.embedding,
+        "queries": len(labels),
+        "latency_budget_ms": args.latency_budget_ms,
+        "runs": runs,
+        "recommended": recommendations,
+    }
+    write_results("retrieval_quality", results, args.output)
+    print_table(runs, top_ks)
+
+
+def describe(run: Dict[str, Any]) -> str:
+    hnsw = f" M={run['hnsw']['M']} ef={run['hnsw']['search_ef']}" if run["hnsw"] else ""
+    return (
+        f"scale={run['scale']} chunk={run['chunk_size']}/{run['chunk_overlap']} {run['backend']}{hnsw} "
+        f"{run['mode']}: mrr={run['mrr']} p99={run['latency']['p99_ms']}ms"
+    )
+
+
+def print_table(runs: List[Dict[str, Any]], top_ks: List[int]) -> None:
+    recall_headers = "".join(f"{'R@' + str(k):>7}" for k in top_ks)
+    print(
+        f"{'scale':>6} {'chunk':>9} {'backend':>7} {'hnsw':>9} {'mode':>6}{recall_headers} {'MRR':>6} "
+        f"{'p50_ms':>7} {'p99_ms':>7} {'index_KiB':>10}",
+        file=sys.stderr,
+    )
+    for run in runs:
+        hnsw = f"{run['hnsw']['M']}/{run['hnsw']['search_ef']}" if run["hnsw"] else "-"
+        recalls = "".join(f"{run['recall'][f'@{k}']:>7}" for k in top_ks)
+        size_kib = (run["vector_index_bytes"] + run["lexical_index_bytes"]) // 1024
+        print(
+            f"{run['scale']:>6} {str(run['chunk_size']) + '/' + str(run['chunk_overlap']):>9} {run['backend']:>7} "
+            f"{hnsw:>9} {run['mode']:>6}{recalls} {run['mrr']:>6} {run['latency']['p50_ms']:>7} "
+            f"{run['latency']['p99_ms']:>7} {size_kib:>10}",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Blue/green index swap check: query continuously while the knowledge base is rebuilt.
+
+Reader threads run hybrid retrievals (dense search, lexical search and fetch-by-ID) with
+the result cache disabled while the main thread rebuilds the index repeatedly. Exits
+non-zero if any query fails, any query stalls beyond ``--stall-ms``, or superseded index
+versions are still on disk once the readers stop::
+
+    python -m benchmarks.swap_under_load --chunks 5000 --rebuilds 10 --readers 8
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks.common import isolate_storage, latency_summary, write_results
+from benchmarks.corpus import generate_corpus, queries
+from benchmarks.fakes import HashEmbeddingService
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=2000, help="Approximate corpus size in chunks")
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default=None, help="Vector backend (default: settings)")
+    parser.add_argument("--rebuilds", type=int, default=6, help="Index rebuilds while readers are running")
+    parser.add_argument("--readers", type=int, default=8, help="Concurrent query threads")
+    parser.add_argument("--full", action="store_true", help="Full rebuilds instead of incremental ones")
+    parser.add_argument("--stall-ms", type=float, default=2000.0, help="A query slower than this counts as stalled")
+    parser.add_argument("--workdir", type=Path, default=None, help="Scratch directory (default: a temp dir)")
+    parser.add_argument("--output", type=Path, default=None, help="Write JSON here instead of stdout")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    from app.core.config import settings
+
+    if args.backend:
+        settings.vector_backend = args.backend
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="qa-swap-"))
+    isolate_storage(workdir)
+
+    from app.services.index_versions import IndexVersions
+    from app.services.ingestion import KnowledgeBaseBuilder
+    from app.services.projects import project_storage
+    from app.services.retriever import KnowledgeRetriever
+    from app.services.vector_store import vector_store_manager
+    from app.utils.cache import LRUCache
+
+    embedder = HashEmbeddingService()
+    vector_store_manager.embedding_service = embedder
+    builder = KnowledgeBaseBuilder(embedding_service=embedder)
+    files = generate_corpus(workdir / "corpus", args.chunks)
+    builder.build_knowledge_base(files, incremental=False)
+
+    retriever = KnowledgeRetriever()
+    # Every query has to reach the index; cached results would hide a broken swap.
+    retriever.result_cache = LRUCache(0)
+    query_set = queries()
+    latencies: List[float] = []
+    failures: List[str] = []
+    empty_results = 0
+    stop = threading.Event()
+    lock = threading.Lock()
+
+    def reader(offset: int) -> None:
+        nonlocal empty_results
+        position = offset
+        while not stop.is_set():
+            query = query_set[position % len(query_set)]
+            position += 1
+            started = time.perf_counter()
+            try:
+                results = retriever.retrieve(query, mode="hybrid")
+            except Exception as exc:  # noqa: BLE001
+                with lock:
+                    failures.append(f"{type(exc).__name__}: {exc}")
+                continue
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                empty_results += not results
+
+    threads = [threading.Thread(target=reader, args=(offset,), daemon=True) for offset in range(args.readers)]
+    for thread in threads:
+        thread.start()
+
+    extra = workdir / "corpus" / "swap-note.md"
+    rebuild_seconds: List[float] = []
+    for rebuild in range(args.rebuilds):
+        # Alternate an extra document in and out so every rebuild produces a new version.
+        current = dict(files)
+        if rebuild % 2 == 0:
+            extra.write_text(f"# Swap note {rebuild}\nRebuild {rebuild} adds this note about coupon swaps.\n")
+            current[extra.name] = extra
+        started = time.perf_counter()
+        summary = builder.build_knowledge_base(current, incremental=not args.full)
+        rebuild_seconds.append(time.perf_counter() - started)
+        print(f"rebuild {rebuild + 1}/{args.rebuilds}: serving {summary.index_version}", file=sys.stderr)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    versions = IndexVersions(project_storage())
+    stalled = sum(1 for seconds in latencies if seconds * 1000.0 > args.stall_ms)
+    results: Dict[str, Any] = {
+        "backend": settings.vector_backend,
+        "readers": args.readers,
+        "rebuilds": args.rebuilds,
+        "incremental": not args.full,
+        "queries": len(latencies) + len(failures),
+        "failed_queries": len(failures),
+        "failure_samples": failures[:5],
+        "empty_results": empty_results,
+        "stalled_queries": stalled,
+        "query_latency": latency_summary(latencies),
+        "rebuild_latency": latency_summary(rebuild_seconds),
+        "active_version": versions.active(),
+        "versions_on_disk": versions.versions(),
+        "leases_after_run": vector_store_manager.active_leases(),
+    }
+    write_results("swap_under_load", results, args.output)
+
+    problems = []
+    if failures:
+        problems.append(f"{len(failures)} queries failed")
+    if stalled:
+        problems.append(f"{stalled} queries took longer than {args.stall_ms:.0f}ms")
+    if results["versions_on_disk"] != [results["active_version"]]:
+        problems.append(f"superseded versions left on disk: {results['versions_on_disk']}")
+    if problems:
+        print("Index swap regression: " + "; ".join(problems), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
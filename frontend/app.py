@@ -4,13 +4,14 @@ import io
 import json
 import time
 import uuid
-from typing import Dict, List
+from typing import Dict, Iterator, List, Tuple
 
 import httpx
 import streamlit as st
 import streamlit.components.v1 as components
 
 API_BASE_URL = "http://localhost:8000"
+PROJECT_ID = "default"
 
 st.set_page_config(page_title="QA Testing Brain", layout="wide")
 st.title("QA Testing Brain")
@@ -46,6 +47,10 @@ st.markdown(
 )
 
 
+def project_endpoint(endpoint: str) -> str:
+    return f"/projects/{PROJECT_ID}{endpoint}"
+
+
 def post_files(endpoint: str, files: Dict[str, io.BytesIO]) -> dict:
     multipart_files = []
     for filename, buffer in files.items():
@@ -57,6 +62,27 @@ def post_files(endpoint: str, files: Dict[str, io.BytesIO]) -> dict:
         return response.json()
 
 
+def get_json(endpoint: str) -> dict:
+    with httpx.Client(timeout=30.0) as client:
+        response = client.get(f"{API_BASE_URL}{endpoint}")
+        response.raise_for_status()
+        return response.json()
+
+
+def wait_for_job(job: dict, progress_bar) -> dict:
+    while job.get("status") not in {"succeeded", "failed"}:
+        time.sleep(0.5)
+        job = get_json(f"/jobs/{job['job_id']}")
+        if job.get("chunks_to_embed"):
+            fraction = job.get("chunks_embedded", 0) / job["chunks_to_embed"]
+            label = f"{job['stage'].title()} · {job.get('chunks_embedded', 0)}/{job['chunks_to_embed']} chunks embedded"
+        else:
+            fraction = job.get("documents_parsed", 0) / max(job.get("documents_total", 0), 1)
+            label = f"{job['stage'].title()} · {job.get('documents_parsed', 0)}/{job.get('documents_total', 0)} documents parsed"
+        progress_bar.progress(min(fraction, 1.0), text=label)
+    return job
+
+
 def post_json(endpoint: str, payload: dict) -> dict:
     with httpx.Client(timeout=180.0) as client:
         response = client.post(f"{API_BASE_URL}{endpoint}", json=payload)
@@ -64,6 +90,23 @@ def post_json(endpoint: str, payload: dict) -> dict:
         return response.json()
 
 
+def stream_events(endpoint: str, payload: dict) -> Iterator[Tuple[str, dict]]:
+    with httpx.Client(timeout=httpx.Timeout(180.0, connect=10.0)) as client:
+        with client.stream("POST", f"{API_BASE_URL}{endpoint}", json=payload) as response:
+            if response.is_error:
+                response.read()
+                response.raise_for_status()
+            event, data_lines = "message", []
+            for line in response.iter_lines():
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data_lines.append(line[len("data:"):].strip())
+                elif not line and data_lines:
+                    yield event, json.loads("\n".join(data_lines))
+                    event, data_lines = "message", []
+
+
 if "test_cases" not in st.session_state:
     st.session_state.test_cases = []
 
@@ -95,6 +138,7 @@ def render_copy_button(script: str, key: str) -> None:
 
 with st.sidebar:
     API_BASE_URL = st.text_input("FastAPI Base URL", value=API_BASE_URL)
+    PROJECT_ID = st.text_input("Project", value=PROJECT_ID, help="Each project has its own knowledge base.").strip() or "default"
 
 st.markdown("<div class='phase-label'>Phase 1</div>", unsafe_allow_html=True)
 st.subheader("Build the knowledge base", anchor=False)
@@ -124,17 +168,24 @@ if build_kb:
             buffer = io.BytesIO(html_files.getvalue())
             buffers[html_files.name] = buffer
 
-        with st.spinner("Building knowledge base with high-fidelity embeddings and metadata..."):
-            start_time = time.perf_counter()
-            try:
-                payload = post_files("/ingest", buffers)
-            except Exception as exc:  # noqa: BLE001
-                st.error(f"Failed to build knowledge base: {exc}")
+        progress_bar = st.progress(0.0, text="Uploading documents...")
+        start_time = time.perf_counter()
+        try:
+            job = wait_for_job(post_files(project_endpoint("/ingest"), buffers), progress_bar)
+        except Exception as exc:  # noqa: BLE001
+            st.error(f"Failed to build knowledge base: {exc}")
+        else:
+            progress_bar.empty()
+            payload = job.get("result") or {}
+            if job.get("status") != "succeeded":
+                st.error(f"Failed to build knowledge base: {job.get('error')}")
             else:
                 duration = payload.get("duration_seconds", time.perf_counter() - start_time)
                 st.success(
                     f"Knowledge base built in {duration:.2f}s · {payload.get('documents_processed', 0)} documents"
                 )
+                for filename, error in payload.get("failed_documents", {}).items():
+                    st.warning(f"{filename} could not be parsed: {error}")
                 st.session_state.test_cases = []
 
 st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
@@ -150,6 +201,7 @@ query = st.text_area(
 controls_col, info_col = st.columns([1, 3], gap="large")
 with controls_col:
     top_k = st.number_input("Retriever Top-K", min_value=1, max_value=12, value=6, step=1)
+    bypass_cache = st.checkbox("Skip response cache", value=False)
 with info_col:
     st.caption("Describe the coverage you need; retrieved context keeps every test grounded in the docs.")
 
@@ -159,16 +211,33 @@ if generate_cases:
     if not query.strip():
         st.error("Please provide an instruction for the agent.")
     else:
-        with st.spinner("Retrieving knowledge base context and drafting cases..."):
-            try:
-                response = post_json("/generate-test-cases", {"query": query, "top_k": top_k})
-            except httpx.HTTPStatusError as exc:
-                st.error(f"Agent failed: {exc.response.text}")
-            except Exception as exc:  # noqa: BLE001
-                st.error(f"Unexpected error: {exc}")
-            else:
-                st.session_state.test_cases = response.get("test_cases", [])
-                st.success(f"Generated {len(st.session_state.test_cases)} test cases.")
+        status = st.empty()
+        live_cases = st.container()
+        streamed: List[dict] = []
+        status.info("Retrieving knowledge base context and drafting cases...")
+        try:
+            for event, data in stream_events(
+                project_endpoint("/generate-test-cases/stream"), {"query": query, "top_k": top_k, "bypass_cache": bypass_cache}
+            ):
+                if event == "test_case":
+                    streamed.append(data)
+                    live_cases.markdown(f"- **{data['test_id']}** · {data['feature']} — {data['scenario']}")
+                    status.info(f"Drafting test cases... {len(streamed)} received")
+                elif event == "done" and data.get("context"):
+                    context = data["context"]
+                    st.caption(
+                        f"Prompt context: {context['tokens_after']} tokens "
+                        f"({context['tokens_saved']} saved by merging and de-duplicating chunks)"
+                    )
+                elif event == "error":
+                    raise RuntimeError(data.get("detail", "unknown error"))
+        except httpx.HTTPStatusError as exc:
+            status.error(f"Agent failed: {exc.response.text}")
+        except Exception as exc:  # noqa: BLE001
+            status.error(f"Unexpected error: {exc}")
+        else:
+            st.session_state.test_cases = streamed
+            status.success(f"Generated {len(streamed)} test cases.")
 
 st.markdown("<div class='divider'></div>", unsafe_allow_html=True)
 
@@ -187,13 +256,19 @@ if st.session_state.test_cases:
 
     options = [f"{case['test_id']} · {case['scenario']}" for case in st.session_state.test_cases]
     selected_label = st.selectbox("Select a test case to automate", options=options)
-    generate_script = st.button("Generate Selenium script", type="secondary")
+    script_col, batch_col = st.columns(2)
+    with script_col:
+        generate_script = st.button("Generate Selenium script", type="secondary")
+    with batch_col:
+        generate_all = st.button("Generate scripts for all test cases", type="secondary")
 
     if generate_script:
         selected_case = st.session_state.test_cases[options.index(selected_label)]
         with st.spinner("Assembling HTML context and crafting Selenium steps..."):
             try:
-                response = post_json("/generate-selenium-script", {"test_case": selected_case})
+                response = post_json(
+                    project_endpoint("/generate-selenium-script"), {"test_case": selected_case, "bypass_cache": bypass_cache}
+                )
             except httpx.HTTPStatusError as exc:
                 st.error(f"Script generation failed: {exc.response.text}")
             except Exception as exc:  # noqa: BLE001
@@ -202,5 +277,33 @@ if st.session_state.test_cases:
                 st.success("Selenium script ready.")
                 st.code(response.get("script", ""), language="python")
                 st.caption(f"Grounded in: {', '.join(response.get('grounded_in', []))}")
+
+    if generate_all:
+        cases = st.session_state.test_cases
+        status = st.empty()
+        progress_bar = st.progress(0.0)
+        completed = 0
+        status.info(f"Generating {len(cases)} Selenium scripts...")
+        try:
+            for event, data in stream_events(
+                project_endpoint("/generate-selenium-scripts"), {"test_cases": cases, "bypass_cache": bypass_cache}
+            ):
+                if event == "script":
+                    completed += 1
+                    progress_bar.progress(completed / len(cases))
+                    with st.expander(f"{data['test_id']} · Selenium script"):
+                        if data.get("error"):
+                            st.error(data["error"])
+                        else:
+                            st.code(data.get("script", ""), language="python")
+                            st.caption(f"Grounded in: {', '.join(data.get('grounded_in', []))}")
+                elif event == "done":
+                    status.success(f"{data['succeeded']} scripts ready, {data['failed']} failed.")
+                elif event == "error":
+                    raise RuntimeError(data.get("detail", "unknown error"))
+        except httpx.HTTPStatusError as exc:
+            status.error(f"Script generation failed: {exc.response.text}")
+        except Exception as exc:  # noqa: BLE001
+            status.error(f"Unexpected error: {exc}")
 else:
     st.info("Generate test cases to unlock Selenium automation.")